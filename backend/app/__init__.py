@@ -18,6 +18,9 @@ from .routes.test_ui import test_ui_bp
 from .routes.ai import ai_bp
 from .routes.db_management import db_management_bp
 from .routes.students import students_bp
+from .routes.metrics import metrics_bp
+from .routes.upload_sessions import upload_sessions_bp
+from .services.upload_jobs_service import start_job_recovery
 
 
 def create_app() -> Flask:
@@ -53,6 +56,11 @@ def create_app() -> Flask:
     app.register_blueprint(ai_bp, url_prefix="/api")
     app.register_blueprint(db_management_bp, url_prefix="/api")
     app.register_blueprint(students_bp, url_prefix="/api")
+    app.register_blueprint(metrics_bp, url_prefix="/api")
+    app.register_blueprint(upload_sessions_bp, url_prefix="/api")
+
+    # Fail upload jobs left queued/running by a worker that died
+    start_job_recovery(app)
 
     return app
 
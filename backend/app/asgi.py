@@ -0,0 +1,93 @@
+"""
+ASGI entry point.
+
+    uvicorn app.asgi:app --host 0.0.0.0 --port 8080 --workers 2
+    gunicorn app.asgi:app -k uvicorn.workers.UvicornWorker --workers 2
+
+POST /api/ai and POST /api/students/qna run natively on the event loop with
+the async Gemini client, so hundreds of requests can wait on the model without
+a thread each. Every other request is passed to the Flask app, which runs on a
+pool of ASGI_WSGI_THREADS threads per worker.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+from typing import Dict, Optional
+
+from a2wsgi import WSGIMiddleware
+from flask import Flask
+
+from . import create_app
+from .routes.ai_async import ai_route, students_qna_route
+from .services.ai_service_async import async_client_available
+from .utils.asgi import AsgiRequest, cors_headers, read_body, send_event_stream, send_json
+
+
+logger = logging.getLogger(__name__)
+
+# Threads per worker for the routes still served by Flask
+ASGI_WSGI_THREADS = int(os.getenv("ASGI_WSGI_THREADS", "8"))
+
+NATIVE_ROUTES = {
+    ("POST", "/api/ai"): ai_route,
+    ("POST", "/api/students/qna"): students_qna_route,
+}
+
+
+class AsgiApp:
+    """Serves NATIVE_ROUTES with their async handlers and everything else through Flask."""
+
+    def __init__(self, flask_app: Flask, routes: Optional[Dict] = None):
+        self.flask_app = flask_app
+        self.routes = NATIVE_ROUTES if routes is None else routes
+        self.wsgi = WSGIMiddleware(flask_app, workers=ASGI_WSGI_THREADS)
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        handler = self.routes.get((scope.get("method"), scope.get("path"))) if scope["type"] == "http" else None
+        if handler is None:
+            await self.wsgi(scope, receive, send)
+            return
+
+        body = await read_body(receive, self.flask_app.config["MAX_CONTENT_LENGTH"])
+        request = AsgiRequest(scope, body or b"")
+        headers = cors_headers(request)
+        # Handlers use the Mongo helpers and flask-jwt-extended, which need an app context
+        with self.flask_app.app_context():
+            if body is None:
+                payload, status = {"error": "Request body too large"}, 413
+            else:
+                try:
+                    payload, status = await handler(request)
+                except Exception as e:
+                    logger.error(f"Unhandled error in {request.method} {request.path}: {str(e)}", exc_info=True)
+                    payload, status = {"error": "Internal server error"}, 500
+            if isinstance(payload, dict):
+                await send_json(send, payload, status, headers)
+            else:
+                await send_event_stream(send, payload, headers)
+
+    async def _lifespan(self, receive, send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+def create_asgi_app(flask_app: Optional[Flask] = None) -> AsgiApp:
+    flask_app = flask_app or create_app()
+    if not async_client_available():
+        # google-generativeai has no client.aio; keep serving the AI routes through Flask
+        logger.warning("google-genai is not installed; AI routes are served by the Flask app")
+        return AsgiApp(flask_app, routes={})
+    return AsgiApp(flask_app)
+
+
+app = create_asgi_app()
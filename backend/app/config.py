@@ -7,6 +7,16 @@ class Config:
     SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret-key")
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024
 
+    # Chunked upload sessions: each PUT is bounded by MAX_CONTENT_LENGTH, the whole file by this
+    UPLOAD_SESSION_MAX_BYTES = int(os.getenv("UPLOAD_SESSION_MAX_BYTES", str(512 * 1024 * 1024)))
+
+    # Bulk teacher upload jobs: files per batch, and total bytes once zip entries are read
+    BULK_UPLOAD_MAX_FILES = int(os.getenv("BULK_UPLOAD_MAX_FILES", "500"))
+    BULK_UPLOAD_MAX_UNCOMPRESSED_BYTES = int(os.getenv("BULK_UPLOAD_MAX_UNCOMPRESSED_BYTES", str(256 * 1024 * 1024)))
+
+    # POST /api/ai/batch
+    AI_BATCH_MAX_ITEMS = int(os.getenv("AI_BATCH_MAX_ITEMS", "50"))
+
     # JWT
     JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", SECRET_KEY)
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=int(os.getenv("JWT_EXPIRES_HOURS", "12")))
@@ -2,11 +2,13 @@ from __future__ import annotations
 
 import uuid
 import logging
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, current_app, jsonify, request
 from functools import wraps
 from time import time
+from typing import Dict, Optional, Tuple
 
-from ..services.ai_service import GeminiService
+from ..services.ai_service import get_gemini_service
+from ..utils.sse import sse_response, wants_event_stream
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -15,15 +17,64 @@ ai_bp = Blueprint("ai", __name__)
 
 _ALLOWED_TYPES = {"vision", "hearing", "speech", "dyslexie", "dyslexia"}
 
-# Initialize service as a singleton
-_service_instance = None
-
 def get_service():
-    """Get or create the GeminiService singleton instance."""
-    global _service_instance
-    if _service_instance is None:
-        _service_instance = GeminiService()
-    return _service_instance
+    """Get the shared GeminiService instance."""
+    return get_gemini_service()
+
+
+def parse_ai_request(data: Dict) -> Tuple[Dict, Optional[Dict]]:
+    """
+    Validate a POST /api/ai body. Returns (fields, None) with mode, studentType
+    and the text/notes/question for the mode, or ({}, error body) for a 400.
+    Shared with the ASGI handler in ai_async.
+    """
+    mode = (data.get("mode") or "").strip().lower()
+    student_type = (data.get("studentType") or data.get("student_type") or "").strip().lower()
+
+    # Validate mode
+    if mode not in {"notes", "qna"}:
+        return {}, {
+            "error": "Invalid 'mode'. Must be 'notes' or 'qna'.",
+            "error_code": "INVALID_MODE",
+            "allowed_modes": ["notes", "qna"]
+        }
+
+    # Validate student type
+    if not student_type:
+        return {}, {
+            "error": "'studentType' is required",
+            "error_code": "MISSING_STUDENT_TYPE"
+        }
+
+    if student_type not in _ALLOWED_TYPES:
+        return {}, {
+            "error": "Invalid 'studentType'",
+            "error_code": "INVALID_STUDENT_TYPE",
+            "allowed_types": ["vision", "hearing", "speech", "dyslexie", "dyslexia"]
+        }
+
+    if mode == "notes":
+        text = (data.get("text") or "").strip()
+        if not text:
+            return {}, {
+                "error": "'text' is required for notes mode",
+                "error_code": "MISSING_TEXT"
+            }
+        return {"mode": mode, "student_type": student_type, "text": text}, None
+
+    notes = (data.get("notes") or "").strip()
+    question = (data.get("question") or "").strip()
+    if not notes:
+        return {}, {
+            "error": "'notes' is required for qna mode",
+            "error_code": "MISSING_NOTES"
+        }
+    if not question:
+        return {}, {
+            "error": "'question' is required for qna mode",
+            "error_code": "MISSING_QUESTION"
+        }
+    return {"mode": mode, "student_type": student_type, "notes": notes, "question": question}, None
 
 
 def track_request(f):
@@ -76,6 +127,9 @@ def ai_route():
           { "mode": "notes", "studentType": "...", "text": "..." }
       - For qna mode:
           { "mode": "qna", "studentType": "...", "notes": "...", "question": "..." }
+      - Optional "stream": true (or ?stream=1, or Accept: text/event-stream) to
+        receive server-sent events: "delta" events with text as it is generated,
+        then one "result" event with the full response (or an "error" event)
     
     Returns:
       - 200: Success with adapted content
@@ -92,60 +146,26 @@ def ai_route():
             "error_code": "INVALID_JSON"
         }), 400
 
-    mode = (data.get("mode") or "").strip().lower()
-    student_type = (data.get("studentType") or data.get("student_type") or "").strip().lower()
-
-    # Validate mode
-    if mode not in {"notes", "qna"}:
-        return jsonify({
-            "error": "Invalid 'mode'. Must be 'notes' or 'qna'.",
-            "error_code": "INVALID_MODE",
-            "allowed_modes": ["notes", "qna"]
-        }), 400
-
-    # Validate student type
-    if not student_type:
-        return jsonify({
-            "error": "'studentType' is required",
-            "error_code": "MISSING_STUDENT_TYPE"
-        }), 400
-
-    if student_type not in _ALLOWED_TYPES:
-        return jsonify({
-            "error": "Invalid 'studentType'",
-            "error_code": "INVALID_STUDENT_TYPE",
-            "allowed_types": ["vision", "hearing", "speech", "dyslexie", "dyslexia"]
-        }), 400
+    fields, error = parse_ai_request(data)
+    if error:
+        return jsonify(error), 400
+    student_type = fields["student_type"]
 
     service = get_service()
+    stream = wants_event_stream(data)
 
     try:
-        if mode == "notes":
-            text = (data.get("text") or "").strip()
-            if not text:
-                return jsonify({
-                    "error": "'text' is required for notes mode",
-                    "error_code": "MISSING_TEXT"
-                }), 400
-            
+        if fields["mode"] == "notes":
+            text = fields["text"]
+            if stream:
+                return sse_response(service.stream_adaptive_notes(text=text, student_type=student_type))
             result = service.generate_adaptive_notes(text=text, student_type=student_type)
             return jsonify(result), 200
 
         # mode == "qna"
-        notes = (data.get("notes") or "").strip()
-        question = (data.get("question") or "").strip()
-        
-        if not notes:
-            return jsonify({
-                "error": "'notes' is required for qna mode",
-                "error_code": "MISSING_NOTES"
-            }), 400
-        if not question:
-            return jsonify({
-                "error": "'question' is required for qna mode",
-                "error_code": "MISSING_QUESTION"
-            }), 400
-
+        notes, question = fields["notes"], fields["question"]
+        if stream:
+            return sse_response(service.stream_adaptive_qna(notes=notes, student_type=student_type, question=question))
         result = service.generate_adaptive_qna(
             notes=notes, 
             student_type=student_type, 
@@ -175,6 +195,69 @@ def ai_route():
         }), 500
 
 
+def _batch_item(raw) -> dict:
+    """Normalize one /api/ai/batch item to the field names GeminiService expects."""
+    if not isinstance(raw, dict):
+        return {"mode": None}
+    return {
+        "mode": str(raw.get("mode") or "").strip().lower(),
+        "studentType": str(raw.get("studentType") or raw.get("student_type") or "").strip().lower(),
+        "text": str(raw.get("text") or ""),
+        "notes": str(raw.get("notes") or ""),
+        "question": str(raw.get("question") or ""),
+    }
+
+
+@ai_bp.post("/ai/batch")  # POST /api/ai/batch
+@track_request
+def ai_batch_route():
+    """
+    Generate several notes/qna items in one request.
+
+    Body (JSON):
+      { "items": [ { "mode": "notes", "studentType": "...", "text": "..." },
+                   { "mode": "qna", "studentType": "...", "notes": "...", "question": "..." } ] }
+      Items may carry an "id", which is echoed back.
+
+    Returns:
+      - 200: { "results": [...], "summary": {...} } with one result per item, in input
+        order: { "index", "id", "status": "ok", "cached", "result" } or
+        { "index", "id", "status": "error", "error", "error_code" }
+      - 400: Missing, empty or oversized item list
+    """
+    data = request.get_json(silent=True) or {}
+    items = data.get("items")
+    if not isinstance(items, list) or not items:
+        return jsonify({
+            "error": "'items' must be a non-empty list",
+            "error_code": "MISSING_ITEMS"
+        }), 400
+    max_items = current_app.config["AI_BATCH_MAX_ITEMS"]
+    if len(items) > max_items:
+        return jsonify({
+            "error": f"Too many items (max {max_items})",
+            "error_code": "TOO_MANY_ITEMS"
+        }), 400
+
+    outcomes = get_service().generate_batch([_batch_item(raw) for raw in items])
+    results = []
+    for index, (raw, outcome) in enumerate(zip(items, outcomes)):
+        entry = {"index": index, "id": raw.get("id") if isinstance(raw, dict) else None}
+        entry.update(outcome)
+        results.append(entry)
+
+    succeeded = sum(1 for r in results if r["status"] == "ok")
+    return jsonify({
+        "results": results,
+        "summary": {
+            "total": len(results),
+            "succeeded": succeeded,
+            "failed": len(results) - succeeded,
+            "cached": sum(1 for r in results if r.get("cached")),
+        },
+    }), 200
+
+
 @ai_bp.get("/ai/health")  # GET /api/ai/health
 def health_check():
     """
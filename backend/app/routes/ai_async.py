@@ -0,0 +1,118 @@
+"""
+Async versions of POST /api/ai and POST /api/students/qna for the ASGI entry
+point (app/asgi.py). Request validation and error bodies are shared with the
+Flask routes in ai.py and students.py.
+
+Each handler returns (payload, status): a dict is sent as JSON, an async
+iterator of {"event", "data"} dicts as server-sent events.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import uuid
+from time import time
+from typing import Any, Tuple
+
+from ..services.ai_service_async import get_async_gemini_service
+from ..services.notes_service import get_note
+from ..utils.asgi import AsgiRequest, authenticate
+from ..utils.sse import stream_requested
+from .ai import parse_ai_request
+from .students import _qna_source, parse_qna_request
+
+
+logger = logging.getLogger(__name__)
+
+
+def _service_error(e: Exception) -> Tuple[dict, int]:
+    """Map a service exception to the error responses of the Flask /api/ai route."""
+    if isinstance(e, ValueError):
+        logger.warning(f"Validation error: {str(e)}")
+        return {"error": str(e), "error_code": "VALIDATION_ERROR"}, 400
+    if isinstance(e, RuntimeError):
+        logger.error(f"Service error: {str(e)}")
+        return {"error": str(e), "error_code": "SERVICE_UNAVAILABLE"}, 503
+    logger.error(f"Unexpected error: {str(e)}", exc_info=True)
+    return {"error": f"Server error: {str(e)}", "error_code": "INTERNAL_ERROR"}, 500
+
+
+def _wants_stream(request: AsgiRequest, data: dict) -> bool:
+    return stream_requested(data.get("stream", request.args.get("stream")), request.headers.get("accept"))
+
+
+async def ai_route(request: AsgiRequest) -> Tuple[Any, int]:
+    """POST /api/ai; see routes.ai.ai_route."""
+    request_id = str(uuid.uuid4())[:8]
+    start_time = time()
+    logger.info(f"[{request_id}] Processing {request.method} {request.path} (async)")
+    try:
+        data = request.json()
+    except ValueError as e:
+        logger.warning(f"Invalid JSON in request: {str(e)}")
+        return {"error": "Invalid JSON in request body", "error_code": "INVALID_JSON"}, 400
+
+    fields, error = parse_ai_request(data)
+    if error:
+        return error, 400
+    student_type = fields["student_type"]
+    service = get_async_gemini_service()
+    stream = _wants_stream(request, data)
+
+    try:
+        if fields["mode"] == "notes":
+            if stream:
+                return await service.stream_adaptive_notes(text=fields["text"], student_type=student_type), 200
+            result = await service.generate_adaptive_notes(text=fields["text"], student_type=student_type)
+        elif stream:
+            return await service.stream_adaptive_qna(
+                notes=fields["notes"], student_type=student_type, question=fields["question"]
+            ), 200
+        else:
+            result = await service.generate_adaptive_qna(
+                notes=fields["notes"], student_type=student_type, question=fields["question"]
+            )
+    except Exception as e:
+        return _service_error(e)
+
+    logger.info(f"[{request_id}] Completed in {time() - start_time:.2f}s with status 200")
+    return result, 200
+
+
+async def students_qna_route(request: AsgiRequest) -> Tuple[Any, int]:
+    """POST /api/students/qna; see routes.students.generate_qna."""
+    claims, auth_error = authenticate(request)
+    if auth_error:
+        return auth_error
+    if claims.get("role") not in {"student", "teacher"}:
+        return {"error": "Forbidden"}, 403
+
+    try:
+        data = request.json()
+    except ValueError:
+        return {"error": "Invalid JSON in request body"}, 400
+    fields, error = parse_qna_request(data, claims)
+    if error:
+        return {"error": error}, 400
+
+    note = await asyncio.to_thread(
+        get_note,
+        school=fields["school"], class_name=fields["class_name"], subject=fields["subject"], topic=fields["topic"],
+        include_index=True,
+    )
+    if not note:
+        return {"error": "Note not found"}, 404
+    content, index, notes_hash = _qna_source(note, fields["student_type"])
+
+    service = get_async_gemini_service()
+    kwargs = dict(
+        notes=str(content or ""), student_type=fields["student_type"], question=fields["question"],
+        index=index, notes_hash=notes_hash,
+    )
+    try:
+        if _wants_stream(request, data):
+            return await service.stream_adaptive_qna(**kwargs), 200
+        return await service.generate_adaptive_qna(**kwargs), 200
+    except Exception as e:
+        return _service_error(e)
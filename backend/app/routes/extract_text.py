@@ -1,6 +1,3 @@
-from pathlib import Path
-from tempfile import TemporaryDirectory
-
 from flask import Blueprint, jsonify, request
 
 from ..services.extract_text_service import get_extractor
@@ -17,16 +14,13 @@ def extract_text_route():
     if not file or file.filename == "":
         return jsonify({"error": "No selected file"}), 400
 
-    with TemporaryDirectory() as tmpdir:
-        tmp_path = Path(tmpdir) / file.filename
-        file.save(str(tmp_path))
-
-        extractor = get_extractor()
-        results = extractor.extract(tmp_path)
-        text = next(iter(results.values()), "")
-        return jsonify({
-            "filename": file.filename,
-            "text": text,
-        })
+    # Parse straight from the upload stream; no temporary file on disk
+    extractor = get_extractor()
+    results = extractor.extract_bytes(file.stream, file.filename)
+    text = next(iter(results.values()), "")
+    return jsonify({
+        "filename": file.filename,
+        "text": text,
+    })
 
 
@@ -0,0 +1,27 @@
+from __future__ import annotations
+
+from datetime import datetime
+
+from flask import Blueprint, jsonify
+from flask_jwt_extended import jwt_required
+
+from ..utils.admin import admin_required
+from ..utils.metrics import stage_latency_snapshot
+
+
+metrics_bp = Blueprint("metrics", __name__)
+
+
+@metrics_bp.get("/admin/metrics")  # GET /api/admin/metrics
+@jwt_required()
+@admin_required
+def admin_metrics():
+    """
+    Per-stage latency histograms for the teacher upload pipeline.
+
+    Counters are kept per backend process and reset on restart.
+    """
+    return jsonify({
+        "uploadStages": stage_latency_snapshot(),
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+    }), 200
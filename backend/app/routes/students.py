@@ -1,14 +1,19 @@
 from __future__ import annotations
 
+import hashlib
+from typing import Dict, Optional, Tuple
+
 from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt
 
-from ..services.notes_service import list_topics, get_note
-from ..services.ai_service import GeminiService
+from ..services.notes_service import content_hash, list_topics, get_note
+from ..services.ai_service import ADAPTATION_GUIDELINES, _normalize_student_type, get_gemini_service
 from ..services.stt_service import get_stt_client
 from ..services.tts_service import synthesize_text_to_mp3
 from ..services.catbox_service import upload_file_to_catbox
 from ..utils.audio import ensure_wav_pcm16_mono_16k
+from ..utils.idempotency import idempotent
+from ..utils.sse import sse_response, wants_event_stream
 import tempfile
 from pathlib import Path
 import os
@@ -17,6 +22,63 @@ import os
 students_bp = Blueprint("students", __name__)
 
 
+def _tailored_content(note: Dict, student_type: str) -> Tuple[Optional[str], Optional[str]]:
+    """Return (content, tips) for a student type, falling back to the base text."""
+    st = _normalize_student_type(student_type)
+    if st not in ADAPTATION_GUIDELINES:
+        return note.get("text"), None
+    variants = note.get("variants") or {}
+    tips = (variants.get("meta") or {}).get(f"{st}Tips")
+    return (variants.get(st) or note.get("text")), tips
+
+
+def _tailored_hash(note: Dict, student_type: str) -> Optional[str]:
+    """
+    Stored content hash of the text _tailored_content returns; None for notes
+    saved before variant hashes were stored.
+    """
+    st = _normalize_student_type(student_type)
+    if st in ADAPTATION_GUIDELINES and (note.get("variants") or {}).get(st):
+        return (note.get("variantHashes") or {}).get(st)
+    return note.get("contentHash")
+
+
+def _qna_source(note: Dict, student_type: str) -> Tuple[Optional[str], Optional[Dict], Optional[str]]:
+    """
+    Return (notes, index, notes_hash) to answer questions from. Long notes carry
+    a qnaIndex over their base text, so the question is answered from its
+    best-matching passages; short notes use the content tailored for the
+    student type.
+    """
+    index = note.get("qnaIndex")
+    if index:
+        return note.get("text"), index, note.get("contentHash")
+    content, _ = _tailored_content(note, student_type)
+    return content, None, _tailored_hash(note, student_type)
+
+
+def parse_qna_request(data: Dict, claims: Dict) -> Tuple[Dict, Optional[str]]:
+    """
+    Validate a POST /api/students/qna body. Returns (fields, None) or ({}, error
+    message for a 400). Shared with the ASGI handler in ai_async.
+    """
+    fields = {
+        "school": (data.get("school") or claims.get("school") or "").strip(),
+        "class_name": (data.get("class") or data.get("className") or "").strip(),
+        "subject": (data.get("subject") or "").strip(),
+        "topic": (data.get("topic") or "").strip(),
+        "student_type": (data.get("studentType") or data.get("student_type") or "").strip().lower(),
+        "question": (data.get("question") or "").strip(),
+    }
+    if not fields["school"] or not fields["class_name"] or not fields["subject"] or not fields["topic"]:
+        return {}, "school, class, subject, topic are required"
+    if not fields["student_type"]:
+        return {}, "studentType is required"
+    if not fields["question"]:
+        return {}, "question is required"
+    return fields, None
+
+
 @students_bp.get("/students/topics")  # GET /api/students/topics?school=...&class=...&subject=...
 @jwt_required()
 def get_topics():
@@ -66,15 +128,16 @@ def get_tailored_note():
     if not note:
         return jsonify({"error": "Not found"}), 404
 
-    # Tailor content
-    content = note.get("text")
-    variants = note.get("variants") or {}
-    if student_type == "dyslexie" and variants.get("dyslexie"):
-        content = variants.get("dyslexie")
-    audio_url = variants.get("audioUrl")
-    tips = (variants.get("meta") or {}).get("dyslexieTips")
+    # Tailor content: every student type has a variant precomputed at upload time
+    content, tips = _tailored_content(note, student_type)
+    audio_url = (note.get("variants") or {}).get("audioUrl")
+    # Notes are immutable once saved, so the stored hash identifies the content
+    text_hash = _tailored_hash(note, student_type) or content_hash(content or "")
+    etag = hashlib.sha1(
+        f"{note.get('_id')}:{note.get('updatedAt')}:{student_type}:{text_hash}".encode("utf-8")
+    ).hexdigest()
 
-    return jsonify({
+    response = jsonify({
         "note": {
             "school": note.get("school"),
             "class": note.get("class"),
@@ -87,7 +150,11 @@ def get_tailored_note():
             "_id": note.get("_id"),
             "updatedAt": note.get("updatedAt"),
         }
-    }), 200
+    })
+    response.set_etag(etag)
+    # Clients may keep the note but must revalidate (If-None-Match -> 304)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response.make_conditional(request)
 
 
 @students_bp.post("/students/qna")  # POST /api/students/qna
@@ -99,37 +166,34 @@ def generate_qna():
         return jsonify({"error": "Forbidden"}), 403
 
     data = request.get_json(force=True) or {}
-    school = (data.get("school") or claims.get("school") or "").strip()
-    class_name = (data.get("class") or data.get("className") or "").strip()
-    subject = (data.get("subject") or "").strip()
-    topic = (data.get("topic") or "").strip()
-    student_type = (data.get("studentType") or data.get("student_type") or "").strip().lower()
-    question = (data.get("question") or "").strip()
-
-    if not school or not class_name or not subject or not topic:
-        return jsonify({"error": "school, class, subject, topic are required"}), 400
-    if not student_type:
-        return jsonify({"error": "studentType is required"}), 400
-    if not question:
-        return jsonify({"error": "question is required"}), 400
-
-    note = get_note(school=school, class_name=class_name, subject=subject, topic=topic)
+    fields, error = parse_qna_request(data, claims)
+    if error:
+        return jsonify({"error": error}), 400
+    student_type, question = fields["student_type"], fields["question"]
+
+    note = get_note(
+        school=fields["school"], class_name=fields["class_name"], subject=fields["subject"], topic=fields["topic"],
+        include_index=True,
+    )
     if not note:
         return jsonify({"error": "Note not found"}), 404
 
-    # choose content per student type
-    content = note.get("text")
-    variants = note.get("variants") or {}
-    if student_type == "dyslexie" and variants.get("dyslexie"):
-        content = variants.get("dyslexie")
+    content, index, notes_hash = _qna_source(note, student_type)
 
-    service = GeminiService()
-    result = service.generate_adaptive_qna(notes=str(content or ""), student_type=student_type, question=question)
+    service = get_gemini_service()
+    if wants_event_stream(data):
+        return sse_response(service.stream_adaptive_qna(
+            notes=str(content or ""), student_type=student_type, question=question, index=index, notes_hash=notes_hash
+        ))
+    result = service.generate_adaptive_qna(
+        notes=str(content or ""), student_type=student_type, question=question, index=index, notes_hash=notes_hash
+    )
     return jsonify(result), 200
 
 
 @students_bp.post("/students/qna-audio")  # POST /api/students/qna-audio (multipart)
 @jwt_required()
+@idempotent
 def qna_audio():
     claims = get_jwt() or {}
     role = claims.get("role")
@@ -152,13 +216,10 @@ def qna_audio():
         return jsonify({"error": "audio is required"}), 400
 
     # Fetch note content
-    note = get_note(school=school, class_name=class_name, subject=subject, topic=topic)
+    note = get_note(school=school, class_name=class_name, subject=subject, topic=topic, include_index=True)
     if not note:
         return jsonify({"error": "Note not found"}), 404
-    base_content = note.get("text")
-    variants = note.get("variants") or {}
-    if student_type == "dyslexie" and variants.get("dyslexie"):
-        base_content = variants.get("dyslexie")
+    base_content, index, notes_hash = _qna_source(note, student_type)
 
     # STT the question
     with tempfile.TemporaryDirectory() as tmpdir:
@@ -171,8 +232,11 @@ def qna_audio():
             return jsonify({"error": question_text}), 400
 
     # AI QnA
-    service = GeminiService()
-    qna = service.generate_adaptive_qna(notes=str(base_content or ""), student_type=student_type, question=question_text)
+    service = get_gemini_service()
+    qna = service.generate_adaptive_qna(
+        notes=str(base_content or ""), student_type=student_type, question=question_text, index=index,
+        notes_hash=notes_hash,
+    )
     answer_text = qna.get("answer") or ""
 
     # TTS the answer → upload to Catbox
@@ -1,28 +1,44 @@
 from __future__ import annotations
 
+import json
+import shutil
 from pathlib import Path
 from tempfile import TemporaryDirectory
+from typing import Dict, List, Tuple
 
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, current_app, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
+from werkzeug.utils import secure_filename
 
-from ..services.extract_text_service import get_extractor
-from ..services.stt_service import get_stt_client
-from ..utils.audio import ensure_wav_pcm16_mono_16k
-from ..services.notes_service import save_note
-from ..services.ai_service import GeminiService
-from ..services.tts_service import synthesize_text_to_mp3
-from ..services.catbox_service import upload_file_to_catbox
-import os
-import tempfile
+from ..services.upload_pipeline import (
+    TextTooLong,
+    assign_topics,
+    check_text_length,
+    list_archive_documents,
+    process_upload,
+)
+from ..services.upload_jobs_service import (
+    create_job,
+    get_job,
+    new_job_id,
+    staging_dir_for,
+    submit_job,
+)
+from ..utils.idempotency import idempotent
 from pymongo.errors import PyMongoError
 
 
 teacher_upload_bp = Blueprint("teacher_upload", __name__)
 
 
+def _wants_async() -> bool:
+    flag = (request.args.get("async") or request.form.get("async") or "").strip().lower()
+    return flag in {"1", "true", "yes"}
+
+
 @teacher_upload_bp.post("/teacher/upload")
 @jwt_required()
+@idempotent
 def teacher_upload():
     identity = get_jwt_identity()  # now email string
     claims = get_jwt() or {}
@@ -31,7 +47,7 @@ def teacher_upload():
         return jsonify({"error": "Forbidden"}), 403
 
     # Required metadata
-    school = (request.form.get("school") or identity.get("school") or "").strip()
+    school = (request.form.get("school") or claims.get("school") or "").strip()
     class_name = (request.form.get("class") or request.form.get("className") or "").strip()
     subject = (request.form.get("subject") or "").strip()
     topic = (request.form.get("topic") or request.form.get("name") or "").strip()
@@ -60,116 +76,235 @@ def teacher_upload():
     if provided_count > 1:
         return jsonify({"error": "Provide only one of 'file', 'audio', or 'text'"}), 400
 
-    text: str = ""
-    source_type: str
-    original_filename: str | None = None
+    # Rejected before anything is staged or queued
+    try:
+        check_text_length(direct_text)
+    except TextTooLong as e:
+        return jsonify({"error": str(e)}), 413
 
-    # Resolve base text depending on source
+    upload = file or audio
     if direct_text:
-        text = direct_text
         source_type = "text"
-        original_filename = None
+    elif file:
+        source_type = "document"
     else:
-        with TemporaryDirectory() as tmpdir:
-            if file:
-                original_filename = file.filename
-                tmp_path = Path(tmpdir) / file.filename
-                file.save(str(tmp_path))
-                extractor = get_extractor()
-                results = extractor.extract(tmp_path)
-                text = next(iter(results.values()), "")
-                source_type = "document"
-            else:
-                original_filename = audio.filename if audio else None
-                tmp_path = Path(tmpdir) / (audio.filename if audio else "audio")
-                audio.save(str(tmp_path))
-                
-                # Convert audio to Azure-compatible format
-                path_to_use, is_temp = ensure_wav_pcm16_mono_16k(tmp_path)
-                
-                try:
-                    stt_client = get_stt_client(language=(request.form.get("language") or "en-US"))
-                    success, result = stt_client.transcribe(str(path_to_use))
-                    if not success:
-                        return jsonify({"error": f"STT Error: {result}"}), 400
-                    text = result
-                    source_type = "audio"
-                except (RuntimeError, ValueError, OSError) as e:
-                    return jsonify({"error": f"STT Error: {str(e)}"}), 400
-                finally:
-                    # Clean up temporary converted file if it was created
-                    if is_temp and path_to_use.exists():
-                        try:
-                            path_to_use.unlink()
-                        except OSError:
-                            pass
-
-    # Post-processing: generate dyslexie variant, synthesize TTS, and upload MP3 to Catbox
-    variants = {}
-
-    # 1) Dyslexie-adapted text via AI
+        source_type = "audio"
+
+    params = {
+        "school": school,
+        "class_name": class_name,
+        "subject": subject,
+        "topic": topic,
+        "uploaded_by": identity,
+        "source_type": source_type,
+        "text": direct_text or None,
+        "original_filename": upload.filename if upload else None,
+        "language": request.form.get("language") if source_type == "audio" else None,
+    }
+
+    if _wants_async():
+        # Persist the input, queue the pipeline and return immediately
+        job_id = new_job_id()
+        if upload:
+            filename = secure_filename(upload.filename or "") or ("audio" if audio else "upload")
+            staged_path = staging_dir_for(job_id) / filename
+            upload.save(str(staged_path))
+            params["path"] = staged_path
+        try:
+            create_job(job_id=job_id, uploaded_by=identity, params=params)
+        except PyMongoError as e:
+            return jsonify({"error": f"Database error: {str(e)}"}), 500
+        submit_job(current_app._get_current_object(), job_id, params)
+        return jsonify({
+            "jobId": job_id,
+            "status": "queued",
+            "statusUrl": f"/api/teacher/upload/{job_id}",
+        }), 202
+
     try:
-        ai_service = GeminiService()
-        ai_result = ai_service.generate_adaptive_notes(text=text, student_type="dyslexie")
-        variants["dyslexie"] = ai_result.get("content") or ai_result.get("content", "")
-        # Store AI tips optionally
-        tips = ai_result.get("tips")
-        if tips:
-            variants.setdefault("meta", {})
-            variants["meta"]["dyslexieTips"] = tips
-    except RuntimeError as e:
-        # Non-fatal: continue without dyslexie variant
-        variants["dyslexieError"] = str(e)
+        if file:
+            # Documents are parsed from memory; only audio needs a file for ffmpeg/STT
+            params["data"] = file.read()
+            note = process_upload(**params)
+        else:
+            with TemporaryDirectory() as tmpdir:
+                if audio:
+                    tmp_path = Path(tmpdir) / (audio.filename or "audio")
+                    audio.save(str(tmp_path))
+                    params["path"] = tmp_path
+                note = process_upload(**params)
+    except TextTooLong as e:
+        return jsonify({"error": str(e)}), 413
     except ValueError as e:
-        variants["dyslexieError"] = str(e)
-
-    # 2) TTS: synthesize audio MP3, then upload to Catbox
-    audio_url = None
-    output_dir = os.getenv("OUTPUT_DIR", "./audio_output")
-    Path(output_dir).mkdir(parents=True, exist_ok=True)
-    tmp_mp3 = tempfile.NamedTemporaryFile(suffix='.mp3', delete=False, dir=output_dir, prefix='upload_tts_')
-    tmp_mp3_path = Path(tmp_mp3.name)
-    tmp_mp3.close()
+        return jsonify({"error": str(e)}), 400
+    except PyMongoError as e:
+        return jsonify({"error": f"Database error: {str(e)}"}), 500
+
+    return jsonify({
+        "note": note,
+        "skippedStages": (note.get("meta") or {}).get("skippedStages", []),
+    }), 201
+
+
+def _topic_map(raw) -> Dict[str, str]:
+    """Parse the optional `topics` JSON object (filename -> topic). Raises ValueError."""
+    if isinstance(raw, dict):
+        return raw
     try:
-        ok, msg = synthesize_text_to_mp3(text=text, out_path=tmp_mp3_path, voice=None)
-        if ok and tmp_mp3_path.exists() and tmp_mp3_path.stat().st_size > 0:
-            up_ok, up_msg = upload_file_to_catbox(tmp_mp3_path)
-            if up_ok:
-                audio_url = up_msg
-            else:
-                variants["audioUploadError"] = up_msg
-        else:
-            variants["audioSynthesisError"] = msg
-    except OSError as e:
-        variants["audioError"] = str(e)
-    finally:
-        if tmp_mp3_path.exists():
-            try:
-                tmp_mp3_path.unlink()
-            except OSError:
-                # Best-effort cleanup
-                pass
-
-    if audio_url:
-        variants["audioUrl"] = audio_url
+        topic_map = json.loads(raw or "{}")
+    except json.JSONDecodeError as e:
+        raise ValueError(f"'topics' must be a JSON object: {e}") from e
+    if not isinstance(topic_map, dict):
+        raise ValueError("'topics' must be a JSON object mapping filename to topic")
+    return topic_map
+
+
+def _stage_bulk_items(job_id: str) -> Tuple[List[Tuple[str, str]], Path, bool]:
+    """
+    Persist the documents of a bulk request under the job's staging directory.
+
+    Files come from a zip `archive` or repeated `files` fields. Topics come from a
+    `topics` JSON object keyed by filename, else repeated `topic` fields aligned
+    with `files`, else the file name without extension. Returns (items, path,
+    is_archive) for the bulk job; raises ValueError.
+    """
+    max_files = current_app.config["BULK_UPLOAD_MAX_FILES"]
+    max_bytes = current_app.config["BULK_UPLOAD_MAX_UNCOMPRESSED_BYTES"]
+    topic_map = _topic_map(request.form.get("topics"))
+
+    archive = request.files.get("archive")
+    if archive:
+        path = staging_dir_for(job_id) / "archive.zip"
+        archive.save(str(path))
+        names = list_archive_documents(path, max_files, max_bytes)
+        return assign_topics(names, topic_map), path, True
+
+    uploads = [f for f in request.files.getlist("files") if f and f.filename]
+    if not uploads:
+        raise ValueError("Provide a zip 'archive' or one or more 'files'")
+    if len(uploads) > max_files:
+        raise ValueError(f"Too many files (max {max_files})")
+    names = [f.filename for f in uploads]
+    if len(set(names)) != len(names):
+        raise ValueError("File names must be unique")
 
+    # Saved by index: original names may not be valid or unique file names on disk
+    path = staging_dir_for(job_id) / "files"
+    path.mkdir(exist_ok=True)
+    for index, upload in enumerate(uploads):
+        upload.save(str(path / str(index)))
+    return assign_topics(names, topic_map, request.form.getlist("topic")), path, False
+
+
+def queue_bulk_job(
+    *,
+    job_id: str,
+    identity: str,
+    school: str,
+    class_name: str,
+    subject: str,
+    items: List[Tuple[str, str]],
+    path: Path,
+    archive: bool,
+):
+    """Create and submit a bulk upload job; returns the 202 response (or a 500 on database errors)."""
+    params = {
+        "school": school,
+        "class_name": class_name,
+        "subject": subject,
+        "uploaded_by": identity,
+        "items": [[name, topic] for name, topic in items],
+        "path": path,
+        "archive": archive,
+    }
     try:
-        note = save_note(
-            school=school,
-            class_name=class_name,
-            subject=subject,
-            topic=topic,
-            text=text,
-            uploaded_by=identity,
-            source_type=source_type,
-            original_filename=original_filename,
-            extra_meta={"language": request.form.get("language")} if source_type == "audio" else None,
-            variants=variants or None,
-        )
+        create_job(job_id=job_id, uploaded_by=identity, params=params, kind="bulk")
     except PyMongoError as e:
+        shutil.rmtree(path.parent, ignore_errors=True)
         return jsonify({"error": f"Database error: {str(e)}"}), 500
+    # The job removes the staged files when it finishes
+    submit_job(current_app._get_current_object(), job_id, params, kind="bulk")
+    return jsonify({
+        "jobId": job_id,
+        "status": "queued",
+        "total": len(items),
+        "statusUrl": f"/api/teacher/upload/{job_id}",
+    }), 202
+
+
+@teacher_upload_bp.post("/teacher/upload/bulk")  # POST /api/teacher/upload/bulk (multipart)
+@jwt_required()
+@idempotent
+def teacher_upload_bulk():
+    """
+    Queue one note per document as a bulk job. Requests are capped by
+    MAX_CONTENT_LENGTH; larger archives go through an upload session with
+    kind "archive".
+    """
+    identity = get_jwt_identity()
+    claims = get_jwt() or {}
+    if claims.get("role") != "teacher":
+        return jsonify({"error": "Forbidden"}), 403
 
-    return jsonify({"note": note}), 201
+    school = (request.form.get("school") or claims.get("school") or "").strip()
+    class_name = (request.form.get("class") or request.form.get("className") or "").strip()
+    subject = (request.form.get("subject") or "").strip()
 
+    if not school:
+        return jsonify({"error": "school is required"}), 400
+    if not class_name:
+        return jsonify({"error": "class is required"}), 400
+    if not subject:
+        return jsonify({"error": "subject is required"}), 400
 
+    job_id = new_job_id()
+    try:
+        items, path, archive = _stage_bulk_items(job_id)
+    except ValueError as e:
+        shutil.rmtree(staging_dir_for(job_id), ignore_errors=True)
+        return jsonify({"error": str(e)}), 400
 
+    return queue_bulk_job(
+        job_id=job_id,
+        identity=identity,
+        school=school,
+        class_name=class_name,
+        subject=subject,
+        items=items,
+        path=path,
+        archive=archive,
+    )
+
+
+@teacher_upload_bp.get("/teacher/upload/<job_id>")  # GET /api/teacher/upload/<job_id>
+@jwt_required()
+def teacher_upload_status(job_id: str):
+    identity = get_jwt_identity()
+    claims = get_jwt() or {}
+    if claims.get("role") != "teacher":
+        return jsonify({"error": "Forbidden"}), 403
+
+    try:
+        job = get_job(job_id)
+    except PyMongoError as e:
+        return jsonify({"error": f"Database error: {str(e)}"}), 500
+    if not job or job.get("uploadedBy") != identity:
+        return jsonify({"error": "Not found"}), 404
+
+    view = {
+        "jobId": job.get("_id"),
+        "kind": job.get("kind", "upload"),
+        "status": job.get("status"),
+        "error": job.get("error"),
+        "createdAt": job.get("createdAt"),
+        "startedAt": job.get("startedAt"),
+        "finishedAt": job.get("finishedAt"),
+    }
+    if view["kind"] == "bulk":
+        view["progress"] = job.get("progress") or {}
+        view["items"] = job.get("items") or []
+    else:
+        view["stages"] = job.get("stages") or {}
+        view["note"] = job.get("note")
+        view["skippedStages"] = ((job.get("note") or {}).get("meta") or {}).get("skippedStages", [])
+    return jsonify(view), 200
@@ -7,12 +7,14 @@ import tempfile
 from flask import Blueprint, jsonify, request, send_file, Response
 
 from ..services.tts_service import synthesize_text_to_mp3
+from ..utils.idempotency import idempotent
 
 
 tts_bp = Blueprint("tts", __name__)
 
 
 @tts_bp.route("/tts", methods=["POST"])  # POST /api/tts
+@idempotent
 def tts_route():
     data = request.get_json(force=True) or {}
     text = (data.get("text") or "").strip()
@@ -0,0 +1,255 @@
+from __future__ import annotations
+
+from flask import Blueprint, current_app, jsonify, request
+from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
+from pymongo.errors import PyMongoError
+from werkzeug.utils import secure_filename
+
+from ..services.upload_pipeline import TextTooLong, assign_topics, list_archive_documents, process_upload
+from ..services.upload_jobs_service import create_job, new_job_id, submit_job
+from ..services.upload_session_service import (
+    OffsetMismatch,
+    append_chunk,
+    create_session,
+    discard_staging,
+    get_session,
+    mark_completed,
+    staged_path,
+)
+from .teacher_upload import _topic_map, queue_bulk_job
+
+
+upload_sessions_bp = Blueprint("upload_sessions", __name__)
+
+
+def _session_view(session: dict) -> dict:
+    return {
+        "sessionId": session.get("_id"),
+        "filename": session.get("filename"),
+        "kind": session.get("kind"),
+        "totalSize": session.get("totalSize"),
+        "receivedBytes": session.get("receivedBytes"),
+        "status": session.get("status"),
+    }
+
+
+def _owned_session(session_id: str):
+    """Return (session, None) for the calling teacher, or (None, error_response)."""
+    claims = get_jwt() or {}
+    if claims.get("role") != "teacher":
+        return None, (jsonify({"error": "Forbidden"}), 403)
+    try:
+        session = get_session(session_id)
+    except PyMongoError as e:
+        return None, (jsonify({"error": f"Database error: {str(e)}"}), 500)
+    if not session or session.get("uploadedBy") != get_jwt_identity():
+        return None, (jsonify({"error": "Not found"}), 404)
+    return session, None
+
+
+@upload_sessions_bp.post("/teacher/upload/sessions")  # POST /api/teacher/upload/sessions
+@jwt_required()
+def initiate_upload_session():
+    """
+    Start a chunked upload.
+
+    Body (JSON): filename, size (bytes), kind ("file" | "audio" | "archive"),
+    school, class, subject, topic, optional language. An "archive" is a zip
+    of documents completed as a bulk job: it needs no topic and takes an
+    optional `topics` object (filename -> topic). Chunks are then sent with
+    PUT /teacher/upload/sessions/<id> and finished with .../complete.
+    """
+    identity = get_jwt_identity()
+    claims = get_jwt() or {}
+    if claims.get("role") != "teacher":
+        return jsonify({"error": "Forbidden"}), 403
+
+    data = request.get_json(force=True) or {}
+    school = (data.get("school") or claims.get("school") or "").strip()
+    class_name = (data.get("class") or data.get("className") or "").strip()
+    subject = (data.get("subject") or "").strip()
+    topic = (data.get("topic") or data.get("name") or "").strip()
+    kind = (data.get("kind") or "file").strip().lower()
+    original_filename = (data.get("filename") or "").strip()
+    filename = secure_filename(original_filename)
+
+    if not school:
+        return jsonify({"error": "school is required"}), 400
+    if not class_name:
+        return jsonify({"error": "class is required"}), 400
+    if not subject:
+        return jsonify({"error": "subject is required"}), 400
+    if kind not in {"file", "audio", "archive"}:
+        return jsonify({"error": "kind must be 'file', 'audio' or 'archive'"}), 400
+    if not topic and kind != "archive":
+        return jsonify({"error": "topic is required"}), 400
+    if not filename:
+        return jsonify({"error": "filename is required"}), 400
+
+    try:
+        total_size = int(data.get("size"))
+    except (TypeError, ValueError):
+        return jsonify({"error": "size must be an integer number of bytes"}), 400
+    max_size = current_app.config["UPLOAD_SESSION_MAX_BYTES"]
+    if total_size <= 0 or total_size > max_size:
+        return jsonify({"error": f"size must be between 1 and {max_size} bytes"}), 400
+
+    params = {
+        "school": school,
+        "class_name": class_name,
+        "subject": subject,
+        "topic": topic,
+        "uploaded_by": identity,
+        "source_type": "document" if kind == "file" else "audio",
+        "original_filename": original_filename,
+        "language": data.get("language") if kind == "audio" else None,
+    }
+    if kind == "archive":
+        try:
+            topic_map = _topic_map(data.get("topics"))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        params = {
+            "school": school,
+            "class_name": class_name,
+            "subject": subject,
+            "uploaded_by": identity,
+            # Pairs, since file names (keys) usually contain dots
+            "topics": [[name, str(value)] for name, value in topic_map.items()],
+        }
+    try:
+        session = create_session(
+            uploaded_by=identity,
+            kind=kind,
+            filename=filename,
+            total_size=total_size,
+            params=params,
+        )
+    except PyMongoError as e:
+        return jsonify({"error": f"Database error: {str(e)}"}), 500
+
+    return jsonify(_session_view(session)), 201
+
+
+@upload_sessions_bp.get("/teacher/upload/sessions/<session_id>")  # resume point
+@jwt_required()
+def upload_session_status(session_id: str):
+    session, error = _owned_session(session_id)
+    if error:
+        return error
+    return jsonify(_session_view(session)), 200
+
+
+@upload_sessions_bp.put("/teacher/upload/sessions/<session_id>")  # raw chunk body
+@jwt_required()
+def upload_session_chunk(session_id: str):
+    """Write one chunk. The offset comes from the `Upload-Offset` header or `offset` query param."""
+    session, error = _owned_session(session_id)
+    if error:
+        return error
+
+    raw_offset = request.headers.get("Upload-Offset") or request.args.get("offset")
+    try:
+        offset = int(raw_offset)
+    except (TypeError, ValueError):
+        return jsonify({"error": "Upload-Offset header or offset query parameter is required"}), 400
+
+    chunk = request.get_data(cache=False)
+    if not chunk:
+        return jsonify({"error": "Empty chunk"}), 400
+
+    try:
+        session = append_chunk(session, offset, chunk)
+    except OffsetMismatch as e:
+        # Tell the client where to resume from
+        return jsonify({"error": str(e), "receivedBytes": e.expected}), 409
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except PyMongoError as e:
+        return jsonify({"error": f"Database error: {str(e)}"}), 500
+
+    return jsonify(_session_view(session)), 200
+
+
+@upload_sessions_bp.post("/teacher/upload/sessions/<session_id>/complete")
+@jwt_required()
+def complete_upload_session(session_id: str):
+    """Hand the assembled file to the upload pipeline (sync, or as a job with ?async=1)."""
+    session, error = _owned_session(session_id)
+    if error:
+        return error
+    if session.get("receivedBytes") != session.get("totalSize"):
+        return jsonify({
+            "error": "Upload is incomplete",
+            "receivedBytes": session.get("receivedBytes"),
+            "totalSize": session.get("totalSize"),
+        }), 409
+
+    try:
+        completed = mark_completed(session)
+    except PyMongoError as e:
+        return jsonify({"error": f"Database error: {str(e)}"}), 500
+    if completed is None:
+        return jsonify({"error": "Upload session is not open"}), 409
+
+    if session.get("kind") == "archive":
+        return _complete_archive(session)
+
+    params = dict(session["params"])
+    params["path"] = staged_path(session)
+
+    flag = (request.args.get("async") or "").strip().lower()
+    if flag in {"1", "true", "yes"}:
+        job_id = new_job_id()
+        try:
+            create_job(job_id=job_id, uploaded_by=session.get("uploadedBy"), params=params)
+        except PyMongoError as e:
+            return jsonify({"error": f"Database error: {str(e)}"}), 500
+        # The job removes the staged file when it finishes
+        submit_job(current_app._get_current_object(), job_id, params)
+        return jsonify({
+            "jobId": job_id,
+            "status": "queued",
+            "statusUrl": f"/api/teacher/upload/{job_id}",
+        }), 202
+
+    try:
+        note = process_upload(**params)
+    except TextTooLong as e:
+        return jsonify({"error": str(e)}), 413
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except PyMongoError as e:
+        return jsonify({"error": f"Database error: {str(e)}"}), 500
+    finally:
+        discard_staging(session)
+
+    return jsonify({
+        "note": note,
+        "skippedStages": (note.get("meta") or {}).get("skippedStages", []),
+    }), 201
+
+
+def _complete_archive(session: dict):
+    """Queue the documents of an uploaded zip as a bulk job (always asynchronous)."""
+    params = session["params"]
+    path = staged_path(session)
+    try:
+        names = list_archive_documents(
+            path,
+            current_app.config["BULK_UPLOAD_MAX_FILES"],
+            current_app.config["BULK_UPLOAD_MAX_UNCOMPRESSED_BYTES"],
+        )
+    except ValueError as e:
+        discard_staging(session)
+        return jsonify({"error": str(e)}), 400
+    return queue_bulk_job(
+        job_id=new_job_id(),
+        identity=session.get("uploadedBy"),
+        school=params["school"],
+        class_name=params["class_name"],
+        subject=params["subject"],
+        items=assign_topics(names, dict(params.get("topics") or [])),
+        path=path,
+        archive=True,
+    )
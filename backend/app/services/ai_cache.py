@@ -0,0 +1,339 @@
+from __future__ import annotations
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from flask import has_app_context
+from pymongo.errors import PyMongoError
+
+from .db import get_db
+
+
+logger = logging.getLogger(__name__)
+
+# A cache layer stores (json payload, absolute expiry as a unix timestamp)
+Entry = Tuple[str, float]
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+class MemoryCache:
+    """
+    Thread-safe in-process LRU cache for AI responses.
+
+    Bounded by entry count and by total serialized size; every entry carries its
+    own expiry. Values are stored as JSON so callers always get a private copy
+    and the byte accounting is exact.
+    """
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = 1000, max_bytes: int = 64 * 1024 * 1024, ttl_seconds: int = 3600):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Entry]" = OrderedDict()  # key -> (json, expires_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    def _remove(self, key: str) -> None:
+        payload, _ = self._entries.pop(key)
+        self._bytes -= len(payload)
+
+    def lookup(self, key: str) -> Optional[Entry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            if time.time() >= entry[1]:
+                self._remove(key)
+                self._expirations += 1
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry
+
+    def store(self, key: str, payload: str, expires_at: float) -> None:
+        if len(payload) > self.max_bytes:
+            # Never cache a single value larger than the whole budget
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (payload, expires_at)
+            self._bytes += len(payload)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._evictions += 1
+
+    def get(self, key: str) -> Optional[Dict]:
+        entry = self.lookup(key)
+        return json.loads(entry[0]) if entry else None
+
+    def set(self, key: str, value: Dict, ttl_seconds: Optional[int] = None) -> None:
+        ttl = ttl_seconds if ttl_seconds is not None else self.ttl_seconds
+        self.store(key, json.dumps(value, default=str), time.time() + ttl)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+                "hit_rate": round(self._hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+class DiskCache:
+    """
+    SQLite-backed cache shared by all worker processes on one host.
+
+    Survives restarts and deploys that keep the data directory. Any SQLite error
+    is logged and treated as a miss so the disk never breaks a request.
+    """
+
+    name = "disk"
+    _PRUNE_EVERY = 500  # writes between sweeps of expired rows
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._writes = 0
+        self._hits = 0
+        self._misses = 0
+        self._errors = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS ai_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def lookup(self, key: str) -> Optional[Entry]:
+        with self._lock:
+            try:
+                row = self._connection().execute(
+                    "SELECT value, expires_at FROM ai_cache WHERE key = ? AND expires_at > ?",
+                    (key, time.time()),
+                ).fetchone()
+            except sqlite3.Error as e:
+                self._errors += 1
+                logger.warning(f"Disk cache read failed: {e}")
+                return None
+            if row is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+            return row[0], row[1]
+
+    def store(self, key: str, payload: str, expires_at: float) -> None:
+        with self._lock:
+            try:
+                conn = self._connection()
+                conn.execute(
+                    "INSERT OR REPLACE INTO ai_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, payload, expires_at),
+                )
+                self._writes += 1
+                if self._writes % self._PRUNE_EVERY == 0:
+                    conn.execute("DELETE FROM ai_cache WHERE expires_at <= ?", (time.time(),))
+                conn.commit()
+            except sqlite3.Error as e:
+                self._errors += 1
+                logger.warning(f"Disk cache write failed: {e}")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"path": self.path, "hits": self._hits, "misses": self._misses, "errors": self._errors}
+
+
+class MongoCache:
+    """
+    Cache stored in the Mongo `ai_cache` collection, shared by every instance.
+
+    MongoDB removes expired documents through a TTL index on expiresAt. The layer
+    is skipped outside an app context and for a cooldown period after an error,
+    so a slow or unavailable database only costs one failed round trip.
+    """
+
+    name = "mongo"
+
+    def __init__(self, collection: str = "ai_cache", cooldown_seconds: float = 30.0):
+        self.collection = collection
+        self.cooldown_seconds = cooldown_seconds
+        self._lock = threading.Lock()
+        self._indexes_ready = False
+        self._disabled_until = 0.0
+        self._hits = 0
+        self._misses = 0
+        self._errors = 0
+
+    def _col(self):
+        col = get_db()[self.collection]
+        if not self._indexes_ready:
+            col.create_index("expiresAt", expireAfterSeconds=0, name="expiresAt_ttl")
+            self._indexes_ready = True
+        return col
+
+    def _available(self) -> bool:
+        return has_app_context() and time.time() >= self._disabled_until
+
+    def _failed(self, action: str, error: Exception) -> None:
+        with self._lock:
+            self._errors += 1
+            self._disabled_until = time.time() + self.cooldown_seconds
+        logger.warning(f"Mongo cache {action} failed, skipping it for {self.cooldown_seconds:.0f}s: {error}")
+
+    def lookup(self, key: str) -> Optional[Entry]:
+        if not self._available():
+            return None
+        try:
+            doc = self._col().find_one({"_id": key})
+        except PyMongoError as e:
+            self._failed("read", e)
+            return None
+        # The TTL monitor runs about once a minute, so check expiry ourselves too
+        if doc is None or doc["expiresAt"] <= datetime.utcnow():
+            with self._lock:
+                self._misses += 1
+            return None
+        with self._lock:
+            self._hits += 1
+        return doc["value"], (doc["expiresAt"] - _EPOCH).total_seconds()
+
+    def store(self, key: str, payload: str, expires_at: float) -> None:
+        if not self._available():
+            return
+        try:
+            self._col().replace_one(
+                {"_id": key},
+                {"_id": key, "value": payload, "expiresAt": _EPOCH + timedelta(seconds=expires_at)},
+                upsert=True,
+            )
+        except PyMongoError as e:
+            self._failed("write", e)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "collection": self.collection,
+                "hits": self._hits,
+                "misses": self._misses,
+                "errors": self._errors,
+                "available": time.time() >= self._disabled_until,
+            }
+
+
+class TieredCache:
+    """
+    Read-through chain of cache layers, fastest first.
+
+    A hit in a slower layer is copied into every faster layer with its remaining
+    lifetime; writes go to all layers. Exposes the same get/set/stats interface
+    as MemoryCache.
+    """
+
+    def __init__(self, layers: Sequence, ttl_seconds: int = 3600):
+        if not layers:
+            raise ValueError("TieredCache needs at least one layer")
+        self.layers = list(layers)
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key: str) -> Optional[Dict]:
+        for depth, layer in enumerate(self.layers):
+            entry = layer.lookup(key)
+            if entry is None:
+                continue
+            for faster in self.layers[:depth]:
+                faster.store(key, *entry)
+            with self._lock:
+                self._hits += 1
+            return json.loads(entry[0])
+        with self._lock:
+            self._misses += 1
+        return None
+
+    def set(self, key: str, value: Dict, ttl_seconds: Optional[int] = None) -> None:
+        ttl = ttl_seconds if ttl_seconds is not None else self.ttl_seconds
+        payload = json.dumps(value, default=str)
+        expires_at = time.time() + ttl
+        for layer in self.layers:
+            layer.store(key, payload, expires_at)
+
+    def __len__(self) -> int:
+        # Size of the in-process layer; the shared layers are not counted
+        first = self.layers[0]
+        return len(first) if hasattr(first, "__len__") else 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            hits, misses = self._hits, self._misses
+        lookups = hits + misses
+        return {
+            "backends": [layer.name for layer in self.layers],
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            "layers": {layer.name: layer.stats() for layer in self.layers},
+        }
+
+
+def build_cache(
+    backends: str,
+    *,
+    max_entries: int,
+    max_bytes: int,
+    ttl_seconds: int,
+    disk_path: str,
+    mongo_collection: str = "ai_cache",
+) -> TieredCache:
+    """Build a TieredCache from a comma-separated backend list such as "memory,disk,mongo"."""
+    layers: List = []
+    for name in (b.strip().lower() for b in backends.split(",")):
+        if not name:
+            continue
+        if name == "memory":
+            layers.append(MemoryCache(max_entries=max_entries, max_bytes=max_bytes, ttl_seconds=ttl_seconds))
+        elif name == "disk":
+            layers.append(DiskCache(disk_path))
+        elif name == "mongo":
+            layers.append(MongoCache(mongo_collection))
+        else:
+            logger.warning(f"Unknown AI cache backend '{name}' ignored")
+    if not layers:
+        layers.append(MemoryCache(max_entries=max_entries, max_bytes=max_bytes, ttl_seconds=ttl_seconds))
+    return TieredCache(layers, ttl_seconds=ttl_seconds)
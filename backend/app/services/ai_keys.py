@@ -0,0 +1,247 @@
+from __future__ import annotations
+
+import logging
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+# A key answering 429/5xx is benched for this long, doubling per consecutive failure
+AI_KEY_COOLDOWN_SECONDS = float(os.getenv("AI_KEY_COOLDOWN_SECONDS", "30"))
+AI_KEY_COOLDOWN_MAX_SECONDS = float(os.getenv("AI_KEY_COOLDOWN_MAX_SECONDS", "300"))
+# Per-key Gemini quotas (0 = unlimited, the default). Set them to the key's plan,
+# e.g. 15 RPM / 1,000,000 TPM for the free tier of gemini-2.0-flash
+AI_KEY_RPM = float(os.getenv("AI_KEY_RPM", "0"))
+AI_KEY_TPM = float(os.getenv("AI_KEY_TPM", "0"))
+# Longest a request queues for quota before failing with 503. The default lets it
+# wait up to the request deadline, leaving room under gunicorn's 120s timeout
+AI_KEY_MAX_WAIT_SECONDS = float(os.getenv("AI_KEY_MAX_WAIT_SECONDS", "90"))
+# Weight of the newest sample in the latency / error-rate moving averages
+_EWMA_ALPHA = 0.2
+# Seconds of latency one unit of error rate is worth when ranking keys
+_ERROR_PENALTY_SECONDS = 10.0
+
+_RETRYABLE_PATTERN = re.compile(
+    r"\b(429|500|502|503|504)\b|RESOURCE_EXHAUSTED|UNAVAILABLE|rate limit|quota|overloaded",
+    re.IGNORECASE,
+)
+
+
+def error_status(error: Exception) -> Optional[int]:
+    """HTTP status carried by a google-genai / google-api-core exception, if any."""
+    for attr in ("code", "status_code"):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough prompt token count (about four characters per token)."""
+    return max(1, len(text) // 4)
+
+
+def is_retryable(error: Exception) -> bool:
+    """True for rate limiting and server-side failures (429 / 5xx)."""
+    status = error_status(error)
+    if status is not None:
+        return status == 429 or status >= 500
+    return bool(_RETRYABLE_PATTERN.search(str(error)))
+
+
+class _TokenBucket:
+    """
+    Holds up to one minute of quota (`per_minute` units) and refills at that
+    rate, so a burst can use the whole per-minute quota at once; a request
+    larger than capacity waits for a full bucket.
+    """
+
+    __slots__ = ("rate", "capacity", "level", "updated")
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, per_minute)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def available(self, now: float) -> float:
+        # `now` may predate a bucket created during the same acquire()
+        self.level = min(self.capacity, self.level + max(0.0, now - self.updated) * self.rate)
+        self.updated = max(self.updated, now)
+        return self.level
+
+    def delay(self, amount: float, now: float) -> float:
+        """Seconds until `amount` can be taken (0 if it can be now)."""
+        self.available(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float) -> None:
+        self.level -= min(amount, self.capacity)
+
+
+class _KeyState:
+    __slots__ = ("latency", "error_rate", "in_flight", "cooldown_until", "failures", "requests", "errors",
+                 "rpm_bucket", "tpm_bucket")
+
+    def __init__(self, rpm: float = 0, tpm: float = 0):
+        self.latency = 0.0  # EWMA seconds; 0 until the key has answered once
+        self.error_rate = 0.0  # EWMA of failures
+        self.in_flight = 0
+        self.cooldown_until = 0.0
+        self.failures = 0  # consecutive retryable failures
+        self.requests = 0
+        self.errors = 0
+        self.rpm_bucket = _TokenBucket(rpm) if rpm > 0 else None
+        self.tpm_bucket = _TokenBucket(tpm) if tpm > 0 else None
+
+
+class KeyScheduler:
+    """
+    Chooses which Gemini API key to try next.
+
+    Keys are ranked by recent latency, error rate and current in-flight calls,
+    so load spreads across all configured keys. A key that is rate limited or
+    failing server-side is skipped until its cooldown expires.
+
+    Each key also has token buckets for its requests-per-minute and
+    tokens-per-minute quota; acquire() hands out a key only when both have room.
+    """
+
+    def __init__(self, cooldown_seconds: float = AI_KEY_COOLDOWN_SECONDS,
+                 max_cooldown_seconds: float = AI_KEY_COOLDOWN_MAX_SECONDS,
+                 rpm: float = AI_KEY_RPM, tpm: float = AI_KEY_TPM):
+        self.cooldown_seconds = cooldown_seconds
+        self.max_cooldown_seconds = max_cooldown_seconds
+        self.rpm = rpm
+        self.tpm = tpm
+        self._states: Dict[str, _KeyState] = {}
+        self._lock = threading.Lock()
+
+    def _state(self, key: str) -> _KeyState:
+        state = self._states.get(key)
+        if state is None:
+            state = self._states.setdefault(key, _KeyState(self.rpm, self.tpm))
+        return state
+
+    def order(self, keys: List[str], include_benched: bool = True) -> List[str]:
+        """
+        Keys to try, best first. Keys in cooldown are left out while any key is
+        not; if every key is benched they are returned soonest-available first,
+        so the request still gets an attempt, unless include_benched is False.
+        """
+        now = time.time()
+        with self._lock:
+            ready, benched = [], []
+            for key in keys:
+                state = self._state(key)
+                if state.cooldown_until > now:
+                    benched.append((state.cooldown_until, key))
+                    continue
+                score = state.latency * (1 + state.in_flight) + state.error_rate * _ERROR_PENALTY_SECONDS
+                ready.append((score, random.random(), key))
+        ready.sort()
+        benched.sort()
+        if ready or not include_benched:
+            return [key for _, _, key in ready]
+        return [key for _, key in benched]
+
+    def acquire(self, candidates: List[str], tokens: int) -> Tuple[Optional[str], float]:
+        """
+        Take one request and `tokens` of quota from the first candidate that has
+        both. Returns (key, 0.0), or (None, seconds until the soonest candidate
+        will have room) when none has. Candidates benched since they were
+        ordered are skipped, unless every candidate is benched.
+        """
+        now = time.monotonic()
+        wall_now = time.time()
+        soonest = float("inf")
+        with self._lock:
+            states = [(key, self._state(key)) for key in candidates]
+            ready = [(key, state) for key, state in states if state.cooldown_until <= wall_now]
+            for key, state in ready or states:
+                delay = 0.0
+                if state.rpm_bucket is not None:
+                    delay = state.rpm_bucket.delay(1, now)
+                if state.tpm_bucket is not None:
+                    delay = max(delay, state.tpm_bucket.delay(tokens, now))
+                if delay > 0:
+                    soonest = min(soonest, delay)
+                    continue
+                if state.rpm_bucket is not None:
+                    state.rpm_bucket.take(1)
+                if state.tpm_bucket is not None:
+                    state.tpm_bucket.take(tokens)
+                return key, 0.0
+        return None, soonest
+
+    @contextmanager
+    def track(self, key: str) -> Iterator[None]:
+        """Count a call as in flight and record its latency or failure."""
+        with self._lock:
+            state = self._state(key)
+            state.in_flight += 1
+            state.requests += 1
+        start = time.time()
+        try:
+            yield
+        except Exception as e:
+            self._record_failure(key, e)
+            raise
+        else:
+            self._record_success(key, time.time() - start)
+        finally:
+            with self._lock:
+                state.in_flight -= 1
+
+    def _record_success(self, key: str, seconds: float) -> None:
+        with self._lock:
+            state = self._state(key)
+            state.latency = seconds if state.latency == 0 else (
+                _EWMA_ALPHA * seconds + (1 - _EWMA_ALPHA) * state.latency
+            )
+            state.error_rate *= 1 - _EWMA_ALPHA
+            state.failures = 0
+            state.cooldown_until = 0.0
+
+    def _record_failure(self, key: str, error: Exception) -> None:
+        with self._lock:
+            state = self._state(key)
+            state.errors += 1
+            state.error_rate = _EWMA_ALPHA + (1 - _EWMA_ALPHA) * state.error_rate
+            if not is_retryable(error):
+                return
+            state.failures += 1
+            cooldown = min(self.cooldown_seconds * 2 ** (state.failures - 1), self.max_cooldown_seconds)
+            state.cooldown_until = time.time() + cooldown
+        logger.warning(f"Gemini key ...{key[-4:]} cooling down for {cooldown:.0f}s after: {error}")
+
+    def stats(self, keys: List[str]) -> Dict[str, Dict]:
+        """
+        Health of the configured `keys`, labelled by position ("key1", "key2", ...)
+        so the statistics never reveal any part of a key.
+        """
+        now = time.time()
+        mono_now = time.monotonic()
+        stats: Dict[str, Dict] = {}
+        with self._lock:
+            for index, key in enumerate(keys, 1):
+                state = self._state(key)
+                stats[f"key{index}"] = {
+                    "requests": state.requests,
+                    "errors": state.errors,
+                    "in_flight": state.in_flight,
+                    "latency_ewma": round(state.latency, 3),
+                    "error_rate_ewma": round(state.error_rate, 3),
+                    "cooldown_remaining": round(max(0.0, state.cooldown_until - now), 1),
+                    # Quota currently in the buckets (None = unlimited)
+                    "rpm_available": round(state.rpm_bucket.available(mono_now), 2) if state.rpm_bucket else None,
+                    "tpm_available": round(state.tpm_bucket.available(mono_now)) if state.tpm_bucket else None,
+                }
+        return stats
@@ -1,15 +1,28 @@
 from __future__ import annotations
 
+import contextvars
 import json
 import os
 import re
 import time
 import logging
 import hashlib
-from typing import Dict, List, Optional, Tuple
-from functools import lru_cache
+import threading
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Deque, Dict, Iterator, List, Optional, Tuple
+from functools import lru_cache, partial
 from datetime import datetime, timedelta
 
+from flask import current_app, has_app_context
+
+from .ai_cache import build_cache
+from .ai_keys import AI_KEY_MAX_WAIT_SECONDS, KeyScheduler, estimate_tokens
+from .ai_usage import UsageTracker
+from .notes_service import content_hash
+from .qna_index import CONTROL_CHARS, normalize_question, select_context
+
 # This service wraps Google Gemini 2.0 Flash with up to 4 API keys fallback.
 # It will first try the new Google AI SDK (package: google-genai, import: google.genai),
 # and if unavailable, fall back to google-generativeai.
@@ -29,13 +42,140 @@ KEY_ENV_NAMES = ["GEMINI_API_KEY", "GEMINI_API_KEY_2", "GEMINI_API_KEY_3", "GEMI
 
 # Constants for validation
 MAX_TEXT_LENGTH = 10000  # Maximum characters for input text
+# Longer notes are split into chunks of at most MAX_TEXT_LENGTH characters,
+# adapted in parallel and stitched back together in order
+MAX_DOCUMENT_LENGTH = int(os.getenv("AI_MAX_DOCUMENT_LENGTH", "200000"))
+AI_CHUNK_CONCURRENCY = int(os.getenv("AI_CHUNK_CONCURRENCY", "4"))
 MAX_QUESTION_LENGTH = 500  # Maximum characters for questions
 MIN_TEXT_LENGTH = 10  # Minimum meaningful text length
 
-# Simple in-memory cache with TTL
-_response_cache: Dict[str, Tuple[Dict, float]] = {}
-CACHE_TTL_SECONDS = 3600  # 1 hour cache
+# Tiered response cache: in-process LRU (L1), SQLite file shared by the workers
+# on this host (L2) and the Mongo `ai_cache` collection shared by all instances (L3)
+CACHE_TTL_SECONDS = int(os.getenv("AI_CACHE_TTL_SECONDS", "3600"))  # 1 hour cache
+CACHE_MAX_ENTRIES = int(os.getenv("AI_CACHE_MAX_ENTRIES", "1000"))
+CACHE_MAX_BYTES = int(os.getenv("AI_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_BACKENDS = os.getenv("AI_CACHE_BACKENDS", "memory,disk,mongo")
+CACHE_DISK_PATH = os.getenv("AI_CACHE_DISK_PATH", "./ai_cache/responses.sqlite3")
+_response_cache = build_cache(
+    CACHE_BACKENDS,
+    max_entries=CACHE_MAX_ENTRIES,
+    max_bytes=CACHE_MAX_BYTES,
+    ttl_seconds=CACHE_TTL_SECONDS,
+    disk_path=CACHE_DISK_PATH,
+)
+
+# Provider clients are created once per (key, model, settings) and shared by all
+# threads; both SDK clients keep their HTTP connection pools between calls
+_provider_pool: Dict[Tuple[str, str, float, int], object] = {}
+_provider_pool_lock = threading.Lock()
+# google-generativeai configures its API key globally, so construction is serialized
+_legacy_configure_lock = threading.Lock()
+
+# Spreads requests across the configured keys and benches rate-limited ones
+_key_scheduler = KeyScheduler()
+
+# Token counts and latency of every Gemini call, by key, mode and student type
+_usage_tracker = UsageTracker()
+
+# Single-flight: concurrent requests for the same cache key wait for the one
+# generation already in progress instead of calling Gemini again
+AI_SINGLE_FLIGHT_WAIT_SECONDS = float(os.getenv("AI_SINGLE_FLIGHT_WAIT_SECONDS", "120"))
+
+
+class _Flight:
+    """One in-progress generation that other callers may wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.payload: Optional[str] = None  # JSON of the result, so every waiter gets a copy
+        self.error: Optional[Exception] = None
+
+
+_inflight: Dict[str, _Flight] = {}
+_inflight_lock = threading.Lock()
+
+# Uncached items of one /api/ai/batch request generated at the same time
+AI_BATCH_CONCURRENCY = int(os.getenv("AI_BATCH_CONCURRENCY", "4"))
+
+# Hedged requests: if a call is slower than this percentile of recent calls,
+# the same prompt is sent on a second key and the first answer wins
+AI_HEDGE_ENABLED = os.getenv("AI_HEDGE_ENABLED", "false").lower() in ("1", "true", "yes")
+AI_HEDGE_PERCENTILE = float(os.getenv("AI_HEDGE_PERCENTILE", "0.95"))
+AI_HEDGE_MIN_DELAY_SECONDS = float(os.getenv("AI_HEDGE_MIN_DELAY_SECONDS", "1.0"))
+# Budget used until enough latencies have been observed
+AI_HEDGE_DEFAULT_DELAY_SECONDS = float(os.getenv("AI_HEDGE_DEFAULT_DELAY_SECONDS", "8.0"))
+AI_HEDGE_WORKERS = int(os.getenv("AI_HEDGE_WORKERS", "8"))
+_HEDGE_MIN_SAMPLES = 20
+_recent_latencies: Deque[float] = deque(maxlen=500)
+_recent_latencies_lock = threading.Lock()
+_hedge_executor: Optional[ThreadPoolExecutor] = None
+_hedge_executor_lock = threading.Lock()
+
+
+# Optional bound on concurrent Gemini calls, set by callers such as the upload
+# pipeline through limit_gemini_calls(). It follows the work onto chunk, batch
+# and hedge worker threads, so every call made on the caller's behalf counts.
+_call_limiter: contextvars.ContextVar = contextvars.ContextVar("gemini_call_limiter", default=None)
+
+
+@contextmanager
+def limit_gemini_calls(slots) -> Iterator[None]:
+    """
+    Within this block each Gemini call made for the current context runs inside
+    `with slots:` (e.g. a shared threading.BoundedSemaphore), including the
+    per-chunk calls of long documents.
+    """
+    token = _call_limiter.set(slots)
+    try:
+        yield
+    finally:
+        _call_limiter.reset(token)
+
+
+@contextmanager
+def _call_slot() -> Iterator[None]:
+    slots = _call_limiter.get()
+    if slots is None:
+        yield
+        return
+    with slots:
+        yield
+
+
+def _bind_app_context(fn):
+    """
+    Wrap fn so it runs inside the caller's Flask app context (if any) and a copy
+    of its context variables on a worker thread.
+    """
+    app = current_app._get_current_object() if has_app_context() else None
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        # A context can only be entered by one thread at a time, so copy it per call
+        if app is None:
+            return context.copy().run(fn, *args, **kwargs)
+        with app.app_context():
+            return context.copy().run(fn, *args, **kwargs)
+    return run
+
+
+def _get_hedge_executor() -> ThreadPoolExecutor:
+    global _hedge_executor
+    if _hedge_executor is None:
+        with _hedge_executor_lock:
+            if _hedge_executor is None:
+                _hedge_executor = ThreadPoolExecutor(max_workers=AI_HEDGE_WORKERS, thread_name_prefix="ai-hedge")
+    return _hedge_executor
+
 
+def _hedge_delay() -> float:
+    """Seconds to wait for the first call before hedging."""
+    with _recent_latencies_lock:
+        samples = sorted(_recent_latencies)
+    if len(samples) < _HEDGE_MIN_SAMPLES:
+        return AI_HEDGE_DEFAULT_DELAY_SECONDS
+    index = min(len(samples) - 1, int(AI_HEDGE_PERCENTILE * len(samples)))
+    return max(AI_HEDGE_MIN_DELAY_SECONDS, samples[index])
 
 def _load_api_keys() -> List[str]:
     keys: List[str] = []
@@ -52,40 +192,45 @@ def _load_api_keys() -> List[str]:
     
     return keys
 
+def _key_label(key: str) -> str:
+    """Statistics label of a key: "key1" for the first configured key, as in the logs."""
+    configured = [val for val in ((os.getenv(name) or "").strip() for name in KEY_ENV_NAMES) if val]
+    return f"key{configured.index(key) + 1}" if key in configured else "unconfigured"
+
 def _get_cache_key(mode: str, **kwargs) -> str:
     """Generate a cache key based on request parameters."""
     # Create a deterministic string from parameters
     params = f"{mode}:{kwargs.get('student_type', '')}:{kwargs.get('text', '')}:{kwargs.get('notes', '')}:{kwargs.get('question', '')}"
     return hashlib.md5(params.encode()).hexdigest()
 
+def _notes_cache_key(student_type: str, text: str, text_hash: Optional[str] = None) -> str:
+    """
+    Notes cache key from the text's content hash. Callers holding a stored note
+    pass its contentHash as text_hash so the text is not hashed again.
+    """
+    return _get_cache_key("notes", student_type=student_type, text=text_hash or content_hash(text))
+
+def _qna_cache_key(student_type: str, notes: str, question: str, notes_hash: Optional[str] = None) -> str:
+    """
+    Q&A cache key from the notes' content hash and the normalized question, so
+    rephrasings like "What is photosynthesis?" / "what is photosynthesis" share an answer.
+    notes_hash is the stored hash of `notes`, when the caller has one.
+    """
+    return _get_cache_key(
+        "qna", student_type=student_type, notes=notes_hash or content_hash(notes), question=normalize_question(question)
+    )
+
 def _get_cached_response(cache_key: str) -> Optional[Dict]:
     """Get cached response if available and not expired."""
-    if cache_key in _response_cache:
-        response, timestamp = _response_cache[cache_key]
-        if time.time() - timestamp < CACHE_TTL_SECONDS:
-            logger.info(f"Cache hit for key: {cache_key[:8]}...")
-            return response
-        else:
-            # Remove expired entry
-            del _response_cache[cache_key]
-            logger.debug(f"Cache expired for key: {cache_key[:8]}...")
-    return None
+    response = _response_cache.get(cache_key)
+    if response is not None:
+        logger.info(f"Cache hit for key: {cache_key[:8]}...")
+    return response
 
 def _set_cached_response(cache_key: str, response: Dict) -> None:
-    """Store response in cache with current timestamp."""
-    _response_cache[cache_key] = (response, time.time())
+    """Store response in cache; the cache evicts least recently used entries when full."""
+    _response_cache.set(cache_key, response)
     logger.debug(f"Cached response for key: {cache_key[:8]}...")
-    
-    # Clean up old cache entries if cache gets too large
-    if len(_response_cache) > 100:
-        current_time = time.time()
-        expired_keys = [
-            k for k, (_, ts) in _response_cache.items() 
-            if current_time - ts > CACHE_TTL_SECONDS
-        ]
-        for k in expired_keys:
-            del _response_cache[k]
-        logger.debug(f"Cleaned {len(expired_keys)} expired cache entries")
 
 
 def _safe_json_extract(text: str, retry_count: int = 0) -> Dict:
@@ -126,23 +271,148 @@ def _safe_json_extract(text: str, retry_count: int = 0) -> Dict:
     logger.warning("Could not parse JSON, returning as plain content")
     return {"content": text}
 
-def validate_input(text: str, field_name: str, max_length: int, min_length: int = 1) -> str:
-    """Validate and sanitize input text."""
+_JSON_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+
+class _JsonFieldStreamer:
+    """
+    Pulls the value of one string field out of a JSON object while it is still
+    being generated, so its text can be forwarded before the object is complete.
+    """
+
+    def __init__(self, field: str):
+        self._start = re.compile(r'"%s"\s*:\s*"' % re.escape(field))
+        self._buffer = ""
+        self._pos: Optional[int] = None  # index of the next undecoded character
+        self._done = False
+
+    def feed(self, chunk: str) -> str:
+        """Add raw model output; return newly decoded field text (may be empty)."""
+        self._buffer += chunk
+        if self._done:
+            return ""
+        if self._pos is None:
+            match = self._start.search(self._buffer)
+            if not match:
+                return ""
+            self._pos = match.end()
+
+        out = []
+        buf, i = self._buffer, self._pos
+        while i < len(buf):
+            ch = buf[i]
+            if ch == '"':
+                self._done = True
+                i += 1
+                break
+            if ch != "\\":
+                out.append(ch)
+                i += 1
+                continue
+            if i + 1 >= len(buf):
+                break  # escape split across chunks
+            esc = buf[i + 1]
+            if esc == "u":
+                # \uXXXX, or a surrogate pair \uD83D\uDE00 decoded as one character
+                if i + 6 > len(buf):
+                    break
+                try:
+                    code = int(buf[i + 2:i + 6], 16)
+                except ValueError:
+                    code = None
+                if code is not None and 0xD800 <= code < 0xDC00:
+                    if i + 12 > len(buf):
+                        break
+                    try:
+                        low = int(buf[i + 8:i + 12], 16)
+                    except ValueError:
+                        low = 0
+                    if buf[i + 6:i + 8] == "\\u" and 0xDC00 <= low < 0xE000:
+                        out.append(chr(0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00)))
+                        i += 12
+                        continue
+                    code = None
+                if code is not None:
+                    out.append(chr(code))
+                i += 6
+            else:
+                out.append(_JSON_ESCAPES.get(esc, esc))
+                i += 2
+        self._pos = i
+        return "".join(out)
+
+
+def validate_input(text: str, field_name: str, max_length: int, min_length: int = 1, truncate: bool = True) -> str:
+    """Validate and sanitize input text; with truncate=False over-long text is rejected."""
     if not text or len(text.strip()) < min_length:
         raise ValueError(f"{field_name} must be at least {min_length} characters long")
     
     text = text.strip()
     
     if len(text) > max_length:
+        if not truncate:
+            raise ValueError(f"{field_name} must be at most {max_length} characters long")
         logger.warning(f"{field_name} truncated from {len(text)} to {max_length} characters")
         text = text[:max_length]
     
     # Basic sanitization - remove any potential control characters
-    text = re.sub(r'[\x00-\x08\x0B-\x0C\x0E-\x1F\x7F]', '', text)
+    text = CONTROL_CHARS.sub('', text)
     
     return text
 
 
+# Section starts inserted by document_extractor ("[Page 3]", "[Slide 2]")
+_SECTION_MARKER = re.compile(r"(?m)^(?=\[(?:Page|Slide) \d+\]\s*$)")
+
+
+def _hard_split(text: str, max_chars: int) -> List[str]:
+    """Cut text into pieces of at most max_chars, preferring to break at whitespace."""
+    pieces = []
+    while len(text) > max_chars:
+        cut = text.rfind(" ", 0, max_chars)
+        if cut <= max_chars // 2:
+            cut = max_chars
+        pieces.append(text[:cut].strip())
+        text = text[cut:].strip()
+    if text:
+        pieces.append(text)
+    return pieces
+
+
+def split_for_adaptation(text: str, max_chars: int) -> List[str]:
+    """
+    Split a long document into chunks of at most max_chars for separate adaptation.
+
+    Breaks on page/slide markers first, then on blank lines (paragraphs), and
+    only cuts inside a paragraph when it alone exceeds max_chars. Consecutive
+    small sections are packed together so the chunk count stays low.
+    """
+    units: List[str] = []
+    for section in _SECTION_MARKER.split(text):
+        section = section.strip()
+        if not section:
+            continue
+        if len(section) <= max_chars:
+            units.append(section)
+            continue
+        for paragraph in re.split(r"\n\s*\n", section):
+            paragraph = paragraph.strip()
+            if paragraph:
+                units.extend(_hard_split(paragraph, max_chars))
+
+    chunks: List[str] = []
+    current = ""
+    for unit in units:
+        if current and len(current) + 2 + len(unit) > max_chars:
+            chunks.append(current)
+            current = unit
+        else:
+            current = f"{current}\n\n{unit}" if current else unit
+    if current:
+        chunks.append(current)
+    return chunks
+
+
 ADAPTATION_GUIDELINES: Dict[str, str] = {
     "vision": (
         "Write with screen-reader friendly structure. Use clear headings and bullet points. "
@@ -183,6 +453,45 @@ def _normalize_student_type(student_type: str) -> str:
     return st
 
 
+def _response_text(resp) -> str:
+    """Text of a google-genai GenerateContentResponse."""
+    # Try various shapes
+    text = getattr(resp, "text", None)
+    if text:
+        return text
+
+    # candidates/parts shape fallback
+    cand = getattr(resp, "candidates", [])
+    if cand and getattr(cand[0], "content", None) and getattr(cand[0].content, "parts", None):
+        parts = cand[0].content.parts
+        # concatenate all text parts
+        out = []
+        for p in parts:
+            t = getattr(p, "text", None)
+            if t:
+                out.append(t)
+        if out:
+            return "\n".join(out)
+
+    # Last resort
+    return str(resp)
+
+
+def _response_usage(resp, usage: Optional[Dict] = None) -> Dict:
+    """
+    Token counts from a response's (or stream chunk's) usage_metadata, merged
+    into `usage`. Both SDKs use the same field names; counts they do not
+    report are left out.
+    """
+    usage = {} if usage is None else usage
+    meta = getattr(resp, "usage_metadata", None)
+    for field, name in (("prompt_tokens", "prompt_token_count"), ("output_tokens", "candidates_token_count")):
+        count = getattr(meta, name, None)
+        if count is not None:
+            usage[field] = count
+    return usage
+
+
 class _GoogleGenAIProvider:
     """
     Provider using the Google AI Python SDK: google-genai (import google.genai).
@@ -199,32 +508,28 @@ class _GoogleGenAIProvider:
         self._max_tokens = max_tokens
 
     def generate(self, prompt: str) -> str:
+        return self.generate_with_usage(prompt)[0]
+
+    def generate_with_usage(self, prompt: str) -> Tuple[str, Dict]:
         # Use config parameter for google-genai SDK
         resp = self._client.models.generate_content(
             model=self._model,
             contents=prompt,
             config={"temperature": self._temperature, "max_output_tokens": self._max_tokens},
         )
-        # Try various shapes
-        text = getattr(resp, "text", None)
-        if text:
-            return text
-
-        # candidates/parts shape fallback
-        cand = getattr(resp, "candidates", [])
-        if cand and getattr(cand[0], "content", None) and getattr(cand[0].content, "parts", None):
-            parts = cand[0].content.parts
-            # concatenate all text parts
-            out = []
-            for p in parts:
-                t = getattr(p, "text", None)
-                if t:
-                    out.append(t)
-            if out:
-                return "\n".join(out)
-
-        # Last resort
-        return str(resp)
+        return _response_text(resp), _response_usage(resp)
+
+    def generate_stream(self, prompt: str, usage: Optional[Dict] = None) -> Iterator[str]:
+        """Yield text chunks; token counts reported by the chunks are stored in `usage`."""
+        for chunk in self._client.models.generate_content_stream(
+            model=self._model,
+            contents=prompt,
+            config={"temperature": self._temperature, "max_output_tokens": self._max_tokens},
+        ):
+            _response_usage(chunk, usage)
+            text = getattr(chunk, "text", None)
+            if text:
+                yield text
 
 
 class _GoogleGenerativeAIProvider:
@@ -236,21 +541,99 @@ class _GoogleGenerativeAIProvider:
         import google.generativeai as genai  # type: ignore
 
         self._genai = genai
-        genai.configure(api_key=api_key)
         self._model_name = model
-        self._model = genai.GenerativeModel(model)
+        with _legacy_configure_lock:
+            genai.configure(api_key=api_key)
+            self._model = genai.GenerativeModel(model)
+            # Bind the client for this key now; by default the model picks up
+            # whatever key is configured globally at its first call
+            try:
+                from google.generativeai import client as legacy_client  # type: ignore
+                self._model._client = legacy_client.get_default_generative_client()
+            except Exception:
+                pass
         self._temperature = temperature
         self._max_tokens = max_tokens
 
     def generate(self, prompt: str) -> str:
+        return self.generate_with_usage(prompt)[0]
+
+    def generate_with_usage(self, prompt: str) -> Tuple[str, Dict]:
         resp = self._model.generate_content(
             prompt,
             generation_config={"temperature": self._temperature, "max_output_tokens": self._max_tokens},
         )
         text = getattr(resp, "text", None)
-        if text:
-            return text
-        return str(resp)
+        return (text or str(resp)), _response_usage(resp)
+
+    def generate_stream(self, prompt: str, usage: Optional[Dict] = None) -> Iterator[str]:
+        """Yield text chunks; token counts reported by the chunks are stored in `usage`."""
+        resp = self._model.generate_content(
+            prompt,
+            generation_config={"temperature": self._temperature, "max_output_tokens": self._max_tokens},
+            stream=True,
+        )
+        for chunk in resp:
+            _response_usage(chunk, usage)
+            text = getattr(chunk, "text", None)
+            if text:
+                yield text
+
+
+# Counters kept by GeminiService.count() and reported by get_stats()
+_STATS_COUNTERS = (
+    "requests", "errors", "cache_hits", "coalesced", "qna_requests", "qna_cache_hits",
+    "hedges_fired", "hedges_won", "quota_waits", "quota_timeouts",
+)
+
+
+def _require_keys() -> List[str]:
+    keys = _load_api_keys()
+    if not keys:
+        error_msg = "No Gemini API keys configured. Set GEMINI_API_KEY (and optionally *_2..*_4) in backend/.env"
+        logger.error(error_msg)
+        raise RuntimeError(error_msg)
+    return keys
+
+
+def _fallback_order(keys: List[str], attempt: int) -> Deque[str]:
+    """Keys to try, best first, on the given attempt of a generation."""
+    return deque(_key_scheduler.order(keys, include_benched=(attempt == 0)))
+
+
+def _keys_failed_error(error_msg: str, last_err: Optional[BaseException]) -> RuntimeError:
+    if last_err:
+        error_msg += f": {str(last_err)}"
+    logger.error(error_msg)
+    return RuntimeError(error_msg)
+
+
+def _error_event(e: BaseException) -> Dict:
+    code = "SERVICE_UNAVAILABLE" if isinstance(e, RuntimeError) else "INTERNAL_ERROR"
+    return {"event": "error", "data": {"error": str(e), "error_code": code}}
+
+
+def _stream_result(finish: Callable[[str], Dict], raw: str, field: str, sent: str) -> Dict:
+    """The response for a finished stream; cut-off or malformed JSON keeps the streamed `field` text."""
+    data = finish(raw)
+    if sent and data.get(field) == raw:
+        data[field] = sent
+    return data
+
+
+def _final_delta(data: Dict, field: str, sent: str) -> Optional[Dict]:
+    """The part of `field` not streamed yet (all of it if the model did not answer in JSON)."""
+    final_text = str(data.get(field) or "")
+    if final_text.startswith(sent) and len(final_text) > len(sent):
+        return {"event": "delta", "data": {"text": final_text[len(sent):]}}
+    return None
+
+
+def _chunk_delta(parts: List[Dict], part: Dict) -> Dict:
+    """Delta event for the next adapted chunk of a long document; appends it to `parts`."""
+    prefix = "\n\n" if parts else ""
+    parts.append(part)
+    return {"event": "delta", "data": {"text": prefix + str(part.get("content") or "").strip()}}
 
 
 class GeminiService:
@@ -266,11 +649,41 @@ class GeminiService:
         self._import_probe_done = False
         self._has_google_genai = False
         self._has_google_generativeai = False
-        self._request_count = 0
-        self._error_count = 0
-        self._cache_hits = 0
+        self.hedge_enabled = AI_HEDGE_ENABLED
+        # Updated from request threads and by AsyncGeminiService, only through count()
+        self._stats_lock = threading.Lock()
+        self._counters: Dict[str, int] = dict.fromkeys(_STATS_COUNTERS, 0)
         logger.info(f"GeminiService initialized with model: {model}")
 
+    def count(self, counter: str, amount: int = 1) -> None:
+        """Add `amount` to one of the _STATS_COUNTERS reported by get_stats."""
+        with self._stats_lock:
+            self._counters[counter] += amount
+
+    def record_qna_lookup(self, hit: bool) -> None:
+        """Count one Q&A cache lookup, so the Q&A hit ratio is visible."""
+        with self._stats_lock:
+            self._counters["qna_requests"] += 1
+            if hit:
+                self._counters["cache_hits"] += 1
+                self._counters["qna_cache_hits"] += 1
+
+    def record_call(self, key: str, mode: str, student_type: str, seconds: float,
+                    prompt: str, output: str, usage: Optional[Dict] = None) -> None:
+        """Record a successful blocking call for the hedge budget and the usage statistics."""
+        with _recent_latencies_lock:
+            _recent_latencies.append(seconds)
+        _usage_tracker.record(_key_label(key), mode, student_type, seconds, prompt, output, usage)
+
+    def quota_error(self, last_err: Optional[BaseException]) -> RuntimeError:
+        """Count and return the error for a request that found no key with quota in time."""
+        self.count("errors")
+        error_msg = f"No Gemini API key had quota left within {AI_KEY_MAX_WAIT_SECONDS:g}s"
+        if last_err:
+            error_msg += f" (last error: {str(last_err)})"
+        logger.error(error_msg)
+        return RuntimeError(error_msg)
+
     def _probe_imports(self) -> None:
         if self._import_probe_done:
             return
@@ -296,48 +709,144 @@ class GeminiService:
             "No Gemini client available. Please install 'google-genai' or 'google-generativeai'."
         )
 
-    def _generate_with_fallback(self, prompt: str, retry_attempts: int = 2) -> str:
-        keys = _load_api_keys()
-        if not keys:
-            error_msg = "No Gemini API keys configured. Set GEMINI_API_KEY (and optionally *_2..*_4) in backend/.env"
-            logger.error(error_msg)
-            raise RuntimeError(error_msg)
+    def _get_provider(self, api_key: str):
+        """Return the shared provider for this key, creating it on first use."""
+        pool_key = (api_key, self.model, self.temperature, self.max_tokens)
+        provider = _provider_pool.get(pool_key)
+        if provider is None:
+            with _provider_pool_lock:
+                provider = _provider_pool.get(pool_key)
+                if provider is None:
+                    provider = self._mk_provider(api_key)
+                    _provider_pool[pool_key] = provider
+        return provider
 
+    def _call_key(self, prompt: str, key: str, mode: str = "other", student_type: str = "") -> str:
+        provider = self._get_provider(key)
+        with _call_slot():
+            start = time.time()
+            with _key_scheduler.track(key):
+                result, usage = provider.generate_with_usage(prompt)
+            elapsed = time.time() - start
+        self.record_call(key, mode, student_type, elapsed, prompt, result, usage)
+        return result
+
+    def _acquire_key(self, candidates: Deque[str], tokens: int, deadline: float) -> Optional[str]:
+        """
+        Remove and return the first candidate with rate-limit quota for the
+        call, queueing while every candidate is at its limit. Returns None if
+        no quota frees up before `deadline`.
+        """
+        waited = False
+        while candidates:
+            key, delay = self._acquire_step(candidates, tokens, deadline, waited)
+            if delay is None:
+                return key
+            waited = True
+            time.sleep(delay)
+        return None
+
+    def _acquire_step(self, candidates: Deque[str], tokens: int, deadline: float,
+                      waited: bool) -> Tuple[Optional[str], Optional[float]]:
+        """
+        One pass of _acquire_key: (key, None) once a candidate has quota,
+        (None, None) if it would not free up before `deadline`, otherwise
+        (None, seconds to wait before the next pass).
+        """
+        key, delay = _key_scheduler.acquire(list(candidates), tokens)
+        if key is not None:
+            candidates.remove(key)
+            return key, None
+        if time.time() + delay > deadline:
+            self.count("quota_timeouts")
+            return None, None
+        if not waited:
+            self.count("quota_waits")
+            logger.info(f"All Gemini keys at their rate limit, queueing for {delay:.1f}s")
+        return None, delay
+
+    def _call_hedged(self, prompt: str, key: str, backups: Deque[str], tokens: int,
+                     mode: str = "other", student_type: str = "") -> Tuple[str, str]:
+        """
+        Call `key`; if it has not answered within the hedge budget, send the same
+        prompt on the next backup key with quota and return (result, key) of
+        whichever succeeds first. The other call is only waited for if the
+        first one fails; otherwise it is cancelled if not started yet, or left
+        to finish with its result ignored.
+        """
+        executor = _get_hedge_executor()
+        call = _bind_app_context(self._call_key)
+        pending = {executor.submit(call, prompt, key, mode, student_type): key}
+        done, _ = wait(pending, timeout=_hedge_delay())
+        backup = _key_scheduler.acquire(list(backups), tokens)[0] if not done and backups else None
+        if backup is not None:
+            backups.remove(backup)
+            self.count("hedges_fired")
+            logger.info("Hedging slow Gemini call on a second key")
+            pending[executor.submit(call, prompt, backup, mode, student_type)] = backup
+
+        last_err: Optional[Exception] = None
+        try:
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    used = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        last_err = e
+                        continue
+                    if used != key:
+                        self.count("hedges_won")
+                    return result, used
+        finally:
+            for future in pending:
+                future.cancel()
+        raise last_err
+
+    def _generate_with_fallback(self, prompt: str, retry_attempts: int = 2,
+                                mode: str = "other", student_type: str = "") -> str:
+        """
+        Generate with the best available key, falling back to the others.
+        `mode` and `student_type` only label the call in the usage statistics.
+        """
+        keys = _require_keys()
         last_err: Optional[Exception] = None
         start_time = time.time()
-        
+        tokens = estimate_tokens(prompt)
+        deadline = start_time + AI_KEY_MAX_WAIT_SECONDS
+
+        # Keys are tried best-first; rate-limited or failing keys sit out their
+        # cooldown instead of being retried after a sleep, and a call only goes
+        # out once its key has RPM/TPM quota left
         for attempt in range(retry_attempts):
-            for key_index, key in enumerate(keys):
+            candidates = _fallback_order(keys, attempt)
+            if not candidates:
+                break
+            while candidates:
+                key = self._acquire_key(candidates, tokens, deadline)
+                if key is None:
+                    raise self.quota_error(last_err)
+                key_index = keys.index(key)
                 try:
                     logger.info(f"Attempting generation with key {key_index + 1}, attempt {attempt + 1}")
-                    provider = self._mk_provider(key)
-                    result = provider.generate(prompt)
+                    if self.hedge_enabled and candidates:
+                        result, key = self._call_hedged(prompt, key, candidates, tokens, mode, student_type)
+                    else:
+                        result = self._call_key(prompt, key, mode, student_type)
                     
                     elapsed_time = time.time() - start_time
-                    logger.info(f"Generation successful in {elapsed_time:.2f}s using key {key_index + 1}")
+                    logger.info(f"Generation successful in {elapsed_time:.2f}s using key {keys.index(key) + 1}")
                     return result
                     
                 except Exception as e:
                     last_err = e
                     logger.warning(f"Key {key_index + 1} failed on attempt {attempt + 1}: {str(e)}")
-                    
-                    # Add small delay before trying next key
-                    if key_index < len(keys) - 1:
-                        time.sleep(0.5)
                     continue
-            
-            # Add delay before retry attempt
-            if attempt < retry_attempts - 1:
-                logger.info(f"All keys failed on attempt {attempt + 1}, retrying in 1 second...")
-                time.sleep(1)
         
         # If all attempts failed
-        self._error_count += 1
-        error_msg = f"All Gemini API keys failed after {retry_attempts} attempts"
-        if last_err:
-            error_msg += f": {str(last_err)}"
-        logger.error(error_msg)
-        raise RuntimeError(error_msg)
+        self.count("errors")
+        raise _keys_failed_error(f"All Gemini API keys failed after {retry_attempts} attempts", last_err)
 
     def _notes_prompt(self, text: str, student_type: str) -> str:
         st = _normalize_student_type(student_type)
@@ -376,45 +885,314 @@ class GeminiService:
             "Do not include any text outside of JSON. No markdown, no code fences."
         )
 
-    def generate_adaptive_notes(self, text: str, student_type: str) -> Dict:
-        """Generate adaptive notes with caching and validation."""
+    def _wait_for_flight(self, flight: _Flight) -> Optional[Dict]:
+        """Result of another caller's generation; None if it did not finish in time."""
+        self.count("coalesced")
+        if not flight.done.wait(AI_SINGLE_FLIGHT_WAIT_SECONDS):
+            logger.warning("Timed out waiting for an identical in-flight request, generating separately")
+            return None
+        if flight.error is not None:
+            raise flight.error
+        return json.loads(flight.payload) if flight.payload is not None else None
+
+    def _single_flight(self, cache_key: str, produce) -> Dict:
+        """Run `produce` once per cache key at a time; concurrent callers share its result."""
+        with _inflight_lock:
+            flight = _inflight.get(cache_key)
+            leader = flight is None
+            if leader:
+                flight = _inflight[cache_key] = _Flight()
+
+        if not leader:
+            logger.info(f"Joining in-flight request for key: {cache_key[:8]}...")
+            data = self._wait_for_flight(flight)
+            return data if data is not None else produce()
+
+        try:
+            # The previous leader may have filled the cache just before we took over
+            data = _get_cached_response(cache_key) or produce()
+            flight.payload = json.dumps(data, default=str)
+            return data
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with _inflight_lock:
+                _inflight.pop(cache_key, None)
+            flight.done.set()
+
+    def _flight_events(self, flight: _Flight, field: str, restart) -> Iterator[Dict]:
+        """Stream events for a caller that joined an in-flight blocking generation."""
+        try:
+            data = self._wait_for_flight(flight)
+        except Exception as e:
+            yield _error_event(e)
+            return
+        if data is None:
+            yield from restart()
+        else:
+            yield from self._cached_events(data, field)
+
+    def _lookup_qna(self, cache_key: str) -> Optional[Dict]:
+        """Cache lookup for Q&A, counted separately so the Q&A hit ratio is visible."""
+        cached_response = _get_cached_response(cache_key)
+        self.record_qna_lookup(cached_response is not None)
+        return cached_response
+
+    def _notes_request(self, text: str, student_type: str, text_hash: Optional[str] = None) -> Tuple[str, str, str]:
+        """Validated (text, student_type, cache_key) of a notes request; long texts are kept whole."""
+        text = validate_input(text, "'text'", MAX_DOCUMENT_LENGTH, MIN_TEXT_LENGTH, truncate=False)
+        student_type = _normalize_student_type(student_type)
+        return text, student_type, _notes_cache_key(student_type, text, text_hash)
+
+    def _qna_request(self, notes: str, student_type: str, question: str,
+                     notes_hash: Optional[str] = None) -> Tuple[str, str, str, str]:
+        """Validated (notes, question, student_type, cache_key) of a Q&A request."""
+        notes = validate_input(notes, "'notes'", MAX_DOCUMENT_LENGTH, MIN_TEXT_LENGTH)
+        question = validate_input(question, "'question'", MAX_QUESTION_LENGTH, MIN_TEXT_LENGTH)
+        student_type = _normalize_student_type(student_type)
+        return notes, question, student_type, _qna_cache_key(student_type, notes, question, notes_hash)
+
+    def _qna_context(self, notes: str, question: str, index: Optional[Dict]) -> str:
+        """The part of `notes` to put in a Q&A prompt (at most MAX_TEXT_LENGTH characters)."""
+        context = select_context(notes, question, index)
+        if context is None:
+            if len(notes) > MAX_TEXT_LENGTH:
+                logger.warning(f"'notes' truncated from {len(notes)} to {MAX_TEXT_LENGTH} characters")
+            return notes[:MAX_TEXT_LENGTH]
+        logger.info(f"Q&A context reduced from {len(notes)} to {len(context)} characters")
+        return context[:MAX_TEXT_LENGTH]
+
+    def _with_metadata(self, data: Dict, start_time: float) -> Dict:
+        data["_metadata"] = {
+            "generated_at": datetime.utcnow().isoformat(),
+            "processing_time": round(time.time() - start_time, 2),
+            "model": self.model
+        }
+        return data
+
+    def _notes_result(self, raw: str, student_type: str, start_time: float) -> Dict:
+        data = _safe_json_extract(raw)
+        # Ensure standard fields
+        data.setdefault("studentType", student_type)
+        data.setdefault("tips", "")
+        if "content" not in data:
+            # fallback if model didn't comply
+            data["content"] = raw
+        return self._with_metadata(data, start_time)
+
+    def _qna_result(self, raw: str, student_type: str, start_time: float) -> Dict:
+        data = _safe_json_extract(raw)
+        # Ensure standard fields
+        data.setdefault("studentType", student_type)
+        data.setdefault("tips", "")
+        data.setdefault("steps", "")
+        if "answer" not in data:
+            data["answer"] = raw
+        return self._with_metadata(data, start_time)
+
+    def _stream_with_fallback(self, prompt: str, mode: str = "other", student_type: str = "") -> Iterator[str]:
+        """
+        Stream raw model output. Keys are tried in scheduler order until one
+        produces its first chunk; after that the stream is tied to that key.
+        """
+        keys = _require_keys()
+        last_err: Optional[Exception] = None
+        tokens = estimate_tokens(prompt)
+        deadline = time.time() + AI_KEY_MAX_WAIT_SECONDS
+        candidates = _fallback_order(keys, 0)
+        while candidates:
+            key = self._acquire_key(candidates, tokens, deadline)
+            if key is None:
+                raise self.quota_error(last_err)
+            key_index = keys.index(key)
+            started = False
+            usage: Dict = {}
+            parts: List[str] = []
+            try:
+                provider = self._get_provider(key)
+                start = time.time()
+                with _key_scheduler.track(key):
+                    for chunk in provider.generate_stream(prompt, usage):
+                        started = True
+                        parts.append(chunk)
+                        yield chunk
+                _usage_tracker.record(
+                    _key_label(key), mode, student_type, time.time() - start, prompt, "".join(parts), usage
+                )
+                return
+            except Exception as e:
+                if started:
+                    raise
+                last_err = e
+                logger.warning(f"Key {key_index + 1} failed to start streaming: {str(e)}")
+
+        raise _keys_failed_error("All Gemini API keys failed to stream", last_err)
+
+    def _stream_events(self, prompt: str, field: str, cache_key: str, finish, start_time: float,
+                       mode: str = "other", student_type: str = "") -> Iterator[Dict]:
+        """
+        Yield {"event": "delta", "data": {"text"}} while `field` is generated,
+        then {"event": "result", "data": <full response>}; failures after the
+        stream has started are reported as {"event": "error"}.
+        """
+        streamer = _JsonFieldStreamer(field)
+        raw_parts: List[str] = []
+        sent = ""
+        try:
+            for chunk in self._stream_with_fallback(prompt, mode, student_type):
+                raw_parts.append(chunk)
+                text = streamer.feed(chunk)
+                if text:
+                    sent += text
+                    yield {"event": "delta", "data": {"text": text}}
+            data = _stream_result(finish, "".join(raw_parts), field, sent)
+        except Exception as e:
+            self.count("errors")
+            logger.error(f"Error streaming {field}: {str(e)}")
+            yield _error_event(e)
+            return
+
+        rest = _final_delta(data, field, sent)
+        if rest:
+            yield rest
+        _set_cached_response(cache_key, data)
+        logger.info(f"Streamed {field} in {time.time() - start_time:.2f}s")
+        yield {"event": "result", "data": data}
+
+    def _cached_events(self, data: Dict, field: str) -> Iterator[Dict]:
+        yield {"event": "delta", "data": {"text": str(data.get(field) or "")}}
+        yield {"event": "result", "data": data}
+
+    def stream_adaptive_notes(self, text: str, student_type: str, text_hash: Optional[str] = None) -> Iterator[Dict]:
+        """
+        Streaming variant of generate_adaptive_notes. Inputs are validated
+        before returning (ValueError), so callers can still answer 400.
+        """
+        start_time = time.time()
+        self.count("requests")
+        text, student_type, cache_key = self._notes_request(text, student_type, text_hash)
+        prompt = self._notes_prompt(text, student_type)
+        cached_response = _get_cached_response(cache_key)
+        if cached_response:
+            self.count("cache_hits")
+            return self._cached_events(cached_response, "content")
+        if len(text) > MAX_TEXT_LENGTH:
+            restart = partial(self._stream_chunked_notes, text, student_type, cache_key, start_time)
+        else:
+            finish = partial(self._notes_result, student_type=student_type, start_time=start_time)
+            restart = partial(
+                self._stream_events, prompt, "content", cache_key, finish, start_time, "notes", student_type
+            )
+        flight = _inflight.get(cache_key)
+        if flight is not None:
+            return self._flight_events(flight, "content", restart)
+        return restart()
+
+    def stream_adaptive_qna(self, notes: str, student_type: str, question: str, index: Optional[Dict] = None,
+                            notes_hash: Optional[str] = None) -> Iterator[Dict]:
+        """Streaming variant of generate_adaptive_qna; see stream_adaptive_notes."""
+        start_time = time.time()
+        self.count("requests")
+        notes, question, student_type, cache_key = self._qna_request(notes, student_type, question, notes_hash)
+        cached_response = self._lookup_qna(cache_key)
+        if cached_response:
+            return self._cached_events(cached_response, "answer")
+        prompt = self._qna_prompt(self._qna_context(notes, question, index), student_type, question)
+        finish = partial(self._qna_result, student_type=student_type, start_time=start_time)
+        restart = partial(self._stream_events, prompt, "answer", cache_key, finish, start_time, "qna", student_type)
+        flight = _inflight.get(cache_key)
+        if flight is not None:
+            return self._flight_events(flight, "answer", restart)
+        return restart()
+
+    def _adapt_chunks(self, chunks: List[str], student_type: str) -> Iterator[Dict]:
+        """Adapt chunks concurrently, yielding each chunk's result in document order."""
+        adapt = _bind_app_context(lambda chunk: self.generate_adaptive_notes(chunk, student_type))
+        workers = max(1, min(AI_CHUNK_CONCURRENCY, len(chunks)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ai-chunk") as pool:
+            futures = [pool.submit(adapt, chunk) for chunk in chunks]
+            try:
+                for future in futures:
+                    yield future.result()
+            finally:
+                for future in futures:
+                    future.cancel()
+
+    def _notes_chunks(self, text: str, student_type: str) -> List[str]:
+        """The chunks a long document is adapted in, after checking the student type."""
+        if student_type not in ADAPTATION_GUIDELINES:
+            raise ValueError(f"Invalid studentType '{student_type}'. Allowed: vision, hearing, speech, dyslexie")
+        chunks = split_for_adaptation(text, MAX_TEXT_LENGTH)
+        logger.info(f"Adapting {len(text)} characters as {len(chunks)} chunks")
+        return chunks
+
+    def _stitch_chunks(self, parts: List[Dict], student_type: str, start_time: float) -> Dict:
+        tips: List[str] = []
+        for part in parts:
+            tip = str(part.get("tips") or "").strip()
+            if tip and tip not in tips:
+                tips.append(tip)
+        data = {
+            "content": "\n\n".join(str(part.get("content") or "").strip() for part in parts),
+            "tips": "\n".join(tips),
+            "studentType": student_type,
+        }
+        self._with_metadata(data, start_time)
+        data["_metadata"]["chunks"] = len(parts)
+        return data
+
+    def _map_reduce_notes(self, text: str, student_type: str, start_time: float) -> Dict:
+        """Adapt a document longer than MAX_TEXT_LENGTH chunk by chunk (see split_for_adaptation)."""
+        chunks = self._notes_chunks(text, student_type)
+        return self._stitch_chunks(list(self._adapt_chunks(chunks, student_type)), student_type, start_time)
+
+    def _stream_chunked_notes(self, text: str, student_type: str, cache_key: str, start_time: float) -> Iterator[Dict]:
+        """Stream a long document as one delta per adapted chunk, in order."""
+        parts: List[Dict] = []
+        try:
+            for part in self._adapt_chunks(split_for_adaptation(text, MAX_TEXT_LENGTH), student_type):
+                yield _chunk_delta(parts, part)
+            data = self._stitch_chunks(parts, student_type, start_time)
+        except Exception as e:
+            logger.error(f"Error streaming chunked notes: {str(e)}")
+            yield _error_event(e)
+            return
+        _set_cached_response(cache_key, data)
+        yield {"event": "result", "data": data}
+
+    def generate_adaptive_notes(self, text: str, student_type: str, text_hash: Optional[str] = None) -> Dict:
+        """
+        Generate adaptive notes with caching and validation. `text_hash` is the
+        content_hash of `text` when the caller already has it.
+        """
         start_time = time.time()
-        self._request_count += 1
+        self.count("requests")
         
         try:
-            # Validate inputs
-            text = validate_input(text, "'text'", MAX_TEXT_LENGTH, MIN_TEXT_LENGTH)
-            student_type = _normalize_student_type(student_type)
+            # Validate inputs (long documents are chunked below, never truncated)
+            text, student_type, cache_key = self._notes_request(text, student_type, text_hash)
             
             # Check cache first
-            cache_key = _get_cache_key("notes", student_type=student_type, text=text)
             cached_response = _get_cached_response(cache_key)
             if cached_response:
-                self._cache_hits += 1
+                self.count("cache_hits")
                 logger.info(f"Returning cached response for notes request")
                 return cached_response
             
-            # Generate new response
-            prompt = self._notes_prompt(text, student_type)
-            raw = self._generate_with_fallback(prompt)
-            data = _safe_json_extract(raw)
-            
-            # Ensure standard fields
-            data.setdefault("studentType", student_type)
-            data.setdefault("tips", "")
-            if "content" not in data:
-                # fallback if model didn't comply
-                data["content"] = raw
-            
-            # Add metadata
-            data["_metadata"] = {
-                "generated_at": datetime.utcnow().isoformat(),
-                "processing_time": round(time.time() - start_time, 2),
-                "model": self.model
-            }
-            
-            # Cache the response
-            _set_cached_response(cache_key, data)
+            # Generate new response; identical concurrent requests share one call
+            def produce() -> Dict:
+                if len(text) > MAX_TEXT_LENGTH:
+                    data = self._map_reduce_notes(text, student_type, start_time)
+                else:
+                    prompt = self._notes_prompt(text, student_type)
+                    raw = self._generate_with_fallback(prompt, mode="notes", student_type=student_type)
+                    data = self._notes_result(raw, student_type, start_time)
+                # Cache the response
+                _set_cached_response(cache_key, data)
+                return data
+
+            data = self._single_flight(cache_key, produce)
             
             elapsed_time = time.time() - start_time
             logger.info(f"Notes generated successfully in {elapsed_time:.2f}s for student type: {student_type}")
@@ -422,50 +1200,42 @@ class GeminiService:
             return data
             
         except Exception as e:
-            self._error_count += 1
+            self.count("errors")
             logger.error(f"Error generating adaptive notes: {str(e)}")
             raise
 
-    def generate_adaptive_qna(self, notes: str, student_type: str, question: str) -> Dict:
-        """Generate Q&A response with caching and validation."""
+    def generate_adaptive_qna(self, notes: str, student_type: str, question: str, index: Optional[Dict] = None,
+                              notes_hash: Optional[str] = None) -> Dict:
+        """
+        Generate Q&A response with caching and validation.
+
+        For long notes only the passages most relevant to the question are sent
+        to the model; `index` is the note's stored qnaIndex and `notes_hash` the
+        stored content hash of `notes`, if any.
+        """
         start_time = time.time()
-        self._request_count += 1
+        self.count("requests")
         
         try:
             # Validate inputs
-            notes = validate_input(notes, "'notes'", MAX_TEXT_LENGTH, MIN_TEXT_LENGTH)
-            question = validate_input(question, "'question'", MAX_QUESTION_LENGTH, MIN_TEXT_LENGTH)
-            student_type = _normalize_student_type(student_type)
+            notes, question, student_type, cache_key = self._qna_request(notes, student_type, question, notes_hash)
             
             # Check cache first
-            cache_key = _get_cache_key("qna", student_type=student_type, notes=notes, question=question)
-            cached_response = _get_cached_response(cache_key)
+            cached_response = self._lookup_qna(cache_key)
             if cached_response:
-                self._cache_hits += 1
                 logger.info(f"Returning cached response for Q&A request")
                 return cached_response
             
-            # Generate new response
-            prompt = self._qna_prompt(notes, student_type, question)
-            raw = self._generate_with_fallback(prompt)
-            data = _safe_json_extract(raw)
-            
-            # Ensure standard fields
-            data.setdefault("studentType", student_type)
-            data.setdefault("tips", "")
-            data.setdefault("steps", "")
-            if "answer" not in data:
-                data["answer"] = raw
-            
-            # Add metadata
-            data["_metadata"] = {
-                "generated_at": datetime.utcnow().isoformat(),
-                "processing_time": round(time.time() - start_time, 2),
-                "model": self.model
-            }
-            
-            # Cache the response
-            _set_cached_response(cache_key, data)
+            # Generate new response; identical concurrent requests share one call
+            def produce() -> Dict:
+                prompt = self._qna_prompt(self._qna_context(notes, question, index), student_type, question)
+                raw = self._generate_with_fallback(prompt, mode="qna", student_type=student_type)
+                data = self._qna_result(raw, student_type, start_time)
+                # Cache the response
+                _set_cached_response(cache_key, data)
+                return data
+
+            data = self._single_flight(cache_key, produce)
             
             elapsed_time = time.time() - start_time
             logger.info(f"Q&A generated successfully in {elapsed_time:.2f}s for student type: {student_type}")
@@ -473,18 +1243,111 @@ class GeminiService:
             return data
             
         except Exception as e:
-            self._error_count += 1
+            self.count("errors")
             logger.error(f"Error generating Q&A response: {str(e)}")
             raise
     
+    def _batch_cache_key(self, item: Dict) -> str:
+        """Validate one batch item the way the single-item methods do and return its cache key."""
+        if item.get("mode") not in ("notes", "qna"):
+            raise ValueError("Invalid 'mode'. Must be 'notes' or 'qna'.")
+        student_type = _normalize_student_type(item.get("studentType", ""))
+        if student_type not in ADAPTATION_GUIDELINES:
+            raise ValueError(f"Invalid studentType '{item.get('studentType')}'. Allowed: vision, hearing, speech, dyslexie")
+        if item["mode"] == "notes":
+            text = validate_input(item.get("text", ""), "'text'", MAX_DOCUMENT_LENGTH, MIN_TEXT_LENGTH, truncate=False)
+            return _notes_cache_key(student_type, text)
+        notes = validate_input(item.get("notes", ""), "'notes'", MAX_DOCUMENT_LENGTH, MIN_TEXT_LENGTH)
+        question = validate_input(item.get("question", ""), "'question'", MAX_QUESTION_LENGTH, MIN_TEXT_LENGTH)
+        return _qna_cache_key(student_type, notes, question)
+
+    def _generate_item(self, item: Dict) -> Dict:
+        if item["mode"] == "notes":
+            return self.generate_adaptive_notes(text=item.get("text", ""), student_type=item.get("studentType", ""))
+        return self.generate_adaptive_qna(
+            notes=item.get("notes", ""), student_type=item.get("studentType", ""), question=item.get("question", "")
+        )
+
+    def generate_batch(self, items: List[Dict], max_workers: int = AI_BATCH_CONCURRENCY) -> List[Dict]:
+        """
+        Generate several notes/qna items (dicts shaped like /api/ai bodies).
+
+        Cached items are answered first without using a worker; the rest run
+        concurrently, at most `max_workers` at a time. Returns one entry per
+        item in input order: {"status": "ok", "cached", "result"} or
+        {"status": "error", "error", "error_code"}.
+        """
+        results: List[Optional[Dict]] = [None] * len(items)
+        misses: List[int] = []
+        for index, item in enumerate(items):
+            try:
+                cache_key = self._batch_cache_key(item)
+            except ValueError as e:
+                results[index] = {"status": "error", "error": str(e), "error_code": "VALIDATION_ERROR"}
+                continue
+            # Only hits are counted here; a miss is counted by the lookup of
+            # the generate_* call that answers it
+            cached = _get_cached_response(cache_key)
+            if cached is not None:
+                if item["mode"] == "qna":
+                    self.record_qna_lookup(True)
+                else:
+                    self.count("cache_hits")
+                self.count("requests")
+                results[index] = {"status": "ok", "cached": True, "result": cached}
+            else:
+                misses.append(index)
+
+        run = _bind_app_context(lambda index: self._generate_item(items[index]))
+        if misses:
+            with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(misses))), thread_name_prefix="ai-batch") as pool:
+                futures = {pool.submit(run, index): index for index in misses}
+                for future, index in futures.items():
+                    try:
+                        results[index] = {"status": "ok", "cached": False, "result": future.result()}
+                    except ValueError as e:
+                        results[index] = {"status": "error", "error": str(e), "error_code": "VALIDATION_ERROR"}
+                    except RuntimeError as e:
+                        results[index] = {"status": "error", "error": str(e), "error_code": "SERVICE_UNAVAILABLE"}
+                    except Exception as e:
+                        logger.error(f"Batch item {index} failed: {str(e)}", exc_info=True)
+                        results[index] = {"status": "error", "error": f"Server error: {str(e)}", "error_code": "INTERNAL_ERROR"}
+
+        logger.info(f"Batch of {len(items)} items: {len(items) - len(misses)} answered without generation")
+        return results
+
     def get_stats(self) -> Dict:
         """Get service statistics."""
+        with self._stats_lock:
+            counters = dict(self._counters)
         return {
-            "total_requests": self._request_count,
-            "total_errors": self._error_count,
-            "cache_hits": self._cache_hits,
+            "total_requests": counters["requests"],
+            "total_errors": counters["errors"],
+            "cache_hits": counters["cache_hits"],
             "cache_size": len(_response_cache),
-            "error_rate": round(self._error_count / max(1, self._request_count), 3)
+            "coalesced_requests": counters["coalesced"],
+            "qna": {
+                "requests": counters["qna_requests"],
+                "cache_hits": counters["qna_cache_hits"],
+                "hit_rate": round(counters["qna_cache_hits"] / max(1, counters["qna_requests"]), 3),
+            },
+            "cache": _response_cache.stats(),
+            "keys": _key_scheduler.stats(_load_api_keys()),
+            "hedging": {
+                "enabled": self.hedge_enabled,
+                "hedges_fired": counters["hedges_fired"],
+                "hedges_won": counters["hedges_won"],
+                "delay_seconds": round(_hedge_delay(), 3),
+            },
+            "rate_limit": {
+                "rpm_per_key": _key_scheduler.rpm or None,
+                "tpm_per_key": _key_scheduler.tpm or None,
+                "max_wait_seconds": AI_KEY_MAX_WAIT_SECONDS,
+                "queued_requests": counters["quota_waits"],
+                "quota_timeouts": counters["quota_timeouts"],
+            },
+            "usage": _usage_tracker.snapshot(),
+            "error_rate": round(counters["errors"] / max(1, counters["requests"]), 3)
         }
     
     def health_check(self) -> Dict:
@@ -514,3 +1377,17 @@ class GeminiService:
                 "status": "unhealthy",
                 "error": str(e)
             }
+
+
+_service_instance: Optional[GeminiService] = None
+_service_lock = threading.Lock()
+
+
+def get_gemini_service() -> GeminiService:
+    """Process-wide GeminiService, so providers and request statistics are shared."""
+    global _service_instance
+    if _service_instance is None:
+        with _service_lock:
+            if _service_instance is None:
+                _service_instance = GeminiService()
+    return _service_instance
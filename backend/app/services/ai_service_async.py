@@ -0,0 +1,470 @@
+"""
+Asyncio twin of GeminiService, used by the ASGI entry point (app/asgi.py).
+
+Gemini is called through the google-genai async client (client.aio), so a
+request waiting on the model holds no OS thread. Validation, prompts, cache
+keys, the response cache, key scheduling and statistics are shared with the
+thread-based GeminiService, whose count()/record_*() methods keep the
+counters; /api/ai/stats reports both.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import time
+from functools import partial
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from .ai_keys import AI_KEY_MAX_WAIT_SECONDS, estimate_tokens
+from .ai_service import (
+    AI_CHUNK_CONCURRENCY,
+    AI_SINGLE_FLIGHT_WAIT_SECONDS,
+    MAX_TEXT_LENGTH,
+    GeminiService,
+    _JsonFieldStreamer,
+    _chunk_delta,
+    _error_event,
+    _fallback_order,
+    _final_delta,
+    _get_cached_response,
+    _hedge_delay,
+    _key_label,
+    _key_scheduler,
+    _keys_failed_error,
+    _require_keys,
+    _response_text,
+    _response_usage,
+    _set_cached_response,
+    _stream_result,
+    _usage_tracker,
+    get_gemini_service,
+    split_for_adaptation,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+def async_client_available() -> bool:
+    """True if google-genai (which provides client.aio) is installed."""
+    try:
+        from google import genai  # noqa: F401
+    except Exception:
+        return False
+    return True
+
+
+class _AsyncGoogleGenAIProvider:
+    """Provider using the async client of the google-genai SDK (client.aio)."""
+
+    def __init__(self, api_key: str, model: str, temperature: float = 0.4, max_tokens: int = 2048):
+        from google import genai  # type: ignore
+
+        # Keep the sync client referenced; its .aio view shares the same configuration
+        self._sync_client = genai.Client(api_key=api_key)
+        self._client = self._sync_client.aio
+        self._model = model
+        self._config = {"temperature": temperature, "max_output_tokens": max_tokens}
+
+    async def generate(self, prompt: str) -> str:
+        return (await self.generate_with_usage(prompt))[0]
+
+    async def generate_with_usage(self, prompt: str) -> Tuple[str, Dict]:
+        resp = await self._client.models.generate_content(model=self._model, contents=prompt, config=self._config)
+        return _response_text(resp), _response_usage(resp)
+
+    async def generate_stream(self, prompt: str, usage: Optional[Dict] = None) -> AsyncIterator[str]:
+        """Yield text chunks; token counts reported by the chunks are stored in `usage`."""
+        stream = await self._client.models.generate_content_stream(
+            model=self._model, contents=prompt, config=self._config
+        )
+        async for chunk in stream:
+            _response_usage(chunk, usage)
+            text = getattr(chunk, "text", None)
+            if text:
+                yield text
+
+
+class AsyncGeminiService:
+    """
+    Async counterpart of GeminiService with the same methods as coroutines.
+
+    Intended for one event loop per process (one ASGI worker). Blocking work,
+    i.e. the disk/Mongo cache layers and passage selection for long notes, runs
+    in the default executor so the loop stays free.
+    """
+
+    def __init__(self, service: Optional[GeminiService] = None):
+        # Shared with the thread-based routes so statistics cover both
+        self._base = service or get_gemini_service()
+        self._providers: Dict[str, _AsyncGoogleGenAIProvider] = {}
+        self._inflight: Dict[str, "asyncio.Future[str]"] = {}
+
+    def _mk_provider(self, api_key: str) -> _AsyncGoogleGenAIProvider:
+        if not async_client_available():
+            raise RuntimeError("Async Gemini calls need the 'google-genai' package.")
+        return _AsyncGoogleGenAIProvider(api_key, self._base.model, self._base.temperature, self._base.max_tokens)
+
+    def _get_provider(self, api_key: str) -> _AsyncGoogleGenAIProvider:
+        provider = self._providers.get(api_key)
+        if provider is None:
+            provider = self._providers[api_key] = self._mk_provider(api_key)
+        return provider
+
+    async def _call_key(self, prompt: str, key: str, mode: str = "other", student_type: str = "") -> str:
+        provider = self._get_provider(key)
+        start = time.time()
+        with _key_scheduler.track(key):
+            result, usage = await provider.generate_with_usage(prompt)
+        self._base.record_call(key, mode, student_type, time.time() - start, prompt, result, usage)
+        return result
+
+    async def _acquire_key(self, candidates: Deque[str], tokens: int, deadline: float) -> Optional[str]:
+        """See GeminiService._acquire_key; queueing does not block the event loop."""
+        waited = False
+        while candidates:
+            key, delay = self._base._acquire_step(candidates, tokens, deadline, waited)
+            if delay is None:
+                return key
+            waited = True
+            await asyncio.sleep(delay)
+        return None
+
+    async def _call_hedged(self, prompt: str, key: str, backups: Deque[str], tokens: int,
+                           mode: str = "other", student_type: str = "") -> Tuple[str, str]:
+        """See GeminiService._call_hedged; here the slower call is cancelled."""
+        pending = {asyncio.ensure_future(self._call_key(prompt, key, mode, student_type)): key}
+        done, _ = await asyncio.wait(pending, timeout=_hedge_delay())
+        backup = _key_scheduler.acquire(list(backups), tokens)[0] if not done and backups else None
+        if backup is not None:
+            backups.remove(backup)
+            self._base.count("hedges_fired")
+            logger.info("Hedging slow Gemini call on a second key")
+            pending[asyncio.ensure_future(self._call_key(prompt, backup, mode, student_type))] = backup
+
+        last_err: Optional[BaseException] = None
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    used = pending.pop(task)
+                    if task.exception() is not None:
+                        last_err = task.exception()
+                        continue
+                    if used != key:
+                        self._base.count("hedges_won")
+                    return task.result(), used
+        finally:
+            for task in pending:
+                task.cancel()
+        raise last_err
+
+    async def _generate_with_fallback(self, prompt: str, retry_attempts: int = 2,
+                                      mode: str = "other", student_type: str = "") -> str:
+        """See GeminiService._generate_with_fallback."""
+        keys = _require_keys()
+        last_err: Optional[BaseException] = None
+        start_time = time.time()
+        tokens = estimate_tokens(prompt)
+        deadline = start_time + AI_KEY_MAX_WAIT_SECONDS
+        for attempt in range(retry_attempts):
+            candidates = _fallback_order(keys, attempt)
+            while candidates:
+                key = await self._acquire_key(candidates, tokens, deadline)
+                if key is None:
+                    raise self._base.quota_error(last_err)
+                key_index = keys.index(key)
+                try:
+                    logger.info(f"Attempting async generation with key {key_index + 1}, attempt {attempt + 1}")
+                    if self._base.hedge_enabled and candidates:
+                        result, key = await self._call_hedged(prompt, key, candidates, tokens, mode, student_type)
+                    else:
+                        result = await self._call_key(prompt, key, mode, student_type)
+                    logger.info(f"Generation successful in {time.time() - start_time:.2f}s using key {keys.index(key) + 1}")
+                    return result
+                except Exception as e:
+                    last_err = e
+                    logger.warning(f"Key {key_index + 1} failed on attempt {attempt + 1}: {str(e)}")
+
+        self._base.count("errors")
+        raise _keys_failed_error(f"All Gemini API keys failed after {retry_attempts} attempts", last_err)
+
+    async def _cached(self, cache_key: str) -> Optional[Dict]:
+        return await asyncio.to_thread(_get_cached_response, cache_key)
+
+    async def _store(self, cache_key: str, data: Dict) -> None:
+        await asyncio.to_thread(_set_cached_response, cache_key, data)
+
+    async def _wait_for_flight(self, flight: "asyncio.Future[str]") -> Optional[Dict]:
+        """Result of another request's generation; None if it did not finish in time or was cancelled."""
+        self._base.count("coalesced")
+        try:
+            payload = await asyncio.wait_for(asyncio.shield(flight), AI_SINGLE_FLIGHT_WAIT_SECONDS)
+        except asyncio.TimeoutError:
+            logger.warning("Timed out waiting for an identical in-flight request, generating separately")
+            return None
+        except asyncio.CancelledError:
+            if not flight.cancelled():
+                raise
+            return None
+        return json.loads(payload)
+
+    async def _single_flight(self, cache_key: str, produce: Callable[[], Awaitable[Dict]]) -> Dict:
+        """Run `produce` once per cache key at a time; concurrent callers share its result."""
+        flight = self._inflight.get(cache_key)
+        if flight is not None:
+            logger.info(f"Joining in-flight request for key: {cache_key[:8]}...")
+            data = await self._wait_for_flight(flight)
+            return data if data is not None else await produce()
+
+        flight = self._inflight[cache_key] = asyncio.get_running_loop().create_future()
+        try:
+            # The previous leader may have filled the cache just before we took over
+            data = await self._cached(cache_key) or await produce()
+            flight.set_result(json.dumps(data, default=str))
+            return data
+        except asyncio.CancelledError:
+            flight.cancel()
+            raise
+        except Exception as e:
+            flight.set_exception(e)
+            # Mark the exception as retrieved in case nobody joined
+            flight.exception()
+            raise
+        finally:
+            self._inflight.pop(cache_key, None)
+
+    async def _lookup_qna(self, cache_key: str) -> Optional[Dict]:
+        return await asyncio.to_thread(self._base._lookup_qna, cache_key)
+
+    def _adapt_chunks(self, chunks: List[str], student_type: str) -> List["asyncio.Task[Dict]"]:
+        """Start adapting every chunk, at most AI_CHUNK_CONCURRENCY at a time; tasks are in document order."""
+        slots = asyncio.Semaphore(max(1, AI_CHUNK_CONCURRENCY))
+
+        async def adapt(chunk: str) -> Dict:
+            async with slots:
+                return await self.generate_adaptive_notes(chunk, student_type)
+
+        return [asyncio.ensure_future(adapt(chunk)) for chunk in chunks]
+
+    async def _map_reduce_notes(self, text: str, student_type: str, start_time: float) -> Dict:
+        tasks = self._adapt_chunks(self._base._notes_chunks(text, student_type), student_type)
+        try:
+            parts = await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+        return self._base._stitch_chunks(list(parts), student_type, start_time)
+
+    async def generate_adaptive_notes(self, text: str, student_type: str, text_hash: Optional[str] = None) -> Dict:
+        """Async GeminiService.generate_adaptive_notes."""
+        start_time = time.time()
+        self._base.count("requests")
+        try:
+            text, student_type, cache_key = self._base._notes_request(text, student_type, text_hash)
+            cached_response = await self._cached(cache_key)
+            if cached_response:
+                self._base.count("cache_hits")
+                return cached_response
+
+            async def produce() -> Dict:
+                if len(text) > MAX_TEXT_LENGTH:
+                    data = await self._map_reduce_notes(text, student_type, start_time)
+                else:
+                    raw = await self._generate_with_fallback(
+                        self._base._notes_prompt(text, student_type), mode="notes", student_type=student_type
+                    )
+                    data = self._base._notes_result(raw, student_type, start_time)
+                await self._store(cache_key, data)
+                return data
+
+            data = await self._single_flight(cache_key, produce)
+            logger.info(f"Notes generated successfully in {time.time() - start_time:.2f}s for student type: {student_type}")
+            return data
+        except Exception as e:
+            self._base.count("errors")
+            logger.error(f"Error generating adaptive notes: {str(e)}")
+            raise
+
+    async def generate_adaptive_qna(self, notes: str, student_type: str, question: str,
+                                    index: Optional[Dict] = None, notes_hash: Optional[str] = None) -> Dict:
+        """Async GeminiService.generate_adaptive_qna."""
+        start_time = time.time()
+        self._base.count("requests")
+        try:
+            notes, question, student_type, cache_key = self._base._qna_request(notes, student_type, question, notes_hash)
+            cached_response = await self._lookup_qna(cache_key)
+            if cached_response:
+                return cached_response
+
+            async def produce() -> Dict:
+                context = await asyncio.to_thread(self._base._qna_context, notes, question, index)
+                raw = await self._generate_with_fallback(
+                    self._base._qna_prompt(context, student_type, question), mode="qna", student_type=student_type
+                )
+                data = self._base._qna_result(raw, student_type, start_time)
+                await self._store(cache_key, data)
+                return data
+
+            data = await self._single_flight(cache_key, produce)
+            logger.info(f"Q&A generated successfully in {time.time() - start_time:.2f}s for student type: {student_type}")
+            return data
+        except Exception as e:
+            self._base.count("errors")
+            logger.error(f"Error generating Q&A response: {str(e)}")
+            raise
+
+    async def _stream_with_fallback(self, prompt: str, mode: str = "other", student_type: str = "") -> AsyncIterator[str]:
+        """See GeminiService._stream_with_fallback."""
+        keys = _require_keys()
+        last_err: Optional[Exception] = None
+        tokens = estimate_tokens(prompt)
+        deadline = time.time() + AI_KEY_MAX_WAIT_SECONDS
+        candidates = _fallback_order(keys, 0)
+        while candidates:
+            key = await self._acquire_key(candidates, tokens, deadline)
+            if key is None:
+                raise self._base.quota_error(last_err)
+            key_index = keys.index(key)
+            started = False
+            usage: Dict = {}
+            parts: List[str] = []
+            try:
+                provider = self._get_provider(key)
+                start = time.time()
+                with _key_scheduler.track(key):
+                    async for chunk in provider.generate_stream(prompt, usage):
+                        started = True
+                        parts.append(chunk)
+                        yield chunk
+                _usage_tracker.record(
+                    _key_label(key), mode, student_type, time.time() - start, prompt, "".join(parts), usage
+                )
+                return
+            except Exception as e:
+                if started:
+                    raise
+                last_err = e
+                logger.warning(f"Key {key_index + 1} failed to start streaming: {str(e)}")
+
+        raise _keys_failed_error("All Gemini API keys failed to stream", last_err)
+
+    async def _stream_events(self, prompt: str, field: str, cache_key: str, finish, start_time: float,
+                             mode: str = "other", student_type: str = "") -> AsyncIterator[Dict]:
+        """See GeminiService._stream_events."""
+        streamer = _JsonFieldStreamer(field)
+        raw_parts: List[str] = []
+        sent = ""
+        try:
+            async for chunk in self._stream_with_fallback(prompt, mode, student_type):
+                raw_parts.append(chunk)
+                text = streamer.feed(chunk)
+                if text:
+                    sent += text
+                    yield {"event": "delta", "data": {"text": text}}
+            data = _stream_result(finish, "".join(raw_parts), field, sent)
+        except Exception as e:
+            self._base.count("errors")
+            logger.error(f"Error streaming {field}: {str(e)}")
+            yield _error_event(e)
+            return
+
+        rest = _final_delta(data, field, sent)
+        if rest:
+            yield rest
+        await self._store(cache_key, data)
+        logger.info(f"Streamed {field} in {time.time() - start_time:.2f}s")
+        yield {"event": "result", "data": data}
+
+    async def _stream_chunked_notes(self, text: str, student_type: str, cache_key: str, start_time: float) -> AsyncIterator[Dict]:
+        """Stream a long document as one delta per adapted chunk, in order."""
+        parts: List[Dict] = []
+        tasks = self._adapt_chunks(split_for_adaptation(text, MAX_TEXT_LENGTH), student_type)
+        try:
+            for task in tasks:
+                yield _chunk_delta(parts, await task)
+            data = self._base._stitch_chunks(parts, student_type, start_time)
+        except Exception as e:
+            logger.error(f"Error streaming chunked notes: {str(e)}")
+            yield _error_event(e)
+            return
+        finally:
+            for task in tasks:
+                task.cancel()
+        await self._store(cache_key, data)
+        yield {"event": "result", "data": data}
+
+    async def _cached_events(self, data: Dict, field: str) -> AsyncIterator[Dict]:
+        yield {"event": "delta", "data": {"text": str(data.get(field) or "")}}
+        yield {"event": "result", "data": data}
+
+    async def _flight_events(self, flight: "asyncio.Future[str]", field: str, restart) -> AsyncIterator[Dict]:
+        """Stream events for a request that joined an in-flight blocking generation."""
+        try:
+            data = await self._wait_for_flight(flight)
+        except Exception as e:
+            yield _error_event(e)
+            return
+        events = restart() if data is None else self._cached_events(data, field)
+        async for event in events:
+            yield event
+
+    async def stream_adaptive_notes(self, text: str, student_type: str,
+                                    text_hash: Optional[str] = None) -> AsyncIterator[Dict]:
+        """
+        Async GeminiService.stream_adaptive_notes: validates (ValueError) and
+        checks the cache, then returns an async iterator of events.
+        """
+        start_time = time.time()
+        self._base.count("requests")
+        text, student_type, cache_key = self._base._notes_request(text, student_type, text_hash)
+        prompt = self._base._notes_prompt(text, student_type)
+        cached_response = await self._cached(cache_key)
+        if cached_response:
+            self._base.count("cache_hits")
+            return self._cached_events(cached_response, "content")
+        if len(text) > MAX_TEXT_LENGTH:
+            restart = partial(self._stream_chunked_notes, text, student_type, cache_key, start_time)
+        else:
+            finish = partial(self._base._notes_result, student_type=student_type, start_time=start_time)
+            restart = partial(
+                self._stream_events, prompt, "content", cache_key, finish, start_time, "notes", student_type
+            )
+        flight = self._inflight.get(cache_key)
+        if flight is not None:
+            return self._flight_events(flight, "content", restart)
+        return restart()
+
+    async def stream_adaptive_qna(self, notes: str, student_type: str, question: str,
+                                  index: Optional[Dict] = None, notes_hash: Optional[str] = None) -> AsyncIterator[Dict]:
+        """Async GeminiService.stream_adaptive_qna; see stream_adaptive_notes."""
+        start_time = time.time()
+        self._base.count("requests")
+        notes, question, student_type, cache_key = self._base._qna_request(notes, student_type, question, notes_hash)
+        cached_response = await self._lookup_qna(cache_key)
+        if cached_response:
+            return self._cached_events(cached_response, "answer")
+        context = await asyncio.to_thread(self._base._qna_context, notes, question, index)
+        prompt = self._base._qna_prompt(context, student_type, question)
+        finish = partial(self._base._qna_result, student_type=student_type, start_time=start_time)
+        restart = partial(self._stream_events, prompt, "answer", cache_key, finish, start_time, "qna", student_type)
+        flight = self._inflight.get(cache_key)
+        if flight is not None:
+            return self._flight_events(flight, "answer", restart)
+        return restart()
+
+    def get_stats(self) -> Dict:
+        return self._base.get_stats()
+
+
+_async_service: Optional[AsyncGeminiService] = None
+
+
+def get_async_gemini_service() -> AsyncGeminiService:
+    """Process-wide AsyncGeminiService (created on the event loop's thread)."""
+    global _async_service
+    if _async_service is None:
+        _async_service = AsyncGeminiService()
+    return _async_service
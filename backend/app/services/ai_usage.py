@@ -0,0 +1,113 @@
+"""
+Rolling token and latency statistics for Gemini calls.
+
+Every provider response is recorded with its prompt and output token counts
+(from the response's usage_metadata, estimated from the text when missing),
+its latency, and the key, mode and student type it served. Percentiles cover
+the most recent AI_USAGE_WINDOW calls of each group; totals cover the whole
+process lifetime.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from .ai_keys import estimate_tokens
+
+
+AI_USAGE_WINDOW = int(os.getenv("AI_USAGE_WINDOW", "1000"))
+_PERCENTILES = (0.5, 0.95, 0.99)
+
+
+def _percentiles(values: List[float], digits: Optional[int]) -> Dict:
+    if not values:
+        return {}
+    ordered = sorted(values)
+    out = {
+        f"p{int(q * 100)}": round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], digits)
+        for q in _PERCENTILES
+    }
+    out["max"] = round(ordered[-1], digits)
+    return out
+
+
+class _UsageWindow:
+    """Recent (latency, prompt tokens, output tokens) samples plus lifetime totals."""
+
+    __slots__ = ("samples", "calls", "estimated", "prompt_tokens", "output_tokens")
+
+    def __init__(self, size: int):
+        self.samples: Deque[Tuple[float, int, int]] = deque(maxlen=size)
+        self.calls = 0
+        self.estimated = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+
+    def add(self, seconds: float, prompt_tokens: int, output_tokens: int, estimated: bool) -> None:
+        self.samples.append((seconds, prompt_tokens, output_tokens))
+        self.calls += 1
+        self.estimated += estimated
+        self.prompt_tokens += prompt_tokens
+        self.output_tokens += output_tokens
+
+    def snapshot(self) -> Dict:
+        latencies, prompts, outputs = zip(*self.samples) if self.samples else ((), (), ())
+        return {
+            "calls": self.calls,
+            "estimated_calls": self.estimated,
+            "prompt_tokens_total": self.prompt_tokens,
+            "output_tokens_total": self.output_tokens,
+            "latency_seconds": _percentiles(list(latencies), 3),
+            "prompt_tokens": _percentiles(list(prompts), None),
+            "output_tokens": _percentiles(list(outputs), None),
+        }
+
+
+class UsageTracker:
+    """Thread-safe usage statistics, overall and per key, mode and student type."""
+
+    def __init__(self, window: int = AI_USAGE_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._overall = _UsageWindow(window)
+        self._groups: Dict[Tuple[str, str], _UsageWindow] = {}
+
+    def record(self, key_label: str, mode: str, student_type: str, seconds: float,
+               prompt: str, output: str, usage: Optional[Dict] = None) -> None:
+        """
+        Record one successful call. `key_label` names the key without revealing
+        it (e.g. "key1"); `usage` holds prompt_tokens / output_tokens as
+        reported by the API, and missing counts are estimated from the text.
+        """
+        usage = usage or {}
+        prompt_tokens = usage.get("prompt_tokens")
+        output_tokens = usage.get("output_tokens")
+        estimated = prompt_tokens is None or output_tokens is None
+        if prompt_tokens is None:
+            prompt_tokens = estimate_tokens(prompt)
+        if output_tokens is None:
+            output_tokens = estimate_tokens(output)
+        labels = (("key", key_label), ("mode", mode or "other"), ("student_type", student_type or "none"))
+        with self._lock:
+            self._overall.add(seconds, prompt_tokens, output_tokens, estimated)
+            for label in labels:
+                group = self._groups.get(label)
+                if group is None:
+                    group = self._groups[label] = _UsageWindow(self.window)
+                group.add(seconds, prompt_tokens, output_tokens, estimated)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            snapshot: Dict = {
+                "window": self.window,
+                "overall": self._overall.snapshot(),
+                "by_key": {},
+                "by_mode": {},
+                "by_student_type": {},
+            }
+            for (dimension, label), group in sorted(self._groups.items()):
+                snapshot[f"by_{dimension}"][label] = group.snapshot()
+        return snapshot
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from bson.binary import Binary
+from pymongo.collection import Collection
+from pymongo.errors import DuplicateKeyError
+
+from .db import get_db
+
+
+# How long a completed response is kept for replay (TTL index on expiresAt)
+IDEMPOTENCY_TTL_HOURS = int(os.getenv("IDEMPOTENCY_TTL_HOURS", "24"))
+# How long an in-flight request holds its key before another attempt may take over
+IDEMPOTENCY_LOCK_SECONDS = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "300"))
+# Responses larger than this are not stored (Mongo documents are capped at 16 MB)
+IDEMPOTENCY_MAX_BODY_BYTES = int(os.getenv("IDEMPOTENCY_MAX_BODY_BYTES", str(8 * 1024 * 1024)))
+
+
+def _keys() -> Collection:
+    return get_db()["idempotency_keys"]
+
+
+def ensure_indexes() -> None:
+    # Documents are removed by MongoDB once expiresAt has passed
+    _keys().create_index("expiresAt", expireAfterSeconds=0, name="expiresAt_ttl")
+
+
+def begin(scope: str, fingerprint: str) -> Tuple[str, Optional[Dict]]:
+    """
+    Claim an idempotency scope for a new request.
+
+    Returns one of:
+      ("new", None)            – caller owns the key and must run the request
+      ("completed", record)    – a stored response is available for replay
+      ("in_progress", record)  – another request with this key is still running
+      ("mismatch", record)     – the key was used for a different request payload
+    """
+    ensure_indexes()
+    now = datetime.utcnow()
+    doc = {
+        "_id": scope,
+        "fingerprint": fingerprint,
+        "status": "in_progress",
+        "lockedUntil": now + timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS),
+        "createdAt": now,
+        "expiresAt": now + timedelta(hours=IDEMPOTENCY_TTL_HOURS),
+    }
+    try:
+        _keys().insert_one(doc)
+        return "new", None
+    except DuplicateKeyError:
+        pass
+
+    record = _keys().find_one({"_id": scope})
+    if record is None:
+        # Expired between insert and read; try once more
+        try:
+            _keys().insert_one(doc)
+            return "new", None
+        except DuplicateKeyError:
+            record = _keys().find_one({"_id": scope}) or {}
+    if record.get("fingerprint") != fingerprint:
+        return "mismatch", record
+    if record.get("status") == "completed":
+        return "completed", record
+
+    # Take over a stale lock left by a crashed or timed-out worker
+    taken = _keys().find_one_and_update(
+        {"_id": scope, "status": "in_progress", "lockedUntil": {"$lt": now}},
+        {"$set": {"lockedUntil": now + timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS)}},
+    )
+    if taken is not None:
+        return "new", None
+    return "in_progress", record
+
+
+def get(scope: str) -> Optional[Dict]:
+    return _keys().find_one({"_id": scope})
+
+
+def complete(scope: str, status_code: int, body: bytes, mimetype: Optional[str], headers: Dict[str, str]) -> bool:
+    """Store the final response for replay; returns False if the body is too large to keep."""
+    if len(body) > IDEMPOTENCY_MAX_BODY_BYTES:
+        release(scope)
+        return False
+    _keys().update_one(
+        {"_id": scope},
+        {"$set": {
+            "status": "completed",
+            "response": {
+                "statusCode": status_code,
+                "body": Binary(body),
+                "mimetype": mimetype,
+                "headers": headers,
+            },
+            "completedAt": datetime.utcnow(),
+        }},
+    )
+    return True
+
+
+def release(scope: str) -> None:
+    """Forget an in-flight key (e.g. after a server error) so a retry runs again."""
+    _keys().delete_one({"_id": scope, "status": "in_progress"})
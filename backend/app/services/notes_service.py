@@ -1,11 +1,14 @@
 from __future__ import annotations
 
+import hashlib
+import re
 from datetime import datetime
 from typing import Dict, Optional
 
 from pymongo.collection import Collection
 
 from .db import get_db
+from .qna_index import QNA_CONTEXT_CHARS, build_index, clean_text
 
 
 def _notes() -> Collection:
@@ -17,13 +20,46 @@ def ensure_indexes() -> None:
     col.create_index([("school", 1), ("class", 1), ("subject", 1), ("topic", 1)], name="school_class_subject_topic")
     col.create_index("uploadedBy")
     col.create_index("createdAt")
+    col.create_index("contentHash")
 
 
 def _now_iso() -> str:
     return datetime.utcnow().isoformat() + "Z"
 
 
-def save_note(
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so re-extractions of the same document hash identically."""
+    return re.sub(r"\s+", " ", text or "").strip()
+
+
+def content_hash(text: str) -> str:
+    """SHA-256 of the normalized text; used to detect re-uploads of the same content."""
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def variant_hashes(variants: Dict) -> Dict[str, str]:
+    """content_hash of every adapted text variant, keyed like `variants` (audioUrl and *Error keys skipped)."""
+    return {
+        name: content_hash(value)
+        for name, value in variants.items()
+        if isinstance(value, str) and value and name != "audioUrl" and not name.endswith("Error")
+    }
+
+
+def find_variants_by_hash(content_hash_value: str) -> Optional[Dict]:
+    """Return {"_id", "variants"} of the newest note with this content hash, or None."""
+    ensure_indexes()
+    doc = _notes().find_one(
+        {"contentHash": content_hash_value, "variants": {"$exists": True}},
+        {"variants": 1},
+        sort=[("createdAt", -1)],
+    )
+    if not doc:
+        return None
+    return {"_id": str(doc.get("_id")), "variants": doc.get("variants") or {}}
+
+
+def build_note_doc(
     *,
     school: str,
     class_name: str,
@@ -35,29 +71,74 @@ def save_note(
     original_filename: Optional[str] = None,
     extra_meta: Optional[Dict] = None,
     variants: Optional[Dict] = None,
+    text_hash: Optional[str] = None,
 ) -> Dict:
-    ensure_indexes()
+    """
+    Build the note document stored by save_note (without _id).
+    `text_hash` is content_hash(text) when the caller already computed it.
+    """
     doc: Dict = {
         "school": school.strip(),
         "class": class_name.strip(),
         "subject": subject.strip(),
         "topic": topic.strip(),
         "text": text,
+        "contentHash": text_hash or content_hash(text),
         "uploadedBy": uploaded_by,
         "sourceType": source_type,
         "originalFilename": original_filename,
         "createdAt": _now_iso(),
         "updatedAt": _now_iso(),
     }
+    index_text = clean_text(text)
+    if len(index_text) > QNA_CONTEXT_CHARS:
+        # Lets Q&A send only the relevant passages of long notes to the model;
+        # indexed as validated for Q&A, or the stored offsets would not match
+        doc["qnaIndex"] = build_index(index_text)
     if extra_meta:
         doc["meta"] = extra_meta
     if variants:
         # Store additional representations for clients: base, dyslexie, audioUrl, etc.
         doc["variants"] = variants
+        # Hashed once here so cache keys and ETags never re-hash the variant text
+        doc["variantHashes"] = variant_hashes(variants)
+    return doc
+
+
+def save_note(
+    *,
+    school: str,
+    class_name: str,
+    subject: str,
+    topic: str,
+    text: str,
+    uploaded_by: Optional[str],
+    source_type: str,
+    original_filename: Optional[str] = None,
+    extra_meta: Optional[Dict] = None,
+    variants: Optional[Dict] = None,
+    text_hash: Optional[str] = None,
+) -> Dict:
+    ensure_indexes()
+    doc = build_note_doc(
+        school=school,
+        class_name=class_name,
+        subject=subject,
+        topic=topic,
+        text=text,
+        uploaded_by=uploaded_by,
+        source_type=source_type,
+        original_filename=original_filename,
+        extra_meta=extra_meta,
+        variants=variants,
+        text_hash=text_hash,
+    )
 
     # Persist to MongoDB; if insertion fails, propagate the exception so callers can return an error
     res = _notes().insert_one(doc)
     doc["_id"] = str(res.inserted_id)
+    # The Q&A index is internal; keep it out of what callers return to clients
+    doc.pop("qnaIndex", None)
     return doc
 
 
@@ -72,15 +153,18 @@ def list_topics(school: str, class_name: str, subject: str) -> list[str]:
     return topics
 
 
-def get_note(school: str, class_name: str, subject: str, topic: str) -> Optional[Dict]:
-    """Fetch a single note by key; returns None if not found. Stringify _id if present."""
+def get_note(school: str, class_name: str, subject: str, topic: str, include_index: bool = False) -> Optional[Dict]:
+    """
+    Fetch a single note by key; returns None if not found. Stringify _id if present.
+    The stored Q&A index (qnaIndex) is only loaded when include_index is set.
+    """
     ensure_indexes()
     doc = _notes().find_one({
         "school": school.strip(),
         "class": class_name.strip(),
         "subject": subject.strip(),
         "topic": topic.strip(),
-    })
+    }, None if include_index else {"qnaIndex": 0})
     if not doc:
         return None
     # normalize _id to string
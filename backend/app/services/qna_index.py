@@ -0,0 +1,193 @@
+"""
+Lexical passage index for answering questions over long notes.
+
+A note's text is cut into passages of roughly QNA_PASSAGE_CHARS characters and
+indexed for BM25 scoring. The index stores passage offsets into the note text
+(not the text itself) and a compact postings array, so it can live on the note
+document in MongoDB. Queries are scored with NumPy in a few vectorized steps.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+# 2: built over clean_text(note text), the text the Q&A path queries
+INDEX_VERSION = 2
+# Target passage size; a question is answered from the best few passages
+QNA_PASSAGE_CHARS = int(os.getenv("QNA_PASSAGE_CHARS", "800"))
+QNA_TOP_K = int(os.getenv("QNA_TOP_K", "4"))
+# Notes at or below this size are sent whole and need no index
+QNA_CONTEXT_CHARS = int(os.getenv("QNA_CONTEXT_CHARS", "4000"))
+
+_BM25_K1 = 1.5
+_BM25_B = 0.75
+
+STOPWORDS = frozenset("""
+a about above after again all am an and any are as at be because been before being below between both
+but by can could did do does doing down during each few for from further had has have having he her
+here hers him his how i if in into is it its itself just me more most my no nor not of off on once only
+or other our ours out over own same she should so some such than that the their theirs them then there
+these they this those through to too under until up very was we were what when where which while who
+whom why will with would you your yours
+""".split())
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+# Control characters stripped from request text (see clean_text)
+CONTROL_CHARS = re.compile(r"[\x00-\x08\x0B-\x0C\x0E-\x1F\x7F]")
+# Paragraph breaks and the "[Page N]" / "[Slide N]" lines added by document_extractor
+_PASSAGE_BREAK = re.compile(r"\n\s*\n|\n(?=\[(?:Page|Slide) \d+\]\s*\n)")
+
+
+def stem(token: str) -> str:
+    """Strip common English suffixes so "plants"/"planting"/"planted" match."""
+    for suffix, replacement in (("ies", "y"), ("ing", ""), ("ed", ""), ("es", ""), ("ly", ""), ("s", "")):
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            return token[: len(token) - len(suffix)] + replacement
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased, stemmed word tokens without stopwords."""
+    return [stem(t) for t in _TOKEN.findall((text or "").casefold()) if t not in STOPWORDS]
+
+
+# The only words a cache key may drop: articles never change what is asked,
+# while prepositions, comparatives, modals or negations can reverse it
+_ARTICLES = frozenset(("a", "an", "the"))
+
+
+def normalize_question(question: str) -> str:
+    """
+    Canonical form of a question for cache keys: case-folded, with punctuation,
+    extra whitespace and the articles a/an/the removed. No other word is
+    dropped or stemmed.
+    """
+    words = _TOKEN.findall((question or "").casefold())
+    return " ".join(w for w in words if w not in _ARTICLES)
+
+
+def _split_long(text: str, start: int, end: int, max_chars: int) -> List[Tuple[int, int]]:
+    """Cut [start, end) into spans of at most max_chars, preferring line then word breaks."""
+    spans = []
+    while end - start > max_chars:
+        cut = text.rfind("\n", start, start + max_chars)
+        if cut <= start + max_chars // 2:
+            cut = text.rfind(" ", start, start + max_chars)
+        if cut <= start + max_chars // 2:
+            cut = start + max_chars
+        spans.append((start, cut))
+        start = cut
+    spans.append((start, end))
+    return spans
+
+
+def passage_spans(text: str, target_chars: int = QNA_PASSAGE_CHARS) -> List[Tuple[int, int]]:
+    """(start, end) offsets of passages of about target_chars, cut on paragraph/page breaks."""
+    pieces: List[Tuple[int, int]] = []
+    start = 0
+    for match in _PASSAGE_BREAK.finditer(text):
+        pieces.append((start, match.start()))
+        start = match.end()
+    pieces.append((start, len(text)))
+
+    spans: List[Tuple[int, int]] = []
+    for piece_start, piece_end in pieces:
+        if not text[piece_start:piece_end].strip():
+            continue
+        for span in _split_long(text, piece_start, piece_end, target_chars):
+            if spans and span[1] - spans[-1][0] <= target_chars:
+                # Merge small neighbours into one passage
+                spans[-1] = (spans[-1][0], span[1])
+            else:
+                spans.append(span)
+    return spans
+
+
+def clean_text(text: str) -> str:
+    """
+    Notes text as validate_input hands it to Q&A: stripped, control characters
+    removed. Indexes are built over this text so their offsets match.
+    """
+    return CONTROL_CHARS.sub("", (text or "").strip())
+
+
+def build_index(text: str) -> Dict:
+    """Build a BM25 index of `text` suitable for storing on the note document."""
+    spans = passage_spans(text)
+    vocab: Dict[str, int] = {}
+    rows: List[int] = []
+    cols: List[int] = []
+    counts: List[int] = []
+    lengths: List[int] = []
+    for row, (start, end) in enumerate(spans):
+        tokens = tokenize(text[start:end])
+        lengths.append(len(tokens))
+        for term, count in Counter(tokens).items():
+            rows.append(row)
+            cols.append(vocab.setdefault(term, len(vocab)))
+            counts.append(count)
+    return {
+        "version": INDEX_VERSION,
+        "textLength": len(text),
+        "spans": [list(span) for span in spans],
+        "lengths": lengths,
+        "vocab": list(vocab),
+        # rows, cols and counts of the sparse passage x term matrix, as uint32 bytes
+        "postings": np.array([rows, cols, counts], dtype=np.uint32).tobytes(),
+    }
+
+
+def is_usable(index: Optional[Dict], text: str) -> bool:
+    """True if `index` was built (by this version) over exactly this text."""
+    return bool(index) and index.get("version") == INDEX_VERSION and index.get("textLength") == len(text)
+
+
+def top_passages(index: Dict, text: str, query: str, k: int = QNA_TOP_K) -> List[str]:
+    """The k best-scoring passages for `query`, in document order ([] if nothing matches)."""
+    spans = index["spans"]
+    n_passages = len(spans)
+    if not n_passages:
+        return []
+    term_ids = {term: i for i, term in enumerate(index["vocab"])}
+    query_ids = np.array(sorted({term_ids[t] for t in tokenize(query) if t in term_ids}), dtype=np.uint32)
+    if not query_ids.size:
+        return []
+
+    postings = np.frombuffer(bytes(index["postings"]), dtype=np.uint32).reshape(3, -1)
+    rows, cols, counts = postings[0], postings[1], postings[2].astype(np.float64)
+    lengths = np.asarray(index["lengths"], dtype=np.float64)
+    avg_length = max(lengths.mean(), 1.0)
+
+    selected = np.isin(cols, query_ids)
+    rows, cols, tf = rows[selected], cols[selected], counts[selected]
+    doc_freq = np.bincount(cols, minlength=len(index["vocab"]))[cols]
+    idf = np.log(1 + (n_passages - doc_freq + 0.5) / (doc_freq + 0.5))
+    norm = _BM25_K1 * (1 - _BM25_B + _BM25_B * lengths[rows] / avg_length)
+    scores = np.bincount(rows, weights=idf * tf * (_BM25_K1 + 1) / (tf + norm), minlength=n_passages)
+
+    best = [int(i) for i in np.argsort(-scores, kind="stable")[:k] if scores[i] > 0]
+    return [text[spans[i][0]:spans[i][1]].strip() for i in sorted(best)]
+
+
+def select_context(text: str, question: str, index: Optional[Dict] = None,
+                   k: int = QNA_TOP_K, max_chars: int = QNA_CONTEXT_CHARS) -> Optional[str]:
+    """
+    Passages of `text` relevant to `question`, joined in document order.
+
+    Uses `index` when it matches `text`, otherwise indexes on the fly. Returns
+    None when the text is short enough to send whole or nothing matches.
+    """
+    if len(text) <= max_chars:
+        return None
+    if not is_usable(index, text):
+        index = build_index(text)
+    passages = top_passages(index, text, question, k)
+    if not passages:
+        return None
+    return "\n\n[...]\n\n".join(passages)
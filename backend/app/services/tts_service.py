@@ -1,9 +1,31 @@
+import hashlib
 import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 
 import azure.cognitiveservices.speech as speechsdk
 
+from ..utils.audio import concat_mp3_files
+
+
+# Per-paragraph MP3 segments, keyed by paragraph hash, reused across uploads/edits
+TTS_SEGMENT_DIR = os.getenv("TTS_SEGMENT_DIR", "./audio_output/segments")
+TTS_SEGMENT_CACHE_MAX_BYTES = int(os.getenv("TTS_SEGMENT_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+TTS_SEGMENT_CONCURRENCY = int(os.getenv("TTS_SEGMENT_CONCURRENCY", "4"))
+# Segments used this recently are never pruned, so another upload that is
+# about to join them (in this or another worker process) still finds them
+TTS_SEGMENT_MIN_AGE_SECONDS = int(os.getenv("TTS_SEGMENT_MIN_AGE_SECONDS", "600"))
+# Segment size bounds: lines are joined until a segment has at least MIN
+# characters and ends a sentence; text is never joined past MAX characters
+TTS_SEGMENT_MIN_CHARS = int(os.getenv("TTS_SEGMENT_MIN_CHARS", "80"))
+TTS_SEGMENT_MAX_CHARS = int(os.getenv("TTS_SEGMENT_MAX_CHARS", "2000"))
+_prune_lock = threading.Lock()
+
 
 def synthesize_text_to_mp3(
     text: str,
@@ -45,3 +67,198 @@ def synthesize_text_to_mp3(
         return False, f"Error: {e}"
 
 
+# "[Page N]" / "[Slide N]" lines added by document_extractor
+_SECTION_LINE = re.compile(r"^\[(?:Page|Slide) \d+\]$")
+_SENTENCE_END = re.compile(r"[.!?:;][\"')\]]*$")
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+")
+
+
+def _bounded(line: str) -> List[str]:
+    """`line` cut at sentence (or, failing that, word) breaks into pieces of at most TTS_SEGMENT_MAX_CHARS."""
+    if len(line) <= TTS_SEGMENT_MAX_CHARS:
+        return [line]
+    pieces: List[str] = []
+    current = ""
+    for word in _SENTENCE_BREAK.split(line) if _SENTENCE_BREAK.search(line) else line.split(" "):
+        while len(word) > TTS_SEGMENT_MAX_CHARS:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(word[:TTS_SEGMENT_MAX_CHARS])
+            word = word[TTS_SEGMENT_MAX_CHARS:]
+        if current and len(current) + 1 + len(word) > TTS_SEGMENT_MAX_CHARS:
+            pieces.append(current)
+            current = ""
+        current = f"{current} {word}" if current else word
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_paragraphs(text: str) -> List[str]:
+    """
+    Split text into whitespace-normalized segments of whole lines.
+
+    DOCX/PPTX text has one paragraph per line and PDF text wraps lines, so a
+    segment ends after a line once it holds TTS_SEGMENT_MIN_CHARS and the line
+    ends a sentence, and always at blank lines and "[Page N]" / "[Slide N]"
+    markers (which are not spoken). Boundaries depend only on nearby lines, so
+    editing one paragraph leaves the other segments, and their keys, unchanged.
+    """
+    segments: List[str] = []
+    pending: List[str] = []
+
+    def flush() -> None:
+        if pending:
+            segments.append(" ".join(pending))
+            pending.clear()
+
+    for raw_line in (text or "").split("\n"):
+        line = re.sub(r"\s+", " ", raw_line).strip()
+        if not line or _SECTION_LINE.match(line):
+            flush()
+            continue
+        for piece in _bounded(line):
+            if pending and sum(len(p) + 1 for p in pending) + len(piece) > TTS_SEGMENT_MAX_CHARS:
+                flush()
+            pending.append(piece)
+            if sum(len(p) + 1 for p in pending) > TTS_SEGMENT_MIN_CHARS and _SENTENCE_END.search(piece):
+                flush()
+    flush()
+    return segments
+
+
+def paragraph_hash(paragraph: str, voice: str) -> str:
+    """Segment key: the same paragraph spoken by the same voice maps to the same MP3."""
+    return hashlib.sha256(f"{voice}\n{paragraph}".encode("utf-8")).hexdigest()
+
+
+def _prune_segment_cache(segment_dir: Path, keep: List[Path]) -> None:
+    """
+    Delete least recently used segments until the cache fits
+    TTS_SEGMENT_CACHE_MAX_BYTES, sparing those used in the last
+    TTS_SEGMENT_MIN_AGE_SECONDS. Only one upload per process prunes at a time.
+    """
+    if not _prune_lock.acquire(blocking=False):
+        return
+    try:
+        files = []
+        for path in segment_dir.glob("*.mp3"):
+            try:
+                files.append((path, path.stat()))
+            except OSError:
+                # Removed by another process meanwhile
+                pass
+        total = sum(st.st_size for _, st in files)
+        if total <= TTS_SEGMENT_CACHE_MAX_BYTES:
+            return
+        protected = set(keep)
+        cutoff = time.time() - TTS_SEGMENT_MIN_AGE_SECONDS
+        for path, st in sorted(files, key=lambda item: item[1].st_mtime):
+            if total <= TTS_SEGMENT_CACHE_MAX_BYTES or st.st_mtime >= cutoff:
+                break
+            if path in protected:
+                continue
+            try:
+                path.unlink()
+                total -= st.st_size
+            except OSError:
+                pass
+    finally:
+        _prune_lock.release()
+
+
+def _claim_segment(path: Path) -> bool:
+    """Mark a cached segment as just used (so pruning spares it); False if it is not there."""
+    try:
+        os.utime(path)
+        return path.stat().st_size > 0
+    except FileNotFoundError:
+        return False
+
+
+def synthesize_paragraphs_to_mp3(
+    text: str,
+    out_path: Path,
+    api_key: Optional[str] = None,
+    region: Optional[str] = None,
+    voice: Optional[str] = None,
+) -> Tuple[bool, str, Dict]:
+    """Synthesize text as per-paragraph MP3 segments and join them into out_path.
+
+    Segments already in TTS_SEGMENT_DIR (same paragraph and voice) are reused, so
+    editing a note only sends the changed paragraphs to Azure.
+    Returns (success, message, info) where info has the ordered segment hashes and
+    how many segments were synthesized vs reused.
+    """
+    voice = voice or os.getenv("DEFAULT_VOICE", "en-US-JennyNeural")
+    paragraphs = split_paragraphs(text)
+    if not paragraphs:
+        return False, "No text to synthesize", {}
+
+    segment_dir = Path(TTS_SEGMENT_DIR)
+    segment_dir.mkdir(parents=True, exist_ok=True)
+    hashes = [paragraph_hash(p, voice) for p in paragraphs]
+    segment_paths = [segment_dir / f"{h}.mp3" for h in hashes]
+
+    # Unique paragraphs that have no cached segment yet
+    missing: Dict[str, str] = {}
+    for h, p, path in zip(hashes, paragraphs, segment_paths):
+        if h not in missing and not _claim_segment(path):
+            missing[h] = p
+
+    def synthesize_segment(item: Tuple[str, str]) -> Tuple[bool, str]:
+        h, paragraph = item
+        # Write to a private temp name, then publish atomically for concurrent uploads
+        tmp_path = segment_dir / f"{h}.{uuid.uuid4().hex}.tmp"
+        ok, msg = synthesize_text_to_mp3(paragraph, tmp_path, api_key=api_key, region=region, voice=voice)
+        try:
+            if ok and tmp_path.exists() and tmp_path.stat().st_size > 0:
+                os.replace(tmp_path, segment_dir / f"{h}.mp3")
+                return True, "OK"
+            return False, msg if not ok else "Empty segment"
+        finally:
+            if tmp_path.exists():
+                try:
+                    tmp_path.unlink()
+                except OSError:
+                    pass
+
+    def synthesize_all(items: Dict[str, str]) -> Tuple[bool, str]:
+        if not items:
+            return True, "OK"
+        workers = max(1, min(TTS_SEGMENT_CONCURRENCY, len(items)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for ok, msg in pool.map(synthesize_segment, items.items()):
+                if not ok:
+                    return False, msg
+        return True, "OK"
+
+    ok, msg = synthesize_all(missing)
+    if not ok:
+        return False, msg, {}
+    synthesized = len(missing)
+
+    for attempt in range(2):
+        try:
+            concat_mp3_files(segment_paths, out_path)
+            break
+        except FileNotFoundError as e:
+            # A segment was pruned after we checked it (e.g. by a process that
+            # missed our mtime refresh); synthesize what is gone and join again
+            lost = {h: p for h, p, path in zip(hashes, paragraphs, segment_paths) if not _claim_segment(path)}
+            if attempt or not lost:
+                return False, f"Error: {e}", {}
+            ok, msg = synthesize_all(lost)
+            if not ok:
+                return False, msg, {}
+            synthesized += len(lost)
+        except OSError as e:
+            return False, f"Error: {e}", {}
+    _prune_segment_cache(segment_dir, keep=segment_paths)
+
+    return True, "OK", {
+        "segments": hashes,
+        "synthesized": synthesized,
+        "reused": max(0, len(set(hashes)) - synthesized),
+    }
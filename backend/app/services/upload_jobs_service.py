@@ -0,0 +1,305 @@
+from __future__ import annotations
+
+import logging
+import os
+import shutil
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from flask import Flask
+from pymongo.collection import Collection
+from pymongo.errors import PyMongoError
+
+from .db import get_db
+from .upload_pipeline import bulk_file_reader, process_bulk_upload, process_upload
+
+
+logger = logging.getLogger(__name__)
+
+# Bounded pool shared by all requests in this worker process, so a burst of
+# uploads queues up instead of occupying every request thread.
+UPLOAD_JOB_WORKERS = int(os.getenv("UPLOAD_JOB_WORKERS", "2"))
+UPLOAD_STAGING_DIR = os.getenv("UPLOAD_STAGING_DIR", "./upload_staging")
+# Job documents are removed by MongoDB this long after they were created or finished
+UPLOAD_JOB_TTL_HOURS = int(os.getenv("UPLOAD_JOB_TTL_HOURS", "72"))
+# Queued/running jobs of another host that have not reported progress for this
+# long are assumed lost (jobs of this host are checked by process id instead)
+UPLOAD_JOB_STALE_HOURS = float(os.getenv("UPLOAD_JOB_STALE_HOURS", "6"))
+
+_executor_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is not None:
+        return _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max(1, UPLOAD_JOB_WORKERS), thread_name_prefix="upload-job")
+    return _executor
+
+
+def _jobs() -> Collection:
+    return get_db()["upload_jobs"]
+
+
+def ensure_indexes() -> None:
+    col = _jobs()
+    col.create_index("uploadedBy")
+    col.create_index("createdAt")
+    col.create_index("status")
+    col.create_index("expiresAt", expireAfterSeconds=0, name="expiresAt_ttl")
+
+
+def _now_iso() -> str:
+    return datetime.utcnow().isoformat() + "Z"
+
+
+def _expires_at() -> datetime:
+    return datetime.utcnow() + timedelta(hours=UPLOAD_JOB_TTL_HOURS)
+
+
+def _owner() -> str:
+    """host:pid of the worker process running a job."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def staging_dir_for(job_id: str) -> Path:
+    """Directory where a job's input file is persisted until the worker picks it up."""
+    path = Path(UPLOAD_STAGING_DIR) / job_id
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def new_job_id() -> str:
+    return uuid.uuid4().hex
+
+
+def create_job(
+    *,
+    job_id: str,
+    uploaded_by: Optional[str],
+    params: Dict,
+    kind: str = "upload",
+) -> Dict:
+    """
+    Persist a queued job document. For kind "upload" `params` are the
+    process_upload keyword arguments; for kind "bulk" see _run_bulk_job.
+    """
+    ensure_indexes()
+    stored_params = dict(params)
+    if stored_params.get("path") is not None:
+        stored_params["path"] = str(stored_params["path"])
+    doc: Dict = {
+        "_id": job_id,
+        "kind": kind,
+        "status": "queued",
+        "uploadedBy": uploaded_by,
+        "params": stored_params,
+        "stages": {},
+        "note": None,
+        "error": None,
+        "owner": _owner(),
+        "createdAt": _now_iso(),
+        "updatedAt": _now_iso(),
+        "expiresAt": _expires_at(),
+    }
+    if kind == "bulk":
+        doc["items"] = [
+            {"filename": name, "topic": topic, "status": "queued", "noteId": None}
+            for name, topic in params["items"]
+        ]
+        doc["progress"] = _progress(doc["items"])
+    _jobs().insert_one(doc)
+    return doc
+
+
+def _progress(items: List[Dict]) -> Dict:
+    counts = {"total": len(items), "created": 0, "failed": 0}
+    for item in items:
+        if item["status"] in ("created", "failed"):
+            counts[item["status"]] += 1
+    return counts
+
+
+def get_job(job_id: str) -> Optional[Dict]:
+    return _jobs().find_one({"_id": job_id})
+
+
+def _update_job(job_id: str, fields: Dict) -> None:
+    fields = dict(fields)
+    fields["updatedAt"] = _now_iso()
+    try:
+        _jobs().update_one({"_id": job_id}, {"$set": fields})
+    except PyMongoError as e:
+        # Progress reporting must never break the pipeline itself
+        logger.warning(f"Failed to update upload job {job_id}: {e}")
+
+
+def _finish_job(job_id: str, fields: Dict) -> None:
+    """Record the final state; the TTL restarts so the result stays readable for UPLOAD_JOB_TTL_HOURS."""
+    _update_job(job_id, {**fields, "finishedAt": _now_iso(), "expiresAt": _expires_at()})
+
+
+def _run_job(app: Flask, job_id: str, params: Dict) -> None:
+    with app.app_context():
+        _update_job(job_id, {"status": "running", "owner": _owner(), "startedAt": _now_iso()})
+
+        def on_stage(name: str, status: str, elapsed: Optional[float], error: Optional[str]) -> None:
+            stage: Dict = {"status": status}
+            if status == "running":
+                stage["startedAt"] = _now_iso()
+            else:
+                stage["finishedAt"] = _now_iso()
+                stage["seconds"] = elapsed
+            if error:
+                stage["error"] = error
+            _update_job(job_id, {f"stages.{name}.{k}": v for k, v in stage.items()})
+
+        kwargs = dict(params)
+        if kwargs.get("path"):
+            kwargs["path"] = Path(kwargs["path"])
+        try:
+            note = process_upload(on_stage=on_stage, **kwargs)
+            _finish_job(job_id, {"status": "succeeded", "note": note})
+        except PyMongoError as e:
+            _finish_job(job_id, {"status": "failed", "error": f"Database error: {str(e)}"})
+        except Exception as e:
+            logger.error(f"Upload job {job_id} failed: {str(e)}")
+            _finish_job(job_id, {"status": "failed", "error": str(e)})
+        finally:
+            if kwargs.get("path"):
+                shutil.rmtree(Path(kwargs["path"]).parent, ignore_errors=True)
+
+
+def _run_bulk_job(app: Flask, job_id: str, params: Dict) -> None:
+    """
+    Process a bulk upload. `params` hold school, class_name, subject,
+    uploaded_by, items ((filename, topic) pairs), path (a zip archive, or a
+    directory of files named by item index) and archive (bool). Each item's
+    status is written to the job as it changes; notes are saved one by one.
+    """
+    with app.app_context():
+        _update_job(job_id, {"status": "running", "owner": _owner(), "startedAt": _now_iso()})
+        items = [{"filename": name, "topic": topic, "status": "queued"} for name, topic in params["items"]]
+        lock = threading.Lock()
+
+        def on_item(index: int, entry: Dict) -> None:
+            with lock:
+                items[index] = entry
+                progress = _progress(items)
+            _update_job(job_id, {f"items.{index}": entry, "progress": progress})
+
+        path = Path(params["path"])
+        try:
+            manifest = process_bulk_upload(
+                school=params["school"],
+                class_name=params["class_name"],
+                subject=params["subject"],
+                uploaded_by=params.get("uploaded_by"),
+                items=[(name, topic) for name, topic in params["items"]],
+                read_file=bulk_file_reader(path, bool(params.get("archive"))),
+                on_item=on_item,
+            )
+            progress = _progress(manifest)
+            if progress["created"]:
+                _finish_job(job_id, {"status": "succeeded", "progress": progress})
+            else:
+                _finish_job(job_id, {"status": "failed", "progress": progress, "error": "No document could be processed"})
+        except Exception as e:
+            logger.error(f"Bulk upload job {job_id} failed: {str(e)}")
+            _finish_job(job_id, {"status": "failed", "error": str(e)})
+        finally:
+            shutil.rmtree(path.parent, ignore_errors=True)
+
+
+def submit_job(app: Flask, job_id: str, params: Dict, kind: str = "upload") -> None:
+    """Queue a persisted job on the bounded worker pool."""
+    _get_executor().submit(_run_bulk_job if kind == "bulk" else _run_job, app, job_id, params)
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _is_stale(job: Dict, host: str) -> bool:
+    """True if the process that queued or ran `job` is gone."""
+    owner_host, _, pid = str(job.get("owner") or "").rpartition(":")
+    if owner_host == host and pid.isdigit():
+        # Our own pid can only appear here if the id was reused after a restart
+        return int(pid) == os.getpid() or not _process_alive(int(pid))
+    updated = str(job.get("updatedAt") or "").rstrip("Z")
+    try:
+        age = datetime.utcnow() - datetime.fromisoformat(updated)
+    except ValueError:
+        return True
+    return age > timedelta(hours=UPLOAD_JOB_STALE_HOURS)
+
+
+def _staged_dir(job: Dict) -> Optional[Path]:
+    path = (job.get("params") or {}).get("path")
+    return Path(path).parent if path else None
+
+
+def recover_stale_jobs() -> int:
+    """
+    Fail queued/running jobs whose worker process died (restart, or killed on
+    timeout) and remove their staged input. Also removes staging directories
+    no live job refers to. Needs an app context; returns the number of jobs failed.
+    """
+    ensure_indexes()
+    host = socket.gethostname()
+    failed = 0
+    live_jobs = set()
+    for job in _jobs().find({"status": {"$in": ["queued", "running"]}}):
+        if not _is_stale(job, host):
+            live_jobs.add(job["_id"])
+            continue
+        _finish_job(job["_id"], {
+            "status": "failed",
+            "error": "Upload job was interrupted by a server restart; please upload again",
+        })
+        staged = _staged_dir(job)
+        if staged is not None and str(job.get("owner") or "").startswith(f"{host}:"):
+            shutil.rmtree(staged, ignore_errors=True)
+        failed += 1
+
+    # Staged files of jobs that no longer exist (e.g. expired by the TTL index);
+    # recent directories may belong to a job that is being created right now.
+    # Upload sessions keep their own directory under sessions/.
+    root = Path(UPLOAD_STAGING_DIR)
+    cutoff = time.time() - 3600
+    if root.is_dir():
+        for entry in root.iterdir():
+            is_job_dir = len(entry.name) == 32 and all(c in "0123456789abcdef" for c in entry.name)
+            if is_job_dir and entry.name not in live_jobs and entry.stat().st_mtime < cutoff:
+                shutil.rmtree(entry, ignore_errors=True)
+
+    if failed:
+        logger.warning(f"Marked {failed} interrupted upload job(s) as failed")
+    return failed
+
+
+def start_job_recovery(app: Flask) -> None:
+    """Run recover_stale_jobs in the background so startup does not wait on MongoDB."""
+    def run() -> None:
+        with app.app_context():
+            try:
+                recover_stale_jobs()
+            except (PyMongoError, OSError) as e:
+                logger.warning(f"Upload job recovery failed: {e}")
+
+    threading.Thread(target=run, name="upload-job-recovery", daemon=True).start()
@@ -0,0 +1,590 @@
+from __future__ import annotations
+
+import logging
+import contextvars
+import os
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from pathlib import Path, PurePosixPath
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from flask import current_app, has_app_context
+from pymongo.errors import PyMongoError
+
+from .extract_text_service import get_extractor
+from .stt_service import get_stt_client
+from .notes_service import content_hash, find_variants_by_hash, save_note
+from .ai_service import ADAPTATION_GUIDELINES, MAX_DOCUMENT_LENGTH, get_gemini_service, limit_gemini_calls
+from .tts_service import synthesize_paragraphs_to_mp3
+from .catbox_service import upload_file_to_catbox
+from ..utils.audio import ensure_wav_pcm16_mono_16k
+from ..utils.metrics import record_stage_latency
+
+
+logger = logging.getLogger(__name__)
+
+# Maximum concurrent Gemini calls made by upload pipelines in this process,
+# counting every chunk call of a long document
+UPLOAD_AI_CONCURRENCY = int(os.getenv("UPLOAD_AI_CONCURRENCY", "2"))
+_ai_slots = threading.BoundedSemaphore(max(1, UPLOAD_AI_CONCURRENCY))
+
+# Callback signature: on_stage(stage_name, status, elapsed_seconds_or_none, error_or_none)
+StageCallback = Callable[[str, str, Optional[float], Optional[str]], None]
+
+# Seconds the running stage has spent waiting for _ai_slots, kept out of its timing
+_stage_queued: contextvars.ContextVar = contextvars.ContextVar("upload_stage_queued", default=None)
+
+
+class _StageSlots:
+    """
+    Takes one of the shared _ai_slots for each Gemini call of a stage (see
+    limit_gemini_calls) and adds to `queued` the wall time during which the
+    stage had calls waiting for a slot and none running.
+    """
+
+    def __init__(self, queued: List[float]):
+        self._queued = queued
+        self._lock = threading.Lock()
+        self._running = 0
+        self._waiting = 0
+        self._idle_since: Optional[float] = None
+
+    def __enter__(self) -> None:
+        with self._lock:
+            self._waiting += 1
+            if self._running == 0 and self._idle_since is None:
+                self._idle_since = time.time()
+        _ai_slots.acquire()
+        with self._lock:
+            self._waiting -= 1
+            if self._idle_since is not None:
+                self._queued[0] += time.time() - self._idle_since
+                self._idle_since = None
+            self._running += 1
+
+    def __exit__(self, *exc) -> None:
+        _ai_slots.release()
+        with self._lock:
+            self._running -= 1
+            if self._running == 0 and self._waiting:
+                self._idle_since = time.time()
+
+
+@contextmanager
+def _stage(on_stage: Optional[StageCallback], name: str) -> Iterator[None]:
+    """
+    Report a pipeline stage as running, then done/failed with its elapsed time.
+    Time spent queued for a Gemini slot is excluded and recorded as "aiQueue".
+    """
+    if on_stage:
+        on_stage(name, "running", None, None)
+    queued = [0.0]
+    token = _stage_queued.set(queued)
+    start = time.time()
+
+    def elapsed() -> float:
+        return round(max(0.0, time.time() - start - queued[0]), 3)
+
+    try:
+        yield
+    except Exception as e:
+        if on_stage:
+            on_stage(name, "failed", elapsed(), str(e))
+        raise
+    finally:
+        _stage_queued.reset(token)
+        if queued[0]:
+            record_stage_latency("aiQueue", queued[0])
+    if on_stage:
+        on_stage(name, "done", elapsed(), None)
+
+
+def resolve_text(
+    *,
+    source_type: str,
+    path: Optional[Path] = None,
+    data: Optional[bytes] = None,
+    text: Optional[str] = None,
+    original_filename: Optional[str] = None,
+    language: Optional[str] = None,
+    on_stage: Optional[StageCallback] = None,
+) -> str:
+    """
+    Turn the uploaded input into base text.
+
+    source_type is one of "text", "document" or "audio". Documents may be given
+    in memory as `data` (parsed by extension of `original_filename`) or on disk
+    as `path`; audio always needs a path. Raises ValueError when speech-to-text
+    fails so callers can surface it as a client error.
+    """
+    if source_type == "text":
+        return text or ""
+
+    if source_type == "document" and data is not None:
+        with _stage(on_stage, "extract"):
+            extractor = get_extractor()
+            results = extractor.extract_bytes(data, original_filename or "upload")
+            return next(iter(results.values()), "")
+
+    if path is None:
+        raise ValueError(f"A file path is required for source type '{source_type}'")
+
+    if source_type == "document":
+        with _stage(on_stage, "extract"):
+            extractor = get_extractor()
+            results = extractor.extract(path)
+            return next(iter(results.values()), "")
+
+    # Audio: convert to an Azure-compatible format, then transcribe
+    with _stage(on_stage, "convert"):
+        path_to_use, is_temp = ensure_wav_pcm16_mono_16k(path)
+    try:
+        with _stage(on_stage, "stt"):
+            stt_client = get_stt_client(language=(language or "en-US"))
+            success, result = stt_client.transcribe(str(path_to_use))
+    except (RuntimeError, ValueError, OSError) as e:
+        raise ValueError(f"STT Error: {str(e)}") from e
+    finally:
+        # Clean up temporary converted file if it was created
+        if is_temp and path_to_use.exists():
+            try:
+                path_to_use.unlink()
+            except OSError:
+                pass
+    if not success:
+        raise ValueError(f"STT Error: {result}")
+    return result
+
+
+def run_stage_graph(
+    graph: Dict[str, Tuple[Tuple[str, ...], Callable[[Dict[str, Any]], Any]]],
+    on_stage: Optional[StageCallback] = None,
+    max_workers: Optional[int] = None,
+) -> Tuple[Dict[str, Any], Dict[str, Exception]]:
+    """
+    Run a small dependency graph of stages concurrently.
+
+    `graph` maps stage name -> (dependency names, fn). Each fn receives a dict of its
+    dependencies' results. A stage starts as soon as all its dependencies succeeded;
+    stages whose dependencies failed are skipped. Returns (results, errors) keyed by
+    stage name. The Flask app context, if any, is propagated to the worker threads.
+    """
+    app = current_app._get_current_object() if has_app_context() else None
+
+    def run_node(name: str, fn: Callable[[Dict[str, Any]], Any], inputs: Dict[str, Any]) -> Any:
+        if app is None:
+            with _stage(on_stage, name):
+                return fn(inputs)
+        with app.app_context():
+            with _stage(on_stage, name):
+                return fn(inputs)
+
+    results: Dict[str, Any] = {}
+    errors: Dict[str, Exception] = {}
+    pending = dict(graph)
+    running: Dict[Future, str] = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers or max(1, len(graph)), thread_name_prefix="upload-stage") as pool:
+        while pending or running:
+            for name, (deps, fn) in list(pending.items()):
+                if any(dep in errors or (dep not in graph) for dep in deps):
+                    # Upstream failed (or unknown): skip this stage entirely
+                    del pending[name]
+                elif all(dep in results for dep in deps):
+                    del pending[name]
+                    inputs = {dep: results[dep] for dep in deps}
+                    running[pool.submit(run_node, name, fn, inputs)] = name
+            if not running:
+                break
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    errors[name] = e
+
+    return results, errors
+
+
+class _StageFailed(Exception):
+    """A stage reported failure through a (success, message) result."""
+
+
+class TextTooLong(ValueError):
+    """The base text of an upload is longer than MAX_DOCUMENT_LENGTH characters."""
+
+
+def check_text_length(text: Optional[str]) -> None:
+    """
+    Raise TextTooLong when `text` is over the AI notes limit. Checked before any
+    post-processing, since every adapted variant of such a text would fail.
+    """
+    length = len((text or "").strip())
+    if length > MAX_DOCUMENT_LENGTH:
+        raise TextTooLong(
+            f"Text is too long ({length} characters, max {MAX_DOCUMENT_LENGTH}); split it into several uploads"
+        )
+
+
+def _adapt_for(text: str, student_type: str, text_hash: Optional[str] = None) -> Dict:
+    # Each Gemini call takes a slot, not the stage: a long document fans out to
+    # several chunk calls, which must all count against UPLOAD_AI_CONCURRENCY
+    queued = _stage_queued.get()
+    with limit_gemini_calls(_StageSlots(queued) if queued is not None else _ai_slots):
+        return get_gemini_service().generate_adaptive_notes(text=text, student_type=student_type, text_hash=text_hash)
+
+
+def _synthesize_mp3(text: str) -> Tuple[Path, Dict]:
+    """Synthesize per-paragraph segments (reusing cached ones) into one temp MP3."""
+    output_dir = os.getenv("OUTPUT_DIR", "./audio_output")
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    tmp_mp3 = tempfile.NamedTemporaryFile(suffix='.mp3', delete=False, dir=output_dir, prefix='upload_tts_')
+    tmp_mp3_path = Path(tmp_mp3.name)
+    tmp_mp3.close()
+    ok, msg, info = synthesize_paragraphs_to_mp3(text=text, out_path=tmp_mp3_path, voice=None)
+    if ok and tmp_mp3_path.exists() and tmp_mp3_path.stat().st_size > 0:
+        return tmp_mp3_path, info
+    _remove_quietly(tmp_mp3_path)
+    raise _StageFailed(msg)
+
+
+def _upload_mp3(mp3_path: Path) -> str:
+    up_ok, up_msg = upload_file_to_catbox(mp3_path)
+    if not up_ok:
+        raise _StageFailed(up_msg)
+    return up_msg
+
+
+def _remove_quietly(path: Path) -> None:
+    if path.exists():
+        try:
+            path.unlink()
+        except OSError:
+            # Best-effort cleanup
+            pass
+
+
+def build_variants(
+    text: str,
+    on_stage: Optional[StageCallback] = None,
+    reuse: Optional[Dict] = None,
+    text_hash: Optional[str] = None,
+) -> Tuple[Dict, List[str]]:
+    """
+    Post-processing: generate an adapted variant per student type, synthesize TTS,
+    and upload the MP3 to Catbox.
+
+    One AI stage runs per key of ADAPTATION_GUIDELINES (bounded by
+    UPLOAD_AI_CONCURRENCY) alongside the TTS -> Catbox chain; they only depend
+    on the base text. Every stage is non-fatal; failures are recorded as
+    *Error keys in the returned variants.
+
+    `reuse` holds variants of an earlier note with the same content hash; stages
+    whose output is already there are skipped. `text_hash` is content_hash(text)
+    if the caller already computed it. Returns (variants, skipped_stages).
+    """
+    reuse = reuse or {}
+    reuse_meta = reuse.get("meta") or {}
+    variants: Dict = {}
+    skipped: List[str] = []
+
+    def add_variant(student_type: str, content: str, tips: Optional[str]) -> None:
+        variants[student_type] = content
+        # Store AI tips optionally
+        if tips:
+            variants.setdefault("meta", {})
+            variants["meta"][f"{student_type}Tips"] = tips
+
+    graph: Dict[str, Tuple[Tuple[str, ...], Callable[[Dict[str, Any]], Any]]] = {}
+    for student_type in ADAPTATION_GUIDELINES:
+        if reuse.get(student_type):
+            add_variant(student_type, reuse[student_type], reuse_meta.get(f"{student_type}Tips"))
+            skipped.append(student_type)
+        else:
+            graph[student_type] = ((), lambda _, st=student_type: _adapt_for(text, st, text_hash))
+    if reuse.get("audioUrl"):
+        variants["audioUrl"] = reuse["audioUrl"]
+        if reuse_meta.get("audioSegments"):
+            variants.setdefault("meta", {})
+            variants["meta"]["audioSegments"] = reuse_meta["audioSegments"]
+        skipped.extend(["tts", "catbox"])
+    else:
+        graph["tts"] = ((), lambda _: _synthesize_mp3(text))
+        graph["catbox"] = (("tts",), lambda deps: _upload_mp3(deps["tts"][0]))
+
+    results, errors = run_stage_graph(graph, on_stage=on_stage) if graph else ({}, {})
+    if "tts" in results:
+        tts_path, tts_info = results["tts"]
+        _remove_quietly(tts_path)
+        # Ordered paragraph segment hashes; edits only re-synthesize changed ones
+        variants.setdefault("meta", {})
+        variants["meta"]["audioSegments"] = tts_info
+
+    # 1) Adapted text per student type via AI
+    for student_type in ADAPTATION_GUIDELINES:
+        if student_type in results:
+            ai_result = results[student_type]
+            add_variant(student_type, ai_result.get("content") or "", ai_result.get("tips"))
+        elif student_type in errors:
+            # Non-fatal: continue without this variant
+            variants[f"{student_type}Error"] = str(errors[student_type])
+
+    # 2) TTS audio uploaded to Catbox
+    for stage, error_key in (("tts", "audioSynthesisError"), ("catbox", "audioUploadError")):
+        err = errors.get(stage)
+        if err is not None:
+            variants["audioError" if isinstance(err, OSError) else error_key] = str(err)
+    if "catbox" in results:
+        variants["audioUrl"] = results["catbox"]
+    return variants, skipped
+
+
+def _find_reusable_variants(text: str, text_hash: str) -> Optional[Dict]:
+    """Look up variants of an earlier upload with identical content; lookup errors count as a miss."""
+    if not text.strip():
+        return None
+    try:
+        return find_variants_by_hash(text_hash)
+    except PyMongoError as e:
+        logger.warning(f"Dedup lookup failed, regenerating variants: {e}")
+        return None
+
+
+def _timed(on_stage: Optional[StageCallback], timings: Dict[str, float]) -> StageCallback:
+    """Wrap a stage callback so finished stages are timed into `timings` and the histograms."""
+    def callback(name: str, status: str, elapsed: Optional[float], error: Optional[str]) -> None:
+        if elapsed is not None:
+            timings[name] = elapsed
+            record_stage_latency(name, elapsed)
+        if on_stage:
+            on_stage(name, status, elapsed, error)
+    return callback
+
+
+def _variants_and_meta(
+    text: str,
+    on_stage: Optional[StageCallback] = None,
+    text_hash: Optional[str] = None,
+) -> Tuple[Dict, Dict]:
+    """Build (or reuse) variants for the text; returns (variants, note meta)."""
+    text_hash = text_hash or content_hash(text)
+    existing = _find_reusable_variants(text, text_hash)
+    variants, skipped = build_variants(
+        text,
+        on_stage=on_stage,
+        reuse=existing["variants"] if existing else None,
+        text_hash=text_hash,
+    )
+    meta: Dict = {}
+    if skipped:
+        meta["skippedStages"] = skipped
+        meta["reusedFromNoteId"] = existing["_id"] if existing else None
+    return variants, meta
+
+
+def process_upload(
+    *,
+    school: str,
+    class_name: str,
+    subject: str,
+    topic: str,
+    uploaded_by: Optional[str],
+    source_type: str,
+    path: Optional[Path] = None,
+    data: Optional[bytes] = None,
+    text: Optional[str] = None,
+    original_filename: Optional[str] = None,
+    language: Optional[str] = None,
+    on_stage: Optional[StageCallback] = None,
+    require_text: bool = False,
+) -> Dict:
+    """
+    Run the full teacher upload pipeline and return the saved note.
+
+    When an earlier note has the same content hash its variants are reused and the
+    skipped stages are recorded in the note's meta.skippedStages.
+
+    Raises ValueError for processing errors (e.g. STT failure, or with
+    `require_text` a document no text could be extracted from), TextTooLong
+    for text over MAX_DOCUMENT_LENGTH characters, and lets PyMongoError
+    propagate from the final save.
+    """
+    start = time.time()
+    timings: Dict[str, float] = {}
+    on_stage = _timed(on_stage, timings)
+
+    base_text = resolve_text(
+        source_type=source_type,
+        path=path,
+        data=data,
+        text=text,
+        original_filename=original_filename,
+        language=language,
+        on_stage=on_stage,
+    )
+    if require_text:
+        if base_text.startswith("Error:"):
+            raise ValueError(base_text[len("Error:"):].strip())
+        if not base_text.strip():
+            raise ValueError("No text could be extracted")
+    check_text_length(base_text)
+    # Hashed once: the dedup lookup, the AI cache keys and the saved note share it
+    text_hash = content_hash(base_text)
+    variants, meta = _variants_and_meta(base_text, on_stage=on_stage, text_hash=text_hash)
+    if source_type == "audio":
+        meta["language"] = language
+    # Per-stage seconds up to (not including) the save itself
+    meta["timings"] = dict(timings, total=round(time.time() - start, 3))
+
+    with _stage(on_stage, "save"):
+        return save_note(
+            school=school,
+            class_name=class_name,
+            subject=subject,
+            topic=topic,
+            text=base_text,
+            text_hash=text_hash,
+            uploaded_by=uploaded_by,
+            source_type=source_type,
+            original_filename=original_filename,
+            extra_meta=meta,
+            variants=variants or None,
+        )
+
+
+# Maximum files of one bulk upload processed (extract, AI/TTS/Catbox, save) at the same time
+BULK_UPLOAD_CONCURRENCY = int(os.getenv("BULK_UPLOAD_CONCURRENCY", "4"))
+
+# Callback signature: on_item(index, manifest_entry) whenever a bulk item changes
+ItemCallback = Callable[[int, Dict], None]
+
+
+def list_archive_documents(path: Path, max_files: int, max_bytes: int) -> List[str]:
+    """
+    Names of the documents in a zip archive on disk, skipping directories and
+    hidden/macOS metadata entries. Raises ValueError for invalid or oversized
+    archives.
+    """
+    try:
+        with zipfile.ZipFile(path) as zf:
+            entries = [
+                info for info in zf.infolist()
+                if not info.is_dir() and not info.filename.startswith("__MACOSX/")
+                and not PurePosixPath(info.filename).name.startswith(".")
+            ]
+    except zipfile.BadZipFile as e:
+        raise ValueError(f"Invalid zip archive: {e}") from e
+    if not entries:
+        raise ValueError("The archive contains no documents")
+    if len(entries) > max_files:
+        raise ValueError(f"Too many files in archive (max {max_files})")
+    if sum(info.file_size for info in entries) > max_bytes:
+        raise ValueError(f"Archive too large when uncompressed (max {max_bytes} bytes)")
+    return [info.filename for info in entries]
+
+
+def assign_topics(names: List[str], topic_map: Dict[str, str], aligned: Optional[List[str]] = None) -> List[Tuple[str, str]]:
+    """
+    Pair each file name with its topic: `topic_map[name]`, else the topic at the
+    same position in `aligned`, else the file name without extension.
+    """
+    aligned = aligned or []
+    items: List[Tuple[str, str]] = []
+    for index, name in enumerate(names):
+        topic = topic_map.get(name) or (aligned[index] if index < len(aligned) else "")
+        items.append((name, str(topic or PurePosixPath(name).stem).strip()))
+    return items
+
+
+def bulk_file_reader(path: Path, archive: bool) -> Callable[[int, str], bytes]:
+    """
+    Return read(index, filename) for the documents of a bulk upload: entries of
+    the zip at `path`, or files named by their index in the directory `path`.
+    """
+    if not archive:
+        return lambda index, _: (Path(path) / str(index)).read_bytes()
+
+    def read(_: int, filename: str) -> bytes:
+        # Each entry is read only when its document is processed; a ZipFile per
+        # read keeps concurrent workers independent
+        with zipfile.ZipFile(path) as zf:
+            return zf.read(filename)
+    return read
+
+
+def process_bulk_upload(
+    *,
+    school: str,
+    class_name: str,
+    subject: str,
+    uploaded_by: Optional[str],
+    items: List[Tuple[str, str]],
+    read_file: Callable[[int, str], bytes],
+    on_item: Optional[ItemCallback] = None,
+) -> List[Dict]:
+    """
+    Run the upload pipeline for many documents, BULK_UPLOAD_CONCURRENCY at a time.
+
+    `items` are (filename, topic) pairs; read_file(index, filename) returns the
+    document's bytes. Each note is saved as soon as its document is processed,
+    so a failure or crash later on does not lose it. on_item(index, entry) is
+    called whenever an item starts, is created or fails. Returns the manifest
+    entry of every item, in input order.
+    """
+    manifest: List[Dict] = [
+        {"filename": name, "topic": topic, "status": "queued", "noteId": None}
+        for name, topic in items
+    ]
+    app = current_app._get_current_object() if has_app_context() else None
+
+    def notify(index: int) -> None:
+        if on_item:
+            on_item(index, dict(manifest[index]))
+
+    def process(index: int) -> None:
+        entry = manifest[index]
+        entry["status"] = "running"
+        notify(index)
+        try:
+            note = process_upload(
+                school=school,
+                class_name=class_name,
+                subject=subject,
+                topic=entry["topic"],
+                uploaded_by=uploaded_by,
+                source_type="document",
+                data=read_file(index, entry["filename"]),
+                original_filename=entry["filename"],
+                require_text=True,
+            )
+        except PyMongoError as e:
+            entry.update(status="failed", error=f"Database error: {str(e)}")
+        except Exception as e:
+            logger.warning(f"Bulk upload item {entry['filename']} failed: {str(e)}")
+            entry.update(status="failed", error=str(e))
+        else:
+            variants = note.get("variants") or {}
+            entry.update(
+                status="created",
+                noteId=note.get("_id"),
+                skippedStages=(note.get("meta") or {}).get("skippedStages", []),
+                variantErrors={k: v for k, v in variants.items() if k.endswith("Error")},
+            )
+        notify(index)
+
+    def run(index: int) -> None:
+        if app is None:
+            process(index)
+        else:
+            with app.app_context():
+                process(index)
+
+    with ThreadPoolExecutor(max_workers=max(1, BULK_UPLOAD_CONCURRENCY), thread_name_prefix="bulk-upload") as pool:
+        for future in [pool.submit(run, index) for index in range(len(manifest))]:
+            future.result()
+    return manifest
@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import os
+import shutil
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Optional
+
+from pymongo import ReturnDocument
+from pymongo.collection import Collection
+
+from .db import get_db
+from .upload_jobs_service import UPLOAD_STAGING_DIR
+
+
+# Sessions (and their staged bytes) are abandoned after this many hours
+UPLOAD_SESSION_TTL_HOURS = int(os.getenv("UPLOAD_SESSION_TTL_HOURS", "24"))
+
+
+class OffsetMismatch(Exception):
+    """A chunk was sent for an offset other than the session's current size."""
+
+    def __init__(self, expected: int):
+        super().__init__(f"Expected offset {expected}")
+        self.expected = expected
+
+
+def _sessions() -> Collection:
+    return get_db()["upload_sessions"]
+
+
+def ensure_indexes() -> None:
+    col = _sessions()
+    col.create_index("expiresAt", expireAfterSeconds=0, name="expiresAt_ttl")
+    col.create_index("uploadedBy")
+
+
+def _sessions_root() -> Path:
+    return Path(UPLOAD_STAGING_DIR) / "sessions"
+
+
+def staged_path(session: Dict) -> Path:
+    return _sessions_root() / session["_id"] / session["filename"]
+
+
+def _prune_abandoned() -> None:
+    """Remove staged bytes of sessions older than the TTL (Mongo expires the documents)."""
+    root = _sessions_root()
+    if not root.exists():
+        return
+    cutoff = time.time() - UPLOAD_SESSION_TTL_HOURS * 3600
+    for session_dir in root.iterdir():
+        try:
+            if session_dir.is_dir() and session_dir.stat().st_mtime < cutoff:
+                shutil.rmtree(session_dir, ignore_errors=True)
+        except OSError:
+            pass
+
+
+def create_session(*, uploaded_by: Optional[str], kind: str, filename: str, total_size: int, params: Dict) -> Dict:
+    """Open an upload session and create its empty staging file."""
+    ensure_indexes()
+    _prune_abandoned()
+    now = datetime.utcnow()
+    session: Dict = {
+        "_id": uuid.uuid4().hex,
+        "uploadedBy": uploaded_by,
+        "kind": kind,
+        "filename": filename,
+        "totalSize": total_size,
+        "receivedBytes": 0,
+        "status": "open",
+        "params": params,
+        "createdAt": now,
+        "expiresAt": now + timedelta(hours=UPLOAD_SESSION_TTL_HOURS),
+    }
+    path = staged_path(session)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.touch()
+    _sessions().insert_one(session)
+    return session
+
+
+def get_session(session_id: str) -> Optional[Dict]:
+    return _sessions().find_one({"_id": session_id})
+
+
+def append_chunk(session: Dict, offset: int, data: bytes) -> Dict:
+    """
+    Write `data` at `offset` and advance receivedBytes.
+
+    Writing at the offset (not appending) keeps retried or duplicated chunks
+    harmless; the counter only moves if it still equals `offset`.
+    Raises OffsetMismatch or ValueError.
+    """
+    if session.get("status") != "open":
+        raise ValueError("Upload session is not open")
+    if offset != session["receivedBytes"]:
+        raise OffsetMismatch(session["receivedBytes"])
+    if offset + len(data) > session["totalSize"]:
+        raise ValueError("Chunk exceeds the declared upload size")
+
+    with staged_path(session).open("r+b") as f:
+        f.seek(offset)
+        f.write(data)
+
+    updated = _sessions().find_one_and_update(
+        {"_id": session["_id"], "status": "open", "receivedBytes": offset},
+        {"$set": {"receivedBytes": offset + len(data)}},
+        return_document=ReturnDocument.AFTER,
+    )
+    if updated is None:
+        current = get_session(session["_id"]) or {}
+        raise OffsetMismatch(current.get("receivedBytes", 0))
+    return updated
+
+
+def mark_completed(session: Dict) -> Optional[Dict]:
+    """Atomically move an open, fully received session to 'completed'; None if not possible."""
+    return _sessions().find_one_and_update(
+        {"_id": session["_id"], "status": "open", "receivedBytes": session["totalSize"]},
+        {"$set": {"status": "completed", "completedAt": datetime.utcnow()}},
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def discard_staging(session: Dict) -> None:
+    shutil.rmtree(staged_path(session).parent, ignore_errors=True)
@@ -4,7 +4,7 @@ Admin utilities for database management and system administration.
 
 from functools import wraps
 from flask import jsonify
-from flask_jwt_extended import get_jwt_identity
+from flask_jwt_extended import get_jwt, get_jwt_identity
 
 
 def admin_required(f):
@@ -22,8 +22,8 @@ def admin_required(f):
         if not current_user:
             return jsonify({"error": "Authentication required"}), 401
         
-        # Check if user has admin role
-        user_role = current_user.get("role")
+        # Check if user has admin role (identity is the email; role lives in the claims)
+        user_role = (get_jwt() or {}).get("role")
         if user_role != "admin":
             return jsonify({"error": "Admin privileges required"}), 403
         
@@ -44,7 +44,7 @@ def teacher_or_admin_required(f):
             return jsonify({"error": "Authentication required"}), 401
         
         # Check if user has teacher or admin role
-        user_role = current_user.get("role")
+        user_role = (get_jwt() or {}).get("role")
         if user_role not in ["teacher", "admin"]:
             return jsonify({"error": "Teacher or admin privileges required"}), 403
         
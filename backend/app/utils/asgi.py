@@ -0,0 +1,121 @@
+"""
+Small ASGI request/response helpers for the routes served natively by
+app/asgi.py (everything else goes through Flask).
+"""
+
+from __future__ import annotations
+
+import json
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+import jwt
+from flask_jwt_extended import decode_token
+from flask_jwt_extended.exceptions import JWTExtendedException
+
+from .sse import format_event
+
+
+Headers = List[Tuple[bytes, bytes]]
+
+
+class AsgiRequest:
+    """The parts of an ASGI HTTP request the async handlers need."""
+
+    def __init__(self, scope: Dict, body: bytes):
+        self.method: str = scope.get("method", "GET")
+        self.path: str = scope.get("path", "")
+        self.headers: Dict[str, str] = {
+            name.decode("latin-1").lower(): value.decode("latin-1") for name, value in scope.get("headers", [])
+        }
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        self.args: Dict[str, str] = {name: values[0] for name, values in query.items()}
+        self.body = body
+
+    def json(self) -> Dict:
+        """The body as a JSON object ({} when empty); ValueError if it is not valid JSON."""
+        if not self.body.strip():
+            return {}
+        data = json.loads(self.body)
+        return data if isinstance(data, dict) else {}
+
+
+async def read_body(receive, max_bytes: int) -> Optional[bytes]:
+    """Read the whole request body; None if it exceeds max_bytes."""
+    chunks: List[bytes] = []
+    size = 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > max_bytes:
+            return None
+        chunks.append(chunk)
+        if not message.get("more_body"):
+            break
+    return b"".join(chunks)
+
+
+def authenticate(request: AsgiRequest) -> Tuple[Dict, Optional[Tuple[Dict, int]]]:
+    """
+    Verify the Bearer access token like @jwt_required(); needs an app context.
+    Returns (claims, None) or ({}, (error body, status)) with flask-jwt-extended's
+    default messages.
+    """
+    header = request.headers.get("authorization")
+    if not header:
+        return {}, ({"msg": "Missing Authorization Header"}, 401)
+    parts = header.split()
+    if len(parts) != 2 or parts[0] != "Bearer":
+        return {}, ({"msg": "Bad Authorization header. Expected 'Authorization: Bearer <JWT>'"}, 422)
+    try:
+        claims = decode_token(parts[1])
+    except jwt.ExpiredSignatureError:
+        return {}, ({"msg": "Token has expired"}, 401)
+    except (jwt.InvalidTokenError, JWTExtendedException) as e:
+        return {}, ({"msg": str(e)}, 422)
+    if claims.get("type") != "access":
+        return {}, ({"msg": "Only non-refresh tokens are allowed"}, 422)
+    return claims, None
+
+
+def cors_headers(request: AsgiRequest) -> Headers:
+    """Same headers flask-cors adds with the app's default CORS(app) settings."""
+    origin = request.headers.get("origin")
+    if origin:
+        return [(b"access-control-allow-origin", origin.encode("latin-1")), (b"vary", b"Origin")]
+    return [(b"access-control-allow-origin", b"*")]
+
+
+async def send_json(send, body: Dict, status: int, headers: Headers = ()) -> None:
+    payload = json.dumps(body, default=str).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(payload)).encode("ascii")),
+            *headers,
+        ],
+    })
+    await send({"type": "http.response.body", "body": payload})
+
+
+async def send_event_stream(send, events: AsyncIterator[Dict], headers: Headers = ()) -> None:
+    """Stream {"event", "data"} dicts as text/event-stream (see utils.sse.sse_response)."""
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [
+            (b"content-type", b"text/event-stream; charset=utf-8"),
+            (b"cache-control", b"no-cache"),
+            # Stop nginx-style proxies from buffering the stream
+            (b"x-accel-buffering", b"no"),
+            *headers,
+        ],
+    })
+    async for event in events:
+        await send({"type": "http.response.body", "body": format_event(event).encode("utf-8"), "more_body": True})
+    await send({"type": "http.response.body", "body": b""})
@@ -1,7 +1,7 @@
 import shutil
 import subprocess
 from pathlib import Path
-from typing import Tuple
+from typing import List, Tuple
 
 
 def ensure_wav_pcm16_mono_16k(input_path: Path) -> Tuple[Path, bool]:
@@ -45,3 +45,25 @@ def ensure_wav_pcm16_mono_16k(input_path: Path) -> Tuple[Path, bool]:
         return input_path, False
 
 
+def _strip_id3(data: bytes) -> bytes:
+    """Remove ID3v2 header and ID3v1 trailer so only raw MPEG frames remain."""
+    if data[:3] == b"ID3" and len(data) >= 10:
+        # Tag size is a 28-bit synchsafe integer; a footer adds another 10 bytes
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        footer = 10 if data[5] & 0x10 else 0
+        data = data[10 + size + footer:]
+    if len(data) >= 128 and data[-128:-125] == b"TAG":
+        data = data[:-128]
+    return data
+
+
+def concat_mp3_files(paths: List[Path], output_path: Path) -> None:
+    """
+    Join MP3 files at the frame level (no re-encoding).
+
+    Inputs must share the same encoding parameters, e.g. segments produced by the
+    same Azure output format; tags are stripped so players see one frame stream.
+    """
+    with output_path.open("wb") as out:
+        for path in paths:
+            out.write(_strip_id3(path.read_bytes()))
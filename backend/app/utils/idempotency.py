@@ -0,0 +1,146 @@
+"""
+Idempotency-Key support for expensive POST endpoints.
+
+Clients that retry after a timeout send the same `Idempotency-Key` header; the
+first request runs, and retries replay its stored response (or wait for it
+while it is still running) instead of redoing the work.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import time
+from functools import wraps
+from typing import Callable
+
+from flask import Response, jsonify, make_response, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from pymongo.errors import PyMongoError
+
+from ..services import idempotency_service
+
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+# How long a retry waits for the in-flight original before answering 409
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "60"))
+_POLL_INTERVAL_SECONDS = 0.5
+_REPLAYED_HEADERS = ("Content-Disposition", "Location")
+
+
+def _request_fingerprint() -> str:
+    """Hash of the request payload, so a key reused for different input is rejected."""
+    digest = hashlib.sha256()
+    digest.update(json.dumps(sorted(request.args.items(multi=True))).encode())
+    digest.update(json.dumps(sorted(request.form.items(multi=True))).encode())
+    for field, storage in sorted(request.files.items(multi=True), key=lambda item: item[0]):
+        digest.update(f"{field}:{storage.filename}".encode())
+        stream = storage.stream
+        pos = stream.tell()
+        for chunk in iter(lambda: stream.read(64 * 1024), b""):
+            digest.update(chunk)
+        stream.seek(pos)
+    if request.is_json:
+        digest.update(json.dumps(request.get_json(silent=True), sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def _scope(key: str) -> str:
+    try:
+        verify_jwt_in_request(optional=True)
+        identity = get_jwt_identity()
+    except Exception:
+        identity = None
+    owner = identity or request.remote_addr or "anonymous"
+    return hashlib.sha256(f"{owner}|{request.method}|{request.path}|{key}".encode()).hexdigest()
+
+
+def _replay(record: dict) -> Response:
+    stored = record.get("response") or {}
+    response = Response(
+        bytes(stored.get("body") or b""),
+        status=stored.get("statusCode", 200),
+        mimetype=stored.get("mimetype"),
+    )
+    for name, value in (stored.get("headers") or {}).items():
+        response.headers[name] = value
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+
+def idempotent(f: Callable):
+    """
+    Honor an optional Idempotency-Key header on a view.
+
+    Place below @jwt_required() so the key is scoped to the caller. Responses
+    with status < 500 are stored; server errors release the key for retries.
+    If the key store is unavailable the request simply runs without it.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        key = (request.headers.get(IDEMPOTENCY_HEADER) or "").strip()
+        if not key:
+            return f(*args, **kwargs)
+        if len(key) > 255:
+            return jsonify({"error": f"{IDEMPOTENCY_HEADER} must be at most 255 characters"}), 400
+
+        scope = _scope(key)
+        try:
+            state, record = idempotency_service.begin(scope, _request_fingerprint())
+        except PyMongoError as e:
+            logger.warning(f"Idempotency store unavailable, running request without it: {e}")
+            return f(*args, **kwargs)
+
+        if state == "mismatch":
+            return jsonify({"error": f"{IDEMPOTENCY_HEADER} was already used for a different request"}), 422
+        if state == "completed":
+            return _replay(record)
+        if state == "in_progress":
+            # Attach to the in-flight original and return its response once stored
+            deadline = time.time() + IDEMPOTENCY_WAIT_SECONDS
+            while time.time() < deadline:
+                time.sleep(_POLL_INTERVAL_SECONDS)
+                try:
+                    record = idempotency_service.get(scope)
+                except PyMongoError:
+                    break
+                if record is None:
+                    break
+                if record.get("status") == "completed":
+                    return _replay(record)
+            response = jsonify({"error": "A request with this Idempotency-Key is still in progress"})
+            response.headers["Retry-After"] = str(int(_POLL_INTERVAL_SECONDS * 10))
+            return response, 409
+
+        try:
+            response = make_response(f(*args, **kwargs))
+        except Exception:
+            _release_quietly(scope)
+            raise
+
+        if response.status_code >= 500:
+            _release_quietly(scope)
+            return response
+
+        # send_file responses stream from disk; buffer them so they can be stored
+        response.direct_passthrough = False
+        headers = {h: response.headers[h] for h in _REPLAYED_HEADERS if h in response.headers}
+        try:
+            idempotency_service.complete(scope, response.status_code, response.get_data(), response.mimetype, headers)
+        except PyMongoError as e:
+            logger.warning(f"Failed to store idempotent response: {e}")
+            _release_quietly(scope)
+        return response
+
+    return decorated_function
+
+
+def _release_quietly(scope: str) -> None:
+    try:
+        idempotency_service.release(scope)
+    except PyMongoError as e:
+        logger.warning(f"Failed to release idempotency key: {e}")
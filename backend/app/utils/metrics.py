@@ -0,0 +1,88 @@
+"""
+In-process latency histograms for pipeline stages.
+
+Each backend worker process keeps its own counters; they reset on restart.
+"""
+
+from __future__ import annotations
+
+import threading
+from typing import Dict, List, Tuple
+
+
+# Upper bounds (seconds) of the histogram buckets; the last bucket is +Inf
+LATENCY_BUCKETS: Tuple[float, ...] = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram, safe to update from multiple threads."""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self._buckets = buckets
+        self._counts: List[int] = [0] * (len(buckets) + 1)
+        self._count = 0
+        self._sum = 0.0
+        self._max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        index = len(self._buckets)
+        for i, bound in enumerate(self._buckets):
+            if seconds <= bound:
+                index = i
+                break
+        with self._lock:
+            self._counts[index] += 1
+            self._count += 1
+            self._sum += seconds
+            self._max = max(self._max, seconds)
+
+    def _quantile(self, counts: List[int], total: int, q: float) -> float:
+        """Upper bound of the bucket containing the q-quantile (max for the +Inf bucket)."""
+        target = q * total
+        running = 0
+        for i, c in enumerate(counts):
+            running += c
+            if running >= target and c:
+                return self._buckets[i] if i < len(self._buckets) else self._max
+        return self._max
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            counts = list(self._counts)
+            total, total_sum, max_seen = self._count, self._sum, self._max
+        cumulative = 0
+        buckets = []
+        for i, c in enumerate(counts):
+            cumulative += c
+            le = str(self._buckets[i]) if i < len(self._buckets) else "+Inf"
+            buckets.append({"le": le, "count": cumulative})
+        return {
+            "count": total,
+            "sum": round(total_sum, 3),
+            "avg": round(total_sum / total, 3) if total else 0.0,
+            "max": round(max_seen, 3),
+            "p50": self._quantile(counts, total, 0.5) if total else 0.0,
+            "p95": self._quantile(counts, total, 0.95) if total else 0.0,
+            "buckets": buckets,
+        }
+
+
+_registry_lock = threading.Lock()
+_stage_histograms: Dict[str, LatencyHistogram] = {}
+
+
+def record_stage_latency(stage: str, seconds: float) -> None:
+    """Record one stage duration in the process-wide histogram for that stage."""
+    histogram = _stage_histograms.get(stage)
+    if histogram is None:
+        with _registry_lock:
+            histogram = _stage_histograms.setdefault(stage, LatencyHistogram())
+    histogram.observe(seconds)
+
+
+def stage_latency_snapshot() -> Dict[str, Dict]:
+    """Return histogram snapshots for every recorded stage."""
+    with _registry_lock:
+        items = list(_stage_histograms.items())
+    return {stage: histogram.snapshot() for stage, histogram in sorted(items)}
@@ -0,0 +1,42 @@
+"""
+Server-sent events helpers for streaming AI responses.
+"""
+
+from __future__ import annotations
+
+import json
+from typing import Dict, Iterable, Iterator, Optional
+
+from flask import Response, request, stream_with_context
+
+
+def stream_requested(flag, accept: Optional[str]) -> bool:
+    """True if a `stream` flag (bool or "1"/"true"/"yes") or the Accept header asks for SSE."""
+    if isinstance(flag, str):
+        flag = flag.strip().lower() in ("1", "true", "yes")
+    return bool(flag) or "text/event-stream" in (accept or "")
+
+
+def wants_event_stream(data: Dict) -> bool:
+    """True if the client asked for SSE via `stream` (body or query) or the Accept header."""
+    return stream_requested(data.get("stream", request.args.get("stream")), request.headers.get("Accept"))
+
+
+def format_event(event: Dict) -> str:
+    """One {"event", "data"} dict as a text/event-stream message."""
+    payload = json.dumps(event.get("data"), default=str)
+    return f"event: {event['event']}\ndata: {payload}\n\n"
+
+
+def _format(events: Iterable[Dict]) -> Iterator[str]:
+    for event in events:
+        yield format_event(event)
+
+
+def sse_response(events: Iterable[Dict]) -> Response:
+    """Stream {"event", "data"} dicts as a text/event-stream response."""
+    response = Response(stream_with_context(_format(events)), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    # Stop nginx-style proxies from buffering the stream
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
@@ -1,11 +1,12 @@
 #!/usr/bin/env python3
 
 
+import io
 import os
 import sys
 import argparse
 from pathlib import Path
-from typing import Optional, Dict, List, Union
+from typing import BinaryIO, Optional, Dict, List, Union
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import json
 from datetime import datetime
@@ -95,6 +96,31 @@ class SimpleDocumentExtractor:
         else:
             raise ValueError(f"Path does not exist: {path}")
     
+    def extract_bytes(self, data: Union[bytes, BinaryIO], filename: str) -> Dict[str, str]:
+        """
+        Extract text from in-memory file contents, e.g. an upload stream.
+        
+        Args:
+            data: Raw file bytes or a binary file-like object (read fully)
+            filename: Original file name; its extension selects the parser
+            
+        Returns:
+            Dictionary with the filename as key and extracted text as value
+        """
+        if not isinstance(data, (bytes, bytearray)):
+            data = data.read()
+        ext = Path(filename).suffix.lower()
+        
+        if ext not in self.supported_formats:
+            return {filename: f"Error: Unsupported format: {ext}"}
+        
+        method = getattr(self, self.supported_formats[ext])
+        
+        try:
+            return {filename: method(bytes(data))}
+        except Exception as e:
+            return {filename: f"Error: {str(e)}"}
+    
     def _extract_single_file(self, file_path: Path) -> Dict[str, str]:
         """Extract text from a single file."""
         ext = file_path.suffix.lower()
@@ -139,14 +165,26 @@ class SimpleDocumentExtractor:
         
         return results
     
-    def extract_pdf(self, file_path: Path) -> str:
+    @staticmethod
+    def _as_source(file_path: Union[Path, bytes]):
+        """Wrap in-memory bytes in a file-like object; paths are passed through."""
+        if isinstance(file_path, (bytes, bytearray)):
+            return io.BytesIO(file_path)
+        return file_path
+    
+    def extract_pdf(self, file_path: Union[Path, bytes]) -> str:
         """Extract text from PDF using PyMuPDF (faster than PyPDF2/pdfplumber)."""
         if not PDF_AVAILABLE:
             raise ImportError("PyMuPDF not installed. Install with: pip install pymupdf")
         
         text_parts = []
         
-        with fitz.open(file_path) as pdf:
+        if isinstance(file_path, (bytes, bytearray)):
+            pdf_doc = fitz.open(stream=file_path, filetype="pdf")
+        else:
+            pdf_doc = fitz.open(file_path)
+        
+        with pdf_doc as pdf:
             for page_num, page in enumerate(pdf, 1):
                 text = page.get_text()
                 if text.strip():
@@ -154,12 +192,12 @@ class SimpleDocumentExtractor:
         
         return '\n'.join(text_parts)
     
-    def extract_docx(self, file_path: Path) -> str:
+    def extract_docx(self, file_path: Union[Path, bytes]) -> str:
         """Extract text from Word document."""
         if not DOCX_AVAILABLE:
             raise ImportError("python-docx not installed. Install with: pip install python-docx")
         
-        doc = Document(file_path)
+        doc = Document(self._as_source(file_path))
         text_parts = []
         
         # Extract paragraphs
@@ -176,12 +214,12 @@ class SimpleDocumentExtractor:
         
         return '\n'.join(text_parts)
     
-    def extract_pptx(self, file_path: Path) -> str:
+    def extract_pptx(self, file_path: Union[Path, bytes]) -> str:
         """Extract text from PowerPoint presentation."""
         if not PPTX_AVAILABLE:
             raise ImportError("python-pptx not installed. Install with: pip install python-pptx")
         
-        prs = Presentation(file_path)
+        prs = Presentation(self._as_source(file_path))
         text_parts = []
         
         for slide_num, slide in enumerate(prs.slides, 1):
@@ -196,11 +234,19 @@ class SimpleDocumentExtractor:
         
         return '\n'.join(text_parts)
     
-    def extract_text(self, file_path: Path) -> str:
+    def extract_text(self, file_path: Union[Path, bytes]) -> str:
         """Extract text from plain text files with automatic encoding detection."""
         # Try common encodings
         encodings = ['utf-8', 'utf-8-sig', 'latin-1', 'cp1252', 'iso-8859-1']
         
+        if isinstance(file_path, (bytes, bytearray)):
+            for encoding in encodings:
+                try:
+                    return file_path.decode(encoding)
+                except (UnicodeDecodeError, UnicodeError):
+                    continue
+            return file_path.decode('utf-8', errors='ignore')
+        
         for encoding in encodings:
             try:
                 with open(file_path, 'r', encoding=encoding) as f:
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Gemini Provider Benchmark
+
+Compares building a fresh provider for every request (the old behaviour) with
+reusing the pooled provider for the key.
+
+Usage:
+    python scripts/benchmark_gemini_providers.py [--iterations N] [--live]
+
+Without --live only client construction is timed (no network). With --live each
+iteration also sends a tiny prompt, so connection and TLS setup is included.
+"""
+
+import sys
+import os
+import argparse
+import statistics
+import time
+
+# Add the parent directory to the path so we can import app modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+
+from app.services.ai_service import GeminiService, _load_api_keys
+
+
+PROMPT = "Reply with the single word OK."
+
+
+def _time_calls(label, get_provider, iterations, live):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        provider = get_provider()
+        if live:
+            provider.generate(PROMPT)
+        samples.append((time.perf_counter() - start) * 1000)
+    print(
+        f"{label:<8} avg {statistics.mean(samples):8.2f} ms   "
+        f"p50 {statistics.median(samples):8.2f} ms   max {max(samples):8.2f} ms"
+    )
+    return statistics.mean(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark fresh vs pooled Gemini providers")
+    parser.add_argument("--iterations", type=int, default=20, help="Requests per variant (default 20)")
+    parser.add_argument("--live", action="store_true", help="Also send a small prompt on each iteration")
+    args = parser.parse_args()
+
+    load_dotenv()
+    keys = _load_api_keys()
+    if not keys:
+        print("❌ No Gemini API keys configured (GEMINI_API_KEY)")
+        return 1
+
+    service = GeminiService(max_tokens=16)
+    key = keys[0]
+    try:
+        service._get_provider(key)  # warm up imports and the pool
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        return 1
+
+    mode = "construction + request" if args.live else "construction only"
+    print(f"🔍 Gemini provider benchmark ({mode}, {args.iterations} iterations)")
+    print("=" * 60)
+    fresh = _time_calls("fresh", lambda: service._mk_provider(key), args.iterations, args.live)
+    pooled = _time_calls("pooled", lambda: service._get_provider(key), args.iterations, args.live)
+    print("=" * 60)
+    print(f"✅ Saved {fresh - pooled:.2f} ms per request by reusing the provider")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
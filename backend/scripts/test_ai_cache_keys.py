@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+from app.services.ai_service import _qna_cache_key
+
+
+NOTES = "The water cycle moves water between the oceans, the air and the land."
+
+
+def key(question: str) -> str:
+    return _qna_cache_key("vision", NOTES, question)
+
+
+def main() -> int:
+    # Case, punctuation, whitespace and articles do not change the question
+    same = [
+        ("What is evaporation?", "what is evaporation"),
+        ("What is  the water cycle?", "What is water cycle"),
+        ("Why is a cloud white?", "WHY IS AN CLOUD WHITE!"),
+    ]
+    for first, second in same:
+        assert key(first) == key(second), f"expected one cache key for {first!r} and {second!r}"
+    print("OK: case, punctuation and article variants share a cache key")
+
+    # Words that reverse or change the question keep their own keys
+    different = [
+        ("What happens before it rains?", "What happens after it rains?"),
+        ("Which ocean holds more water?", "Which ocean holds most water?"),
+        ("Is the cloud above the sea?", "Is the cloud below the sea?"),
+        ("Can water evaporate at night?", "Should water evaporate at night?"),
+        ("Does ice melt?", "Does ice not melt?"),
+        ("What causes rain?", "What caused rain?"),
+    ]
+    for first, second in different:
+        assert key(first) != key(second), f"{first!r} and {second!r} must not share a cache key"
+    print("OK: prepositions, comparatives, modals, negations and tenses keep separate cache keys")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import time
+from collections import deque
+
+from app.services import ai_service
+
+
+class SlowProvider:
+    """Answers after `seconds`, or raises if `fails` is set."""
+
+    def __init__(self, name: str, seconds: float, fails: bool = False):
+        self.name = name
+        self.seconds = seconds
+        self.fails = fails
+
+    def generate_with_usage(self, prompt):
+        time.sleep(self.seconds)
+        if self.fails:
+            raise RuntimeError(f"{self.name} failed")
+        return self.name, {}
+
+
+def main() -> int:
+    providers = {}
+    original_provider, original_delay = ai_service.GeminiService._get_provider, ai_service._hedge_delay
+    ai_service.GeminiService._get_provider = lambda self, key: providers[key]
+    ai_service._hedge_delay = lambda: 0.1
+    try:
+        service = ai_service.GeminiService()
+
+        # Slow but successful primary, fast backup: the backup's answer is returned first
+        providers.update(primary=SlowProvider("primary", 1.5), backup=SlowProvider("backup", 0.05))
+        start = time.time()
+        result, key = service._call_hedged("prompt", "primary", deque(["backup"]), 10)
+        elapsed = time.time() - start
+        assert (result, key) == ("backup", "backup"), (result, key)
+        assert elapsed < 1.0, f"waited {elapsed:.2f}s for the slow primary"
+        stats = service.get_stats()["hedging"]
+        assert stats["hedges_fired"] == 1 and stats["hedges_won"] == 1, stats
+        print("OK: a slow primary is not waited out once the backup has answered")
+
+        # Primary answers before the budget: no backup is sent
+        providers.update(primary=SlowProvider("primary", 0.01))
+        assert service._call_hedged("prompt", "primary", deque(["backup"]), 10) == ("primary", "primary")
+        assert service.get_stats()["hedging"]["hedges_fired"] == 1
+        print("OK: a fast primary is not hedged")
+
+        # First answer fails: the other call's answer is used
+        providers.update(primary=SlowProvider("primary", 0.3), backup=SlowProvider("backup", 0.05, fails=True))
+        assert service._call_hedged("prompt", "primary", deque(["backup"]), 10) == ("primary", "primary")
+        print("OK: a failed backup falls back to the primary")
+
+        # Both fail: the last error is raised
+        providers.update(primary=SlowProvider("primary", 0.3, fails=True))
+        try:
+            service._call_hedged("prompt", "primary", deque(["backup"]), 10)
+        except RuntimeError as e:
+            assert "failed" in str(e), e
+        else:
+            raise AssertionError("expected the hedged call to fail")
+        print("OK: the hedged call fails only when both calls fail")
+        return 0
+    finally:
+        ai_service.GeminiService._get_provider, ai_service._hedge_delay = original_provider, original_delay
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
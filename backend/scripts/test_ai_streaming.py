@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import json
+import os
+import uuid
+
+# Keep the response cache in memory; this check needs no MongoDB
+os.environ.setdefault("AI_CACHE_BACKENDS", "memory")
+
+from app.services import ai_service
+
+
+ANSWER = 'Line 1\n"quoted" \\ back\\slash\ttab café \U0001F600 end/'
+RAW = json.dumps({"studentType": "vision", "answer": ANSWER, "steps": "", "tips": "t"})
+
+
+def decode(chunks) -> str:
+    streamer = ai_service._JsonFieldStreamer("answer")
+    return "".join(streamer.feed(chunk) for chunk in chunks)
+
+
+def pieces(text: str, size: int):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def check_streamer() -> None:
+    assert "\\u00e9" in RAW and "\\ud83d\\ude00" in RAW and '\\"' in RAW
+    for size in range(1, 14):
+        assert decode(pieces(RAW, size)) == ANSWER, f"wrong text with {size}-character chunks"
+    print("OK: escapes and surrogate pairs split across chunks decode like json.loads")
+
+    streamer = ai_service._JsonFieldStreamer("answer")
+    assert streamer.feed('{"answer": "ab\\') == "ab"
+    assert streamer.feed("n") == "\n"
+    assert streamer.feed('c", "tips": "x", "answer": "again"}') == "c"
+    assert streamer.feed(' trailing "answer": "more"') == ""
+    print("OK: only the first value of the field is streamed, up to its closing quote")
+
+    assert decode(["Plain text answer ", "without any JSON."]) == ""
+    assert decode(['{"content": "not this field"}']) == ""
+    assert decode(['{"answer": "bad \\uZZZZ escape, lone \\ud83d high", "tips": ""}']) == "bad  escape, lone  high"
+    assert decode(['{"answer": "cut off mid-str']) == "cut off mid-str"
+    print("OK: missing fields, invalid escapes and cut-off strings do not break the streamer")
+
+
+class StreamProvider:
+    """Streams the given chunks; raises after them when `error` is set."""
+
+    def __init__(self, chunks, error=None):
+        self.chunks = chunks
+        self.error = error
+
+    def generate_stream(self, prompt, usage=None):
+        yield from self.chunks
+        if self.error:
+            raise self.error
+
+
+def stream_events(service, provider):
+    ai_service.GeminiService._get_provider = lambda self, key: provider
+    # A fresh question each time, so the answer never comes from the response cache
+    question = f"Where does magma come from? ({uuid.uuid4().hex[:8]})"
+    return list(service.stream_adaptive_qna("Magma forms deep under volcanoes.", "vision", question))
+
+
+def streamed_text(events) -> str:
+    return "".join(e["data"]["text"] for e in events if e["event"] == "delta")
+
+
+def check_service_streams() -> None:
+    originals = (ai_service.GeminiService._get_provider, ai_service._load_api_keys)
+    ai_service._load_api_keys = lambda: ["test-key"]
+    try:
+        service = ai_service.GeminiService()
+
+        events = stream_events(service, StreamProvider(pieces(RAW, 7)))
+        assert events[-1]["event"] == "result" and events[-1]["data"]["answer"] == ANSWER
+        assert streamed_text(events) == ANSWER
+        assert len(events) > 3, "expected the answer in several deltas"
+        print("OK: a well-formed stream is forwarded as deltas matching the result")
+
+        events = stream_events(service, StreamProvider(['```json\n{"answer": "Magma ri', 'ses from the man']))
+        result = events[-1]
+        assert result["event"] == "result", events
+        assert result["data"]["answer"] == "Magma rises from the man", result["data"]["answer"]
+        assert streamed_text(events) == result["data"]["answer"]
+        print("OK: cut-off JSON keeps the streamed text as the answer")
+
+        plain = "Magma is molten rock. It rises through cracks."
+        events = stream_events(service, StreamProvider(pieces(plain, 10)))
+        assert [e["event"] for e in events] == ["delta", "result"], events
+        assert streamed_text(events) == plain == events[-1]["data"]["answer"]
+        print("OK: an answer without JSON arrives as one delta once the stream ends")
+
+        events = stream_events(service, StreamProvider(['{"answer": "Magma '], error=ValueError("stream broke")))
+        assert [e["event"] for e in events] == ["delta", "error"], events
+        assert events[-1]["data"] == {"error": "stream broke", "error_code": "INTERNAL_ERROR"}
+        print("OK: a stream failing after its first chunk ends with an error event")
+    finally:
+        ai_service.GeminiService._get_provider, ai_service._load_api_keys = originals
+
+
+def main() -> int:
+    check_streamer()
+    check_service_streams()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import copy
+from datetime import datetime, timedelta
+
+from flask import Flask, jsonify, request
+from pymongo.errors import DuplicateKeyError
+
+
+class KeyCollection:
+    """The idempotency_keys operations the key store uses, with TTL expiry run on demand."""
+
+    def __init__(self):
+        self.docs = {}
+
+    def create_index(self, *args, **kwargs):
+        return None
+
+    def insert_one(self, doc):
+        if doc["_id"] in self.docs:
+            raise DuplicateKeyError("duplicate key")
+        self.docs[doc["_id"]] = copy.deepcopy(doc)
+
+    def find_one(self, query):
+        doc = self.docs.get(query["_id"])
+        return copy.deepcopy(doc) if doc else None
+
+    def find_one_and_update(self, query, update):
+        doc = self.docs.get(query["_id"])
+        if doc is None or doc.get("status") != query["status"] or not doc["lockedUntil"] < query["lockedUntil"]["$lt"]:
+            return None
+        before = copy.deepcopy(doc)
+        doc.update(update["$set"])
+        return before
+
+    def update_one(self, query, update):
+        if query["_id"] in self.docs:
+            self.docs[query["_id"]].update(copy.deepcopy(update["$set"]))
+
+    def delete_one(self, query):
+        doc = self.docs.get(query["_id"])
+        if doc and doc.get("status") == query["status"]:
+            del self.docs[query["_id"]]
+
+    def expire(self, now: datetime) -> None:
+        """What MongoDB's TTL monitor does for the expiresAt index."""
+        for scope in [s for s, doc in self.docs.items() if doc["expiresAt"] <= now]:
+            del self.docs[scope]
+
+
+def main() -> int:
+    from app.services import idempotency_service
+    from app.utils import idempotency
+
+    calls = []
+    app = Flask(__name__)
+
+    @app.post("/work")
+    @idempotency.idempotent
+    def work():
+        calls.append(request.form.get("n"))
+        if request.form.get("fail"):
+            return jsonify({"error": "boom"}), 500
+        return jsonify({"call": len(calls), "n": request.form.get("n")}), 201
+
+    keys = KeyCollection()
+    originals = (idempotency_service._keys, idempotency.IDEMPOTENCY_WAIT_SECONDS)
+    idempotency_service._keys = lambda: keys
+    idempotency.IDEMPOTENCY_WAIT_SECONDS = 0.1
+
+    client = app.test_client()
+
+    def post(key, **form):
+        return client.post("/work", data=form, headers={idempotency.IDEMPOTENCY_HEADER: key})
+
+    try:
+        first = post("k1", n="1")
+        again = post("k1", n="1")
+        assert first.status_code == 201 and again.status_code == 201
+        assert again.json == first.json, (first.json, again.json)
+        assert again.headers.get("Idempotent-Replayed") == "true"
+        assert "Idempotent-Replayed" not in first.headers
+        assert len(calls) == 1, f"a duplicate key must not run the view again, ran {len(calls)} times"
+        print("OK: a duplicate Idempotency-Key replays the stored response")
+
+        resp = post("k1", n="2")
+        assert resp.status_code == 422, f"expected 422 for a reused key, got {resp.status_code}"
+        assert len(calls) == 1
+        print("OK: a key reused for a different payload is rejected with 422")
+
+        # Once the TTL index has removed the record the key is new again
+        scope = next(iter(keys.docs))
+        keys.docs[scope]["expiresAt"] = datetime.utcnow() - timedelta(seconds=1)
+        keys.expire(datetime.utcnow())
+        resp = post("k1", n="1")
+        assert resp.status_code == 201 and resp.json["call"] == 2, resp.json
+        assert "Idempotent-Replayed" not in resp.headers
+        assert keys.docs[scope]["status"] == "completed"
+        assert keys.docs[scope]["expiresAt"] > datetime.utcnow(), "the new record must get a fresh expiry"
+        print("OK: an expired key runs the request again and is stored anew")
+
+        # A completed record past its expiry but not yet removed is still replayed
+        keys.docs[scope]["expiresAt"] = datetime.utcnow() - timedelta(seconds=1)
+        resp = post("k1", n="1")
+        assert resp.headers.get("Idempotent-Replayed") == "true" and len(calls) == 2
+        print("OK: a record awaiting TTL removal is still replayed")
+
+        # In flight: a retry waits for the original, then answers 409
+        with app.test_request_context("/work", method="POST", data={"n": "3"},
+                                      environ_base={"REMOTE_ADDR": "127.0.0.1"}):
+            busy_scope = idempotency._scope("k2")
+            fingerprint = idempotency._request_fingerprint()
+        now = datetime.utcnow()
+        keys.insert_one({
+            "_id": busy_scope,
+            "fingerprint": fingerprint,
+            "status": "in_progress",
+            "lockedUntil": now + timedelta(minutes=5),
+            "createdAt": now,
+            "expiresAt": now + timedelta(hours=1),
+        })
+        resp = post("k2", n="3")
+        assert resp.status_code == 409 and resp.headers.get("Retry-After"), resp.status_code
+        assert calls.count("3") == 0
+        print("OK: a duplicate of an in-flight request answers 409 with Retry-After")
+
+        # A lock left by a crashed worker is taken over
+        keys.docs[busy_scope]["lockedUntil"] = now - timedelta(seconds=1)
+        resp = post("k2", n="3")
+        assert resp.status_code == 201 and calls.count("3") == 1
+        assert keys.docs[busy_scope]["status"] == "completed"
+        print("OK: a stale in-progress key is taken over")
+
+        # Server errors release the key so a retry runs again
+        assert post("k3", n="4", fail="1").status_code == 500
+        assert post("k3", n="4", fail="1").status_code == 500
+        assert calls.count("4") == 2
+        print("OK: a 500 response releases its key")
+        return 0
+    finally:
+        idempotency_service._keys, idempotency.IDEMPOTENCY_WAIT_SECONDS = originals
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+from app.services.ai_keys import KeyScheduler
+
+
+def bench(scheduler: KeyScheduler, key: str) -> None:
+    """Fail one call on `key` with a rate-limit error so it cools down."""
+    try:
+        with scheduler.track(key):
+            raise RuntimeError("429 RESOURCE_EXHAUSTED")
+    except RuntimeError:
+        pass
+
+
+def main() -> int:
+    # Benched keys are left out while a healthy key exists
+    scheduler = KeyScheduler(rpm=0, tpm=0)
+    bench(scheduler, "key-a")
+    assert scheduler.order(["key-a", "key-b"]) == ["key-b"], scheduler.order(["key-a", "key-b"])
+    bench(scheduler, "key-b")
+    assert sorted(scheduler.order(["key-a", "key-b"])) == ["key-a", "key-b"]
+    assert scheduler.order(["key-a", "key-b"], include_benched=False) == []
+    print("OK: benched keys are only tried when every key is benched")
+
+    # A healthy key out of quota makes the request wait rather than use a benched key
+    scheduler = KeyScheduler(rpm=1, tpm=0)
+    assert scheduler.acquire(["key-b"], 10) == ("key-b", 0.0)
+    bench(scheduler, "key-a")
+    key, delay = scheduler.acquire(["key-b", "key-a"], 10)
+    assert key is None and delay > 0, (key, delay)
+    print("OK: acquire skips benched keys while a healthy candidate exists")
+
+    # A bucket holds a full minute of quota, so a burst of RPM requests goes through
+    scheduler = KeyScheduler(rpm=15, tpm=0)
+    granted = [scheduler.acquire(["key-a"], 10)[0] for _ in range(15)]
+    assert granted == ["key-a"] * 15, granted
+    key, delay = scheduler.acquire(["key-a"], 10)
+    assert key is None and 0 < delay <= 4.1, (key, delay)
+    print("OK: a burst can use the whole per-minute quota, then waits for the refill")
+
+    # With no limits configured (the default) acquire never waits
+    scheduler = KeyScheduler(rpm=0, tpm=0)
+    assert all(scheduler.acquire(["key-a"], 100000) == ("key-a", 0.0) for _ in range(100))
+    print("OK: unlimited keys never queue")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
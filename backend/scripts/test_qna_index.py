@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import os
+import uuid
+
+# Keep the response cache in memory; this check needs no MongoDB
+os.environ.setdefault("AI_CACHE_BACKENDS", "memory")
+
+from app import create_app
+from flask_jwt_extended import create_access_token
+
+from app.services import ai_service, notes_service, qna_index
+
+
+TOPICS = ["volcano magma eruption", "glacier ice erosion", "desert dune wind", "river delta sediment"]
+
+
+def long_notes() -> str:
+    """Extracted-looking notes: page breaks, a form feed and the trailing newline PDFs end with."""
+    pages = []
+    for page, words in enumerate(TOPICS * 3, 1):
+        body = " ".join(f"The {words} sentence number {i} explains more about {words}." for i in range(12))
+        pages.append(f"[Page {page}]\n{body}\n\n")
+    return "".join(pages).replace("[Page 5]", "\x0c[Page 5]") + "\n"
+
+
+class NotesCollection:
+    """Single-note stand-in for the notes collection."""
+
+    def __init__(self, doc):
+        self.doc = doc
+
+    def create_index(self, *args, **kwargs):
+        return None
+
+    def find_one(self, query, projection=None, *args, **kwargs):
+        doc = dict(self.doc)
+        for field, keep in (projection or {}).items():
+            if not keep:
+                doc.pop(field, None)
+        return doc
+
+
+class RecordingProvider:
+    def __init__(self):
+        self.prompts = []
+
+    def generate_with_usage(self, prompt):
+        self.prompts.append(prompt)
+        return '{"answer": "Magma rises.", "steps": "", "tips": ""}', {}
+
+
+def check_selection() -> None:
+    text = qna_index.clean_text(long_notes())
+    index = qna_index.build_index(text)
+    assert qna_index.is_usable(index, text)
+    context = qna_index.select_context(text, "Where does magma come from in a volcano?", index)
+    assert context and "volcano" in context and "glacier" not in context, context
+    print("OK: BM25 picks the passages about the question")
+
+    # Short notes are sent whole; a question matching nothing falls back to the whole text
+    assert qna_index.select_context("Short notes about volcanoes.", "volcano?", None) is None
+    assert qna_index.select_context(text, "photosynthesis chlorophyll", index) is None
+    assert qna_index.top_passages(index, text, "the and of") == []
+    print("OK: short notes and unmatched questions fall back to the whole text")
+
+    # Empty, stale and foreign indexes are not used
+    empty = qna_index.build_index("")
+    assert empty["spans"] == [] and qna_index.top_passages(empty, "", "volcano") == []
+    assert not qna_index.is_usable(None, text) and not qna_index.is_usable({}, text)
+    assert not qna_index.is_usable(dict(index, version=qna_index.INDEX_VERSION - 1), text)
+    assert not qna_index.is_usable(index, text + " more")
+    assert "volcano" in qna_index.select_context(text, "volcano magma", empty)
+    print("OK: empty, outdated and mismatched indexes are rebuilt")
+
+
+def check_stored_index_reused() -> None:
+    app = create_app()
+    app.config["TESTING"] = True
+    if not app.config.get("JWT_SECRET_KEY"):
+        app.config["JWT_SECRET_KEY"] = "test-secret"
+    with app.app_context():
+        token = create_access_token(identity="s@example.com", additional_claims={"role": "student", "school": "ABC"})
+
+    doc = notes_service.build_note_doc(
+        school="ABC", class_name="10", subject="Geography", topic="Landforms", text=long_notes(),
+        uploaded_by="t@example.com", source_type="pdf",
+    )
+    assert doc["text"].endswith("\n") and "qnaIndex" in doc
+    doc["_id"] = "note1"
+
+    provider = RecordingProvider()
+    builds = []
+    original_build = qna_index.build_index
+
+    def counting_build(text):
+        builds.append(len(text))
+        return original_build(text)
+
+    originals = (notes_service._notes, ai_service.GeminiService._get_provider, ai_service._load_api_keys, qna_index.build_index)
+    notes_service._notes = lambda: NotesCollection(doc)
+    ai_service.GeminiService._get_provider = lambda self, key: provider
+    ai_service._load_api_keys = lambda: ["test-key"]
+    qna_index.build_index = counting_build
+    try:
+        # A fresh question each run, so the answer never comes from the response cache
+        question = f"Where does volcano magma come from? ({uuid.uuid4().hex[:8]})"
+        resp = app.test_client().post(
+            "/api/students/qna",
+            json={"class": "10", "subject": "Geography", "topic": "Landforms", "studentType": "vision", "question": question},
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        assert resp.status_code == 200, (resp.status_code, resp.get_json())
+        assert len(provider.prompts) == 1, "expected one model call"
+        assert builds == [], f"stored index was rebuilt for texts of length {builds}"
+        assert "volcano" in provider.prompts[0] and "glacier" not in provider.prompts[0]
+        print("OK: /api/students/qna answers from the stored index without rebuilding it")
+    finally:
+        notes_service._notes, ai_service.GeminiService._get_provider, ai_service._load_api_keys, qna_index.build_index = originals
+
+
+def main() -> int:
+    check_selection()
+    check_stored_index_reused()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import copy
+import io
+import time
+
+from app import create_app
+from flask_jwt_extended import create_access_token
+from pymongo.errors import PyMongoError
+
+
+class MemoryCollection:
+    """The few collection methods the upload job and notes services use."""
+
+    def __init__(self, fail_insert_for_topic=None):
+        self.docs = {}
+        self.fail_insert_for_topic = fail_insert_for_topic
+
+    def create_index(self, *args, **kwargs):
+        return None
+
+    def insert_one(self, doc):
+        if doc.get("topic") and doc.get("topic") == self.fail_insert_for_topic:
+            raise PyMongoError("forced insert failure for test")
+        doc.setdefault("_id", f"note{len(self.docs) + 1}")
+        self.docs[doc["_id"]] = copy.deepcopy(doc)
+
+        class Result:
+            inserted_id = doc["_id"]
+        return Result()
+
+    def find_one(self, query, *args, **kwargs):
+        doc = self.docs.get(query.get("_id"))
+        return copy.deepcopy(doc) if doc else None
+
+    def find(self, *args, **kwargs):
+        return []
+
+    def update_one(self, query, update):
+        doc = self.docs.get(query["_id"])
+        for key, value in update.get("$set", {}).items():
+            target = doc
+            parts = key.split(".")
+            for part in parts[:-1]:
+                target = target[int(part)] if isinstance(target, list) else target[part]
+            if isinstance(target, list):
+                target[int(parts[-1])] = copy.deepcopy(value)
+            else:
+                target[parts[-1]] = copy.deepcopy(value)
+
+
+def main() -> int:
+    app = create_app()
+    app.config["TESTING"] = True
+    if not app.config.get("JWT_SECRET_KEY"):
+        app.config["JWT_SECRET_KEY"] = "test-secret"
+
+    with app.app_context():
+        token = create_access_token(identity="t@example.com", additional_claims={"role": "teacher", "school": "ABC"})
+
+    from app.services import notes_service
+    from app.services import upload_jobs_service
+    from app.services import upload_pipeline as upload_pipeline_module
+
+    # Extraction outcome depends on the file name: text, nothing, or an extractor error
+    class DummyExtractor:
+        def extract_bytes(self, data, filename):
+            if filename.endswith(".xyz"):
+                return {filename: "Error: Unsupported format: .xyz"}
+            return {filename: data.decode("utf-8")}
+
+    notes = MemoryCollection(fail_insert_for_topic="dbfail")
+    jobs = MemoryCollection()
+    originals = (
+        upload_pipeline_module.get_extractor,
+        upload_pipeline_module.build_variants,
+        notes_service._notes,
+        upload_jobs_service._jobs,
+    )
+    upload_pipeline_module.get_extractor = lambda: DummyExtractor()
+    # Skip the AI/TTS/Catbox post-processing, which needs network access
+    upload_pipeline_module.build_variants = lambda text, **kwargs: ({}, [])
+    notes_service._notes = lambda: notes
+    upload_jobs_service._jobs = lambda: jobs
+
+    try:
+        client = app.test_client()
+        headers = {"Authorization": f"Bearer {token}"}
+        data = {
+            "school": "ABC",
+            "class": "10",
+            "subject": "Science",
+            "files": [
+                (io.BytesIO(b"Cells are the basic unit of life."), "cells.pdf"),
+                (io.BytesIO(b""), "empty.pdf"),
+                (io.BytesIO(b"ignored"), "slides.xyz"),
+                (io.BytesIO(b"Photosynthesis makes sugar."), "plants.pdf"),
+                (io.BytesIO(b"This note cannot be saved."), "dbfail.pdf"),
+            ],
+        }
+        resp = client.post("/api/teacher/upload/bulk", data=data, headers=headers, content_type="multipart/form-data")
+        print("Status:", resp.status_code, resp.json)
+        assert resp.status_code == 202, f"expected 202, got {resp.status_code}"
+        status_url = resp.json["statusUrl"]
+
+        deadline = time.time() + 30
+        while True:
+            job = client.get(status_url, headers=headers).json
+            if job["status"] in ("succeeded", "failed") or time.time() > deadline:
+                break
+            time.sleep(0.1)
+        print("Job:", job)
+
+        assert job["status"] == "succeeded", f"expected succeeded, got {job['status']}"
+        assert job["progress"] == {"total": 5, "created": 2, "failed": 3}, job["progress"]
+        by_name = {item["filename"]: item for item in job["items"]}
+        assert by_name["cells.pdf"]["status"] == "created" and by_name["cells.pdf"]["noteId"]
+        assert by_name["plants.pdf"]["status"] == "created"
+        assert by_name["empty.pdf"]["error"] == "No text could be extracted"
+        assert by_name["slides.xyz"]["error"] == "Unsupported format: .xyz"
+        assert by_name["dbfail.pdf"]["error"].startswith("Database error")
+        # Notes are saved one by one, so the failures did not lose the others
+        assert sorted(doc["topic"] for doc in notes.docs.values()) == ["cells", "plants"]
+        print("OK: bulk upload job saves each note and reports per-file failures")
+        return 0
+    finally:
+        (
+            upload_pipeline_module.get_extractor,
+            upload_pipeline_module.build_variants,
+            notes_service._notes,
+            upload_jobs_service._jobs,
+        ) = originals
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
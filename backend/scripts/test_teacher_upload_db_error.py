@@ -5,6 +5,7 @@ from types import SimpleNamespace
 
 from app import create_app
 from flask_jwt_extended import create_access_token
+from pymongo.errors import PyMongoError
 
 
 def main() -> int:
@@ -15,24 +16,38 @@ def main() -> int:
         app.config["JWT_SECRET_KEY"] = "test-secret"
 
     with app.app_context():
-        token = create_access_token(identity={"role": "teacher", "email": "t@example.com", "school": "ABC"})
+        token = create_access_token(identity="t@example.com", additional_claims={"role": "teacher", "school": "ABC"})
 
     # Lazy imports after app is ready
     from app.services import notes_service
-    from app.routes import teacher_upload as teacher_upload_module
+    from app.services import upload_pipeline as upload_pipeline_module
 
-    # Mock extractor to avoid heavy parsing; return deterministic text
+    # Mock extractor to avoid heavy parsing; return deterministic text.
+    # Uploaded documents are parsed from memory (extract_bytes), staged ones from disk.
     class DummyExtractor:
         def extract(self, path):
             return {"dummy": "hello from extractor"}
 
-    original_get_extractor = teacher_upload_module.get_extractor
-    teacher_upload_module.get_extractor = lambda: DummyExtractor()
+        def extract_bytes(self, data, filename):
+            return {filename: "hello from extractor"}
+
+    original_get_extractor = upload_pipeline_module.get_extractor
+    upload_pipeline_module.get_extractor = lambda: DummyExtractor()
+
+    # Skip the AI/TTS/Catbox post-processing, which needs network access
+    original_build_variants = upload_pipeline_module.build_variants
+    upload_pipeline_module.build_variants = lambda text, **kwargs: ({}, [])
 
     # Mock notes collection to force DB error on insert
     class FailingCollection:
+        def create_index(self, *args, **kwargs):
+            return None
+
+        def find_one(self, *args, **kwargs):
+            return None
+
         def insert_one(self, doc):
-            raise RuntimeError("forced insert failure for test")
+            raise PyMongoError("forced insert failure for test")
 
     original_notes_func = notes_service._notes
     notes_service._notes = lambda: FailingCollection()
@@ -61,7 +76,8 @@ def main() -> int:
         return 0
     finally:
         # Restore originals
-        teacher_upload_module.get_extractor = original_get_extractor
+        upload_pipeline_module.get_extractor = original_get_extractor
+        upload_pipeline_module.build_variants = original_build_variants
         notes_service._notes = original_notes_func
 
 
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import io
+
+from app import create_app
+from flask_jwt_extended import create_access_token
+
+
+class RecordingCollection:
+    """Notes/jobs collection that keeps inserted documents in a list."""
+
+    def __init__(self):
+        self.inserted = []
+
+    def create_index(self, *args, **kwargs):
+        return None
+
+    def find_one(self, *args, **kwargs):
+        return None
+
+    def insert_one(self, doc):
+        self.inserted.append(doc)
+
+        class Result:
+            inserted_id = f"doc{len(self.inserted)}"
+        return Result()
+
+
+def main() -> int:
+    app = create_app()
+    app.config["TESTING"] = True
+    if not app.config.get("JWT_SECRET_KEY"):
+        app.config["JWT_SECRET_KEY"] = "test-secret"
+
+    with app.app_context():
+        token = create_access_token(identity="t@example.com", additional_claims={"role": "teacher", "school": "ABC"})
+
+    from app.services import notes_service
+    from app.services import upload_jobs_service
+    from app.services import upload_pipeline as upload_pipeline_module
+
+    limit = 50
+
+    class DummyExtractor:
+        def extract_bytes(self, data, filename):
+            return {filename: data.decode("utf-8")}
+
+    built = []
+    notes = RecordingCollection()
+    jobs = RecordingCollection()
+    originals = (
+        upload_pipeline_module.MAX_DOCUMENT_LENGTH,
+        upload_pipeline_module.get_extractor,
+        upload_pipeline_module.build_variants,
+        notes_service._notes,
+        upload_jobs_service._jobs,
+    )
+    upload_pipeline_module.MAX_DOCUMENT_LENGTH = limit
+    upload_pipeline_module.get_extractor = lambda: DummyExtractor()
+    upload_pipeline_module.build_variants = lambda text, **kwargs: (built.append(text), ({}, []))[1]
+    notes_service._notes = lambda: notes
+    upload_jobs_service._jobs = lambda: jobs
+
+    def post(query: str = "", **fields):
+        data = {"school": "ABC", "class": "10", "subject": "Math", "topic": "Algebra", **fields}
+        return app.test_client().post(
+            f"/api/teacher/upload{query}",
+            data=data,
+            headers={"Authorization": f"Bearer {token}"},
+            content_type="multipart/form-data",
+        )
+
+    try:
+        too_long = "x" * (limit + 1)
+
+        resp = post(text=too_long)
+        assert resp.status_code == 413, f"expected 413, got {resp.status_code}: {resp.json}"
+        assert str(limit) in resp.json["error"], resp.json
+        resp = post("?async=1", text=too_long)
+        assert resp.status_code == 413, f"expected 413 for async text, got {resp.status_code}"
+        assert not jobs.inserted, "an over-long text must not be queued as a job"
+        print("OK: over-long direct text is rejected with 413 before anything is queued")
+
+        resp = post(file=(io.BytesIO(too_long.encode("utf-8")), "long.txt"))
+        assert resp.status_code == 413, f"expected 413 for a long document, got {resp.status_code}"
+        assert not built and not notes.inserted, "no variants or note may be produced for an over-long document"
+        print("OK: a document whose text is over the limit is rejected with 413 before post-processing")
+
+        resp = post(text="  " + "x" * limit + "\n")
+        assert resp.status_code == 201, f"expected 201 at the limit, got {resp.status_code}: {resp.json}"
+        assert len(built) == 1 and len(notes.inserted) == 1
+        print("OK: text of exactly MAX_DOCUMENT_LENGTH characters is accepted")
+        return 0
+    finally:
+        (
+            upload_pipeline_module.MAX_DOCUMENT_LENGTH,
+            upload_pipeline_module.get_extractor,
+            upload_pipeline_module.build_variants,
+            notes_service._notes,
+            upload_jobs_service._jobs,
+        ) = originals
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import io
+import tempfile
+from pathlib import Path
+
+import docx
+
+from document_extractor import SimpleDocumentExtractor
+from app.services import tts_service
+
+
+PARAGRAPHS = [
+    "Cells are the basic unit of life. Every living thing is made of one or more cells, "
+    "and each cell carries out the processes that keep the organism alive and growing.",
+    "The cell membrane controls what enters and leaves the cell. It is a thin layer of "
+    "lipids and proteins that lets nutrients in and keeps harmful substances out.",
+    "The nucleus holds the genetic material of the cell. It directs growth, repair and "
+    "reproduction by deciding which proteins the cell makes and when it makes them.",
+    "Mitochondria release energy from food through respiration. Cells that work hard, "
+    "such as muscle cells, contain many more mitochondria than other cells do.",
+]
+
+
+def docx_text(paragraphs) -> str:
+    """Text of a DOCX built from `paragraphs`, as the upload pipeline extracts it."""
+    document = docx.Document()
+    document.add_heading("Cell Biology", level=1)
+    for paragraph in paragraphs:
+        document.add_paragraph(paragraph)
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return SimpleDocumentExtractor().extract_bytes(buffer.getvalue(), "cells.docx")["cells.docx"]
+
+
+def main() -> int:
+    spoken = []
+
+    def fake_synthesize(text, out_path, **kwargs):
+        spoken.append(text)
+        Path(out_path).write_bytes(b"ID3" + text.encode("utf-8"))
+        return True, "OK"
+
+    def fake_concat(paths, out_path):
+        Path(out_path).write_bytes(b"".join(Path(p).read_bytes() for p in paths))
+
+    originals = (tts_service.synthesize_text_to_mp3, tts_service.concat_mp3_files, tts_service.TTS_SEGMENT_DIR)
+    tts_service.synthesize_text_to_mp3 = fake_synthesize
+    tts_service.concat_mp3_files = fake_concat
+    with tempfile.TemporaryDirectory() as tmp:
+        tts_service.TTS_SEGMENT_DIR = str(Path(tmp) / "segments")
+        try:
+            original = docx_text(PARAGRAPHS)
+            assert "\n\n" not in original.strip(), "DOCX paragraphs are expected on single lines"
+            segments = tts_service.split_paragraphs(original)
+            assert len(segments) == len(PARAGRAPHS), segments
+            print("OK: DOCX text is split into one segment per paragraph")
+
+            ok, msg, info = tts_service.synthesize_paragraphs_to_mp3(original, Path(tmp) / "v1.mp3")
+            assert ok, msg
+            assert info["synthesized"] == len(PARAGRAPHS) and info["reused"] == 0, info
+
+            edited = list(PARAGRAPHS)
+            edited[2] = edited[2].replace("genetic material", "DNA")
+            spoken.clear()
+            ok, msg, info2 = tts_service.synthesize_paragraphs_to_mp3(docx_text(edited), Path(tmp) / "v2.mp3")
+            assert ok, msg
+            assert info2["synthesized"] == 1 and info2["reused"] == len(PARAGRAPHS) - 1, info2
+            assert len(spoken) == 1 and "DNA" in spoken[0], spoken
+            changed = [i for i, (a, b) in enumerate(zip(info["segments"], info2["segments"])) if a != b]
+            assert changed == [2], changed
+            print("OK: editing one DOCX paragraph re-synthesizes only that segment")
+
+            # Slide markers end segments and are not spoken
+            slides = "[Slide 1]\nPhotosynthesis\n[Slide 2]\nLight energy becomes sugar."
+            assert tts_service.split_paragraphs(slides) == ["Photosynthesis", "Light energy becomes sugar."]
+            # Over-long lines are cut into bounded segments
+            long_line = "This sentence is long enough to count. " * 200
+            assert all(len(s) <= tts_service.TTS_SEGMENT_MAX_CHARS for s in tts_service.split_paragraphs(long_line))
+            print("OK: slide markers split segments and long lines stay within TTS_SEGMENT_MAX_CHARS")
+            return 0
+        finally:
+            tts_service.synthesize_text_to_mp3, tts_service.concat_mp3_files, tts_service.TTS_SEGMENT_DIR = originals
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import copy
+import json
+import os
+from tempfile import TemporaryDirectory
+
+os.environ.setdefault("AI_CACHE_BACKENDS", "memory")
+
+from app import create_app
+from flask_jwt_extended import create_access_token
+
+
+class SessionCollection:
+    """The upload_sessions operations the session service uses."""
+
+    def __init__(self):
+        self.docs = {}
+
+    def create_index(self, *args, **kwargs):
+        return None
+
+    def insert_one(self, doc):
+        self.docs[doc["_id"]] = copy.deepcopy(doc)
+
+    def find_one(self, query):
+        doc = self.docs.get(query["_id"])
+        return copy.deepcopy(doc) if doc else None
+
+    def find_one_and_update(self, query, update, return_document=None):
+        doc = self.docs.get(query["_id"])
+        if doc is None or any(doc.get(field) != value for field, value in query.items()):
+            return None
+        doc.update(update["$set"])
+        return copy.deepcopy(doc)
+
+
+def main() -> int:
+    app = create_app()
+    app.config["TESTING"] = True
+    if not app.config.get("JWT_SECRET_KEY"):
+        app.config["JWT_SECRET_KEY"] = "test-secret"
+
+    with app.app_context():
+        token = create_access_token(identity="t@example.com", additional_claims={"role": "teacher", "school": "ABC"})
+        other = create_access_token(identity="u@example.com", additional_claims={"role": "teacher", "school": "ABC"})
+
+    from app.routes import upload_sessions as routes
+    from app.services import upload_session_service
+
+    processed = []
+
+    def fake_process_upload(**params):
+        processed.append((params, params["path"].read_bytes()))
+        return {"_id": "note1", "topic": params["topic"], "meta": {}}
+
+    sessions = SessionCollection()
+    originals = (
+        upload_session_service._sessions,
+        upload_session_service.UPLOAD_STAGING_DIR,
+        routes.process_upload,
+    )
+    staging = TemporaryDirectory()
+    upload_session_service._sessions = lambda: sessions
+    upload_session_service.UPLOAD_STAGING_DIR = staging.name
+    routes.process_upload = fake_process_upload
+
+    client = app.test_client()
+    auth = {"Authorization": f"Bearer {token}"}
+
+    def put(session_id, offset, data, headers=None):
+        return client.put(
+            f"/api/teacher/upload/sessions/{session_id}",
+            data=data,
+            headers={**auth, "Upload-Offset": str(offset), **(headers or {})},
+        )
+
+    def complete(session_id):
+        return client.post(f"/api/teacher/upload/sessions/{session_id}/complete", headers=auth)
+
+    try:
+        resp = client.post(
+            "/api/teacher/upload/sessions",
+            data=json.dumps({
+                "filename": "notes.txt", "size": 10, "kind": "file",
+                "class": "10", "subject": "Math", "topic": "Algebra",
+            }),
+            headers=auth,
+            content_type="application/json",
+        )
+        assert resp.status_code == 201, resp.json
+        session_id = resp.json["sessionId"]
+        path = upload_session_service.staged_path(sessions.docs[session_id])
+
+        # Second chunk before the first: nothing is written and the client is told where to resume
+        resp = put(session_id, 5, b"56789")
+        assert resp.status_code == 409 and resp.json["receivedBytes"] == 0, resp.json
+        assert path.read_bytes() == b""
+        resp = complete(session_id)
+        assert resp.status_code == 409 and resp.json["receivedBytes"] == 0 and resp.json["totalSize"] == 10
+        print("OK: an out-of-order chunk is rejected with the resume offset")
+
+        assert put(session_id, 0, b"01234").json["receivedBytes"] == 5
+        # A retried chunk that was already stored is refused without touching the file
+        resp = put(session_id, 0, b"xxxxx")
+        assert resp.status_code == 409 and resp.json["receivedBytes"] == 5, resp.json
+        assert path.read_bytes() == b"01234"
+        resp = put(session_id, 5, b"56789ab")
+        assert resp.status_code == 400 and "declared upload size" in resp.json["error"], resp.json
+        assert client.put(f"/api/teacher/upload/sessions/{session_id}", data=b"5", headers=auth).status_code == 400
+        assert put(session_id, 5, b"").status_code == 400
+        print("OK: duplicate, oversized, empty and offset-less chunks are rejected")
+
+        # The missing tail keeps the session open and incomplete
+        resp = complete(session_id)
+        assert resp.status_code == 409 and resp.json["receivedBytes"] == 5, resp.json
+        assert not processed and sessions.docs[session_id]["status"] == "open"
+        resp = client.get(f"/api/teacher/upload/sessions/{session_id}", headers=auth)
+        assert resp.json["receivedBytes"] == 5 and resp.json["status"] == "open"
+        print("OK: completing with missing chunks answers 409 and the session stays resumable")
+
+        other_auth = {"Authorization": f"Bearer {other}"}
+        assert client.get(f"/api/teacher/upload/sessions/{session_id}", headers=other_auth).status_code == 404
+        resp = client.put(
+            f"/api/teacher/upload/sessions/{session_id}",
+            data=b"56789",
+            headers={**other_auth, "Upload-Offset": "5"},
+        )
+        assert resp.status_code == 404 and sessions.docs[session_id]["receivedBytes"] == 5
+
+        assert put(session_id, 5, b"56789").json["receivedBytes"] == 10
+        resp = complete(session_id)
+        assert resp.status_code == 201, resp.json
+        params, content = processed[0]
+        assert content == b"0123456789", content
+        assert params["topic"] == "Algebra" and params["source_type"] == "document"
+        assert not path.exists(), "staged bytes must be removed once processed"
+        print("OK: chunks are assembled in order and the session completes once")
+
+        assert complete(session_id).status_code == 409
+        assert put(session_id, 10, b"z").status_code == 400
+        assert len(processed) == 1
+        print("OK: a completed session accepts no more chunks and cannot complete twice")
+        return 0
+    finally:
+        (
+            upload_session_service._sessions,
+            upload_session_service.UPLOAD_STAGING_DIR,
+            routes.process_upload,
+        ) = originals
+        staging.cleanup()
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())